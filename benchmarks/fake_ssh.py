@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+"""Local stand-in for the ssh binary used by ssh_ipykernel
+
+Runs the remote command locally with "sh -c" and emulates "-L" forwards (TCP port to TCP port
+or unix socket) with asyncio. Connection multiplexing ("-O ...", "ControlMaster=yes") is reported
+as unavailable, so ssh_ipykernel falls back to direct connections. With "-t" the command runs
+under a pseudo terminal as its controlling terminal and the local terminal is switched to raw
+mode, so ^C (pexpect's sendintr) reaches the command as SIGINT through the pty like with ssh.
+
+Environment:
+    FAKE_SSH_LATENCY -- seconds to sleep before "connecting", emulates the SSH handshake
+"""
+import asyncio
+import fcntl
+import os
+import pty
+import signal
+import sys
+import termios
+import tty
+
+OPTIONS_WITH_ARGUMENT = set("BbcDEeFIiJLlmOopQRSWw")
+
+
+def parse(argv):
+    """Split ssh arguments into options, host and remote command
+
+    Arguments:
+        argv {list} -- arguments without the program name
+
+    Returns:
+        tuple -- (flags set, options list of (option, value), host, command)
+    """
+    flags = set()
+    options = []
+    i = 0
+    while i < len(argv) and argv[i].startswith("-"):
+        arg = argv[i]
+        j = 1
+        while j < len(arg):
+            if arg[j] in OPTIONS_WITH_ARGUMENT:
+                value = arg[j + 1 :] if j + 1 < len(arg) else argv[i + 1]
+                if j + 1 >= len(arg):
+                    i += 1
+                options.append((arg[j], value))
+                break
+            flags.add(arg[j])
+            j += 1
+        i += 1
+    host = argv[i] if i < len(argv) else None
+    command = " ".join(argv[i + 1 :])
+    return flags, options, host, command
+
+
+async def pipe(reader, writer):
+    try:
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                break
+            writer.write(data)
+            await writer.drain()
+    except (ConnectionError, asyncio.CancelledError):
+        pass
+    finally:
+        writer.close()
+
+
+def forwarder(target):
+    async def handle(reader, writer):
+        try:
+            if target.startswith("/"):
+                remote_reader, remote_writer = await asyncio.open_unix_connection(target)
+            else:
+                host, port = target.rsplit(":", 1)
+                remote_reader, remote_writer = await asyncio.open_connection(host, int(port))
+        except OSError:
+            # like ssh: accept the local connection and close it if the remote end refuses
+            writer.close()
+            return
+        await asyncio.gather(pipe(reader, remote_writer), pipe(remote_reader, writer))
+
+    return handle
+
+
+async def start_forwards(forwards):
+    servers = []
+    for spec in forwards:
+        local, target = spec.split(":", 1)
+        if local.startswith("/"):
+            servers.append(await asyncio.start_unix_server(forwarder(target), local))
+        else:
+            servers.append(await asyncio.start_server(forwarder(target), "127.0.0.1", int(local)))
+    return servers
+
+
+def relay(source, target):
+    """Copy everything readable from fd source to fd target
+
+    Returns:
+        bool -- False at EOF (Linux signals EOF on a pty master with EIO)
+    """
+    try:
+        data = os.read(source, 65536)
+    except OSError:
+        data = b""
+    if data:
+        os.write(target, data)
+    return bool(data)
+
+
+async def run_in_pty(command):
+    """Run command with a new pty as controlling terminal and relay stdin/stdout through it
+
+    Returns:
+        int -- exit code of the command
+    """
+    master, slave = pty.openpty()
+    proc = await asyncio.create_subprocess_exec(
+        "sh",
+        "-c",
+        command,
+        stdin=slave,
+        stdout=slave,
+        stderr=slave,
+        start_new_session=True,
+        preexec_fn=lambda: fcntl.ioctl(0, termios.TIOCSCTTY, 0),
+    )
+    os.close(slave)
+
+    loop = asyncio.get_event_loop()
+    for sig in (signal.SIGTERM, signal.SIGHUP):
+        loop.add_signal_handler(sig, proc.kill)
+    eof = asyncio.Event()
+    stdin, stdout = sys.stdin.fileno(), sys.stdout.fileno()
+    saved = termios.tcgetattr(stdin) if os.isatty(stdin) else None
+    if saved is not None:
+        # ^C has to be passed on as a byte instead of raising SIGINT here
+        tty.setraw(stdin)
+
+    def on_output():
+        if not relay(master, stdout):
+            loop.remove_reader(master)
+            eof.set()
+
+    def on_input():
+        if not relay(stdin, master):
+            loop.remove_reader(stdin)
+
+    loop.add_reader(master, on_output)
+    loop.add_reader(stdin, on_input)
+    try:
+        code = await proc.wait()
+        await eof.wait()
+    finally:
+        loop.remove_reader(stdin)
+        if saved is not None:
+            termios.tcsetattr(stdin, termios.TCSADRAIN, saved)
+        os.close(master)
+    return code
+
+
+async def main(argv):
+    flags, options, host, command = parse(argv)
+    if any(option == "O" for option, _ in options) or "M" in flags:
+        return 255
+    if any(option == "o" and value == "ControlMaster=yes" for option, value in options):
+        return 255
+
+    await asyncio.sleep(float(os.environ.get("FAKE_SSH_LATENCY", "0")))
+
+    forwards = [value for option, value in options if option == "L"]
+    servers = await start_forwards(forwards)
+
+    if "N" in flags or not command:
+        await asyncio.Event().wait()
+        return 0
+
+    if "t" in flags:
+        code = await run_in_pty(command)
+    else:
+        proc = await asyncio.create_subprocess_exec("sh", "-c", command)
+        loop = asyncio.get_event_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM, signal.SIGHUP):
+            loop.add_signal_handler(sig, proc.kill)
+        code = await proc.wait()
+    for server in servers:
+        server.close()
+    # like ssh if the remote command was killed by a signal
+    return 255 if code < 0 else code
+
+
+if __name__ == "__main__":
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    sys.exit(loop.run_until_complete(main(sys.argv[1:])))
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+"""Import time of the launcher entry point ("python -m ssh_ipykernel")
+
+Imports ssh_ipykernel.__main__ in fresh interpreters with "-X importtime", reports the median
+total import time and the slowest top level imports, and fails if modules of the notebook
+server stack get imported or the time budget is exceeded:
+
+    python benchmarks/import_time.py --repeat 5 --budget 0.3
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+ENTRY = "ssh_ipykernel.__main__"
+
+# needed by the server extension or only once the kernel runs, never for starting the launcher
+FORBIDDEN = ["notebook", "tornado", "tornado.log", "jupyter_client", "zmq", "traitlets"]
+
+
+def import_times():
+    """Import the entry point once with -X importtime
+
+    Returns:
+        tuple -- (total seconds, dict module => self import time in seconds)
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import %s" % ENTRY],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+    total = 0
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        own, cumulative, name = line.split("|")
+        own = own.split(":")[1].strip()
+        if not own.isdigit():
+            # header line
+            continue
+        times[name.strip()] = int(own) / 1e6
+        # nested imports are indented
+        if not name.startswith("  "):
+            total += int(cumulative) / 1e6
+    return total, times
+
+
+def imported_forbidden():
+    code = "import sys, json, %s; print(json.dumps(sorted(sys.modules)))" % ENTRY
+    modules = json.loads(subprocess.check_output([sys.executable, "-c", code]))
+    return [name for name in FORBIDDEN if name in modules]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="import time of the ssh_ipykernel launcher")
+    parser.add_argument("--repeat", "-r", type=int, default=5, help="number of interpreters")
+    parser.add_argument("--budget", "-b", type=float, help="maximum median seconds")
+    parser.add_argument("--top", type=int, default=10, help="number of slowest imports to show")
+    args = parser.parse_args()
+
+    runs = [import_times() for _ in range(args.repeat)]
+    totals = [total for total, _ in runs]
+    median = statistics.median(totals)
+
+    slowest = sorted(runs[-1][1].items(), key=lambda item: item[1], reverse=True)[: args.top]
+    for name, seconds in slowest:
+        print("%8.1fms  %s" % (1000 * seconds, name))
+    print("median total: %.1fms (min %.1fms)" % (1000 * median, 1000 * min(totals)))
+
+    failed = False
+    forbidden = imported_forbidden()
+    if forbidden:
+        print("imported by the launcher entry point: %s" % ", ".join(forbidden))
+        failed = True
+    if args.budget is not None and median > args.budget:
+        print("over budget of %.1fms" % (1000 * args.budget))
+        failed = True
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,246 @@
+#!/usr/bin/env python
+"""Benchmarks of ssh_ipykernel against a local fake ssh (see fake_ssh.py)
+
+The "remote" host is the local machine and the "remote" python is the running interpreter, so
+jupyter_client and ipykernel need to be installed locally. Results are written as json and can
+be compared across releases:
+
+    python benchmarks/run.py --repeat 5 --latency 0.3 --output new.json
+    python benchmarks/run.py --compare old.json new.json
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+FAKE_SSH = os.path.join(HERE, "fake_ssh.py")
+HOST = "localhost"
+
+
+def summarize(runs):
+    return {
+        "runs": runs,
+        "mean": statistics.mean(runs),
+        "median": statistics.median(runs),
+        "min": min(runs),
+        "max": max(runs),
+    }
+
+
+def quiet_logger():
+    logger = logging.getLogger("benchmark")
+    logger.addHandler(logging.NullHandler())
+    logger.propagate = False
+    return logger
+
+
+def new_connection_file(folder):
+    from jupyter_client import write_connection_file
+
+    return write_connection_file(os.path.join(folder, "kernel-%d.json" % time.monotonic_ns()))
+
+
+def bench_connection_info(repeat, folder):
+    from ssh_ipykernel.kernel import SshKernel
+
+    runs = []
+    for _ in range(repeat):
+        _, connection_info = new_connection_file(folder)
+        kernel = SshKernel(HOST, connection_info, sys.prefix, logger=quiet_logger())
+        start = time.monotonic()
+        kernel.create_remote_connection_info()
+        runs.append(time.monotonic() - start)
+        kernel.status.close()
+        kernel.console.remove()
+        os.remove(kernel.fname)
+    return summarize(runs)
+
+
+class Launcher:
+    """A launcher process ("python -m ssh_ipykernel") with a kernel client
+
+    Arguments:
+        folder {str} -- Folder for the local connection file
+        extra_args {list} -- Additional launcher arguments
+    """
+
+    def __init__(self, folder, extra_args):
+        from jupyter_client import BlockingKernelClient
+        from ssh_ipykernel.status import Status
+
+        self.connection_file, self.connection_info = new_connection_file(folder)
+        argv = [sys.executable, "-m", "ssh_ipykernel", "--host", HOST, "--python", sys.prefix]
+        argv += extra_args + ["-f", self.connection_file]
+
+        self.status = Status(self.connection_info, quiet_logger())
+        self.start = time.monotonic()
+        self.process = subprocess.Popen(argv, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        self.kc = BlockingKernelClient()
+        self.kc.load_connection_info(self.connection_info)
+
+    def wait_running(self, timeout=120):
+        while time.monotonic() - self.start < timeout:
+            if self.status.is_running():
+                return time.monotonic() - self.start
+            if self.process.poll() is not None:
+                break
+            time.sleep(0.005)
+        raise RuntimeError("Launcher did not reach RUNNING")
+
+    def stop(self):
+        self.kc.stop_channels()
+        self.process.terminate()
+        try:
+            self.process.wait(10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+
+def bench_startup(repeat, folder, extra_args):
+    runs = []
+    for _ in range(repeat):
+        launcher = Launcher(folder, extra_args)
+        try:
+            runs.append(launcher.wait_running())
+        finally:
+            launcher.stop()
+    return summarize(runs)
+
+
+def wait_idle(kc, msg_id, timeout=60, on_message=None):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        msg = kc.get_iopub_msg(timeout=deadline - time.monotonic())
+        if msg["parent_header"].get("msg_id") != msg_id:
+            continue
+        if on_message is not None:
+            on_message(msg)
+        if msg["msg_type"] == "status" and msg["content"]["execution_state"] == "idle":
+            return
+    raise RuntimeError("Kernel did not become idle")
+
+
+def bench_interrupt(repeat, folder):
+    launcher = Launcher(folder, [])
+    runs = []
+    try:
+        launcher.wait_running()
+        launcher.kc.start_channels()
+        launcher.kc.wait_for_ready(30)
+        for _ in range(repeat):
+            msg_id = launcher.kc.execute("import time; time.sleep(60)")
+            while True:
+                msg = launcher.kc.get_iopub_msg(timeout=30)
+                parent_id = msg["parent_header"].get("msg_id")
+                if parent_id == msg_id and msg["msg_type"] == "execute_input":
+                    break
+            start = time.monotonic()
+            launcher.process.send_signal(signal.SIGINT)
+            wait_idle(launcher.kc, msg_id)
+            runs.append(time.monotonic() - start)
+    finally:
+        launcher.stop()
+    return summarize(runs)
+
+
+def bench_iopub(repeat, folder, size_mb):
+    launcher = Launcher(folder, [])
+    runs = []
+    try:
+        launcher.wait_running()
+        launcher.kc.start_channels()
+        launcher.kc.wait_for_ready(30)
+        code = "import sys\nfor _ in range(%d): sys.stdout.write('x' * 1048576)" % size_mb
+        for _ in range(repeat):
+            received = [0]
+
+            def count(msg):
+                if msg["msg_type"] == "stream":
+                    received[0] += len(msg["content"]["text"])
+
+            start = time.monotonic()
+            wait_idle(launcher.kc, launcher.kc.execute(code), on_message=count)
+            runs.append(received[0] / 1048576 / (time.monotonic() - start))
+    finally:
+        launcher.stop()
+    return summarize(runs)
+
+
+def run(args):
+    os.environ["SSH_IPYKERNEL_SSH"] = FAKE_SSH
+    os.environ["FAKE_SSH_LATENCY"] = str(args.latency)
+    import ssh_ipykernel
+
+    results = {}
+    with tempfile.TemporaryDirectory() as folder:
+        benchmarks = [
+            ("connection_info_seconds", lambda: bench_connection_info(args.repeat, folder)),
+            ("startup_seconds", lambda: bench_startup(args.repeat, folder, [])),
+            ("startup_bootstrap_seconds", lambda: bench_startup(args.repeat, folder, ["-b"])),
+            ("interrupt_seconds", lambda: bench_interrupt(args.repeat, folder)),
+            ("iopub_mb_per_second", lambda: bench_iopub(args.repeat, folder, args.size)),
+        ]
+        for name, bench in benchmarks:
+            if args.only and name not in args.only:
+                continue
+            print("Running %s ..." % name, file=sys.stderr)
+            results[name] = bench()
+            print("  median %.4f" % results[name]["median"], file=sys.stderr)
+
+    return {
+        "meta": {
+            "version": ssh_ipykernel.__version__,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "latency": args.latency,
+            "repeat": args.repeat,
+            "time": time.time(),
+        },
+        "results": results,
+    }
+
+
+def compare(old_file, new_file):
+    with open(old_file) as fd:
+        old = json.load(fd)
+    with open(new_file) as fd:
+        new = json.load(fd)
+    versions = (old["meta"]["version"], new["meta"]["version"])
+    print("%-28s %12s %12s %8s" % (("benchmark",) + versions + ("ratio",)))
+    for name, result in new["results"].items():
+        if name in old["results"]:
+            before = old["results"][name]["median"]
+            after = result["median"]
+            print("%-28s %12.4f %12.4f %8.2f" % (name, before, after, after / before))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ssh_ipykernel benchmarks with a fake ssh")
+    parser.add_argument("--repeat", "-r", type=int, default=5, help="runs per benchmark")
+    parser.add_argument(
+        "--latency", "-l", type=float, default=0.0, help="emulated ssh handshake in seconds"
+    )
+    parser.add_argument("--size", type=int, default=20, help="MB of output for iopub throughput")
+    parser.add_argument("--only", nargs="*", help="names of the benchmarks to run")
+    parser.add_argument("--output", "-o", help="json result file (default: stdout)")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two results")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        sys.exit(0)
+
+    results = run(args)
+    if args.output is None:
+        print(json.dumps(results, indent=2))
+    else:
+        with open(args.output, "w") as fd:
+            json.dump(results, fd, indent=2)
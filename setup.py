@@ -35,7 +35,7 @@ setup(
         "ssh_ipykernel_interrupt==1.1.2",
     ],
     extras_require={
-        "dev": {"twine", "bumpversion", "black", "pylint", "wheel"},
+        "dev": {"twine", "bumpversion", "black", "pylint", "wheel", "pytest"},
     },
     data_files=[
         (
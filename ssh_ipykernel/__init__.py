@@ -2,13 +2,42 @@
 
 """Top-level package for SSH Kernel."""
 
-from notebook.utils import url_path_join
+import sys
 
 __author__ = """Bernhard Walter"""
 __email__ = "b_walter@arcor.de"
 from ._version import __version__, __version_info__
 
-from .ssh_ipykernel_interrupt import SshInterruptHandler
+# The launcher ("python -m ssh_ipykernel") imports this package too, so the notebook server
+# and tornado web stack are only imported when the server extension is loaded
+_HANDLERS = (
+    "SshBulkHandler",
+    "SshConsoleHandler",
+    "SshInterruptHandler",
+    "SshMetricsHandler",
+    "SshTelemetryHandler",
+)
+
+
+if sys.version_info >= (3, 7):
+
+    def __getattr__(name):
+        if name in _HANDLERS:
+            from . import ssh_ipykernel_interrupt
+
+            return getattr(ssh_ipykernel_interrupt, name)
+        raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
+
+else:
+    # no module __getattr__ (PEP 562) before Python 3.7, import the handlers right away
+    from .ssh_ipykernel_interrupt import (
+        SshBulkHandler,
+        SshConsoleHandler,
+        SshInterruptHandler,
+        SshMetricsHandler,
+        SshTelemetryHandler,
+    )
 
 
 def load_jupyter_server_extension(nb_server_app):
@@ -18,8 +47,43 @@ def load_jupyter_server_extension(nb_server_app):
     Args:
         nb_server_app (NotebookWebApplication): handle to the Notebook webserver instance.
     """
+    from notebook.utils import url_path_join
+
+    from .ssh_ipykernel_interrupt import (
+        SshBulkHandler,
+        SshConsoleHandler,
+        SshInterruptHandler,
+        SshMetricsHandler,
+        SshTelemetryHandler,
+    )
+
     web_app = nb_server_app.web_app
     SshInterruptHandler.nbapp = nb_server_app
     host_pattern = ".*$"
     route_pattern = url_path_join(web_app.settings["base_url"], "/interrupt")
-    web_app.add_handlers(host_pattern, [(route_pattern, SshInterruptHandler)])
+    bulk_route_pattern = url_path_join(web_app.settings["base_url"], "/ssh_ipykernel/bulk")
+    metrics_route_pattern = url_path_join(web_app.settings["base_url"], "/ssh_ipykernel/metrics")
+    console_route_pattern = url_path_join(web_app.settings["base_url"], "/ssh_ipykernel/console")
+    telemetry_route_pattern = url_path_join(
+        web_app.settings["base_url"], "/ssh_ipykernel/telemetry"
+    )
+    web_app.add_handlers(
+        host_pattern,
+        [
+            (route_pattern, SshInterruptHandler),
+            (bulk_route_pattern, SshBulkHandler),
+            (metrics_route_pattern, SshMetricsHandler),
+            (console_route_pattern, SshConsoleHandler),
+            (telemetry_route_pattern, SshTelemetryHandler),
+        ],
+    )
+
+    kernel_manager_class = getattr(nb_server_app.kernel_manager, "kernel_manager_class", "")
+    if "SshPoolKernelManager" in str(kernel_manager_class):
+        from .pool import KernelPool
+
+        KernelPool.instance(parent=nb_server_app.kernel_manager, log=nb_server_app.log).start()
+
+    from .cleanup import SshCleanup
+
+    SshCleanup.instance(parent=nb_server_app, log=nb_server_app.log).start()
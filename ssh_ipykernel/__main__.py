@@ -1,26 +1,84 @@
 import argparse
 import json
 import sys
+from .hosts import HostSelector
 from .kernel import SshKernel
 
 
-def main(host, connection_info, python_path, sudo, timeout, env):
+def main(
+    host,
+    connection_info,
+    python_path,
+    sudo,
+    timeout,
+    env,
+    multiplex=False,
+    bootstrap=False,
+    ready_timeout=60,
+    ipc=False,
+    detach=False,
+    probe_ttl=30,
+    preflight=True,
+    preflight_ttl=3600,
+    cull_idle=0,
+    telemetry_interval=0,
+    heartbeat_interval=1.0,
+    interrupt_mode="signal",
+):
     """Main function to be called as module to create SshKernel
 
     Arguments:
-        host {str} -- host where the remote ipykernel should be started
+        host {str} -- host where the remote ipykernel should be started, or a comma separated
+                      list of candidate hosts to select the least loaded one from
         connection_info {dict} -- Local ipykernel connection info as provided by Juypter lab
         python_path {str} -- Remote python path to be used to start ipykernel
         sudo {bool} -- Start ipykernel as root if necessary (default: {False})
         timeout {int} -- SSH connection timeout (default: {5})
         env {str} -- Environment variables passd to the ipykernel "VAR1=VAL1 VAR2=VAL2" (default: {""})
+        multiplex {bool} -- Reuse one SSH master connection for all remote operations (default: {False})
+        bootstrap {bool} -- Allocate ports and start ipykernel in one remote process (default: {False})
+        ready_timeout {int} -- Deadline in seconds for the remote kernel to answer (default: {60})
+        ipc {bool} -- Use ipc transport remotely and forward to its unix sockets (default: {False})
+        detach {bool} -- Detach the remote kernel from the ssh session and reconnect (default: {False})
+        probe_ttl {int} -- Seconds to cache load probes of candidate hosts (default: {30})
+        preflight {bool} -- Check the remote environment before starting (default: {True})
+        preflight_ttl {int} -- Seconds to cache a successful check (default: {3600})
+        cull_idle {int} -- Seconds after which an idle remote kernel is shut down (default: {0})
+        telemetry_interval {int} -- Seconds between resource samples of the kernel (default: {0})
+        heartbeat_interval {float} -- Seconds between heartbeat pings (default: {1.0})
+        interrupt_mode {str} -- "message" to interrupt with an interrupt_request (default: {"signal"})
     """
-    kernel = SshKernel(host, connection_info, python_path, sudo, timeout, env)
+    hosts = [h.strip() for h in host.split(",") if h.strip()]
+    if len(hosts) > 1:
+        host = HostSelector(hosts, ttl=probe_ttl, timeout=timeout).select()
+    kernel = SshKernel(
+        host,
+        connection_info,
+        python_path,
+        sudo,
+        timeout,
+        env,
+        multiplex=multiplex,
+        bootstrap=bootstrap,
+        ready_timeout=ready_timeout,
+        ipc=ipc,
+        detach=detach,
+        preflight=preflight,
+        preflight_ttl=preflight_ttl,
+        cull_idle=cull_idle,
+        telemetry_interval=telemetry_interval,
+        heartbeat_interval=heartbeat_interval,
+        interrupt_mode=interrupt_mode,
+    )
     try:
-        kernel.create_remote_connection_info()
+        kernel.run_preflight()
+        if not kernel.bootstrap:
+            kernel.create_remote_connection_info()
         kernel.start_kernel_and_tunnels()
-    except:
-        kernel._logger.error("Kernel could not be started")
+    except Exception as ex:
+        kernel.launch_failed()
+        kernel._logger.error("Kernel could not be started: %s" % ex)
+        return 1
 
 
 if __name__ == "__main__":
@@ -37,6 +95,12 @@ if __name__ == "__main__":
     optional.add_argument(
         "--timeout", "-t", type=int, help="timeout for remote commands", default=5
     )
+    optional.add_argument(
+        "--ready-timeout",
+        type=int,
+        help="deadline in seconds for the remote kernel to become ready",
+        default=60,
+    )
     optional.add_argument(
         "--env",
         "-e",
@@ -46,10 +110,76 @@ if __name__ == "__main__":
     optional.add_argument(
         "-s", action="store_true", help="sudo required to start kernel on the remote machine"
     )
+    optional.add_argument(
+        "--multiplex",
+        "-m",
+        action="store_true",
+        help="reuse one SSH master connection (ControlMaster) for all remote operations",
+    )
+    optional.add_argument(
+        "--bootstrap",
+        "-b",
+        action="store_true",
+        help="allocate ports and start the kernel in one remote process",
+    )
+    optional.add_argument(
+        "--ipc",
+        "-i",
+        action="store_true",
+        help="use ipc transport remotely and forward local ports to its unix sockets",
+    )
+    optional.add_argument(
+        "--detach",
+        action="store_true",
+        help="keep the remote kernel running when the ssh connection drops and reconnect",
+    )
+    optional.add_argument(
+        "--no-preflight",
+        action="store_true",
+        help="skip checking python, ipykernel and /tmp on the remote host",
+    )
+    optional.add_argument(
+        "--preflight-ttl",
+        type=int,
+        help="seconds to cache a successful remote environment check (0: no cache)",
+        default=3600,
+    )
+    optional.add_argument(
+        "--probe-ttl",
+        type=int,
+        help="seconds to cache load probes when --host lists several hosts",
+        default=30,
+    )
+    optional.add_argument(
+        "--cull-idle",
+        type=int,
+        help="shut down the remote kernel after this many seconds without activity (0: never)",
+        default=0,
+    )
+    optional.add_argument(
+        "--telemetry-interval",
+        type=int,
+        help="seconds between memory and cpu samples of the remote kernel (0: off)",
+        default=0,
+    )
+    optional.add_argument(
+        "--heartbeat-interval",
+        type=float,
+        help="seconds between heartbeat pings to detect unresponsive kernels (0: off)",
+        default=1.0,
+    )
+    optional.add_argument(
+        "--interrupt-mode",
+        choices=["signal", "message"],
+        help="interrupt with a signal or with an interrupt_request on the control channel",
+        default="signal",
+    )
 
     required = parser.add_argument_group("required arguments")
     required.add_argument("--file", "-f", required=True, help="jupyter kernel connection file")
-    required.add_argument("--host", "-H", required=True, help="remote host")
+    required.add_argument(
+        "--host", "-H", required=True, help="remote host or comma separated candidate hosts"
+    )
     required.add_argument("--python", "-p", required=True, help="remote python_path")
     args = parser.parse_args()
 
@@ -60,4 +190,25 @@ if __name__ == "__main__":
         print(ex)
         sys.exit(1)
 
-    sys.exit(main(args.host, connection_info, args.python, args.s, args.timeout, args.env))
+    sys.exit(
+        main(
+            args.host,
+            connection_info,
+            args.python,
+            args.s,
+            args.timeout,
+            args.env,
+            multiplex=args.multiplex,
+            bootstrap=args.bootstrap,
+            ready_timeout=args.ready_timeout,
+            ipc=args.ipc,
+            detach=args.detach,
+            probe_ttl=args.probe_ttl,
+            preflight=not args.no_preflight,
+            preflight_ttl=args.preflight_ttl,
+            cull_idle=args.cull_idle,
+            telemetry_interval=args.telemetry_interval,
+            heartbeat_interval=args.heartbeat_interval,
+            interrupt_mode=args.interrupt_mode,
+        )
+    )
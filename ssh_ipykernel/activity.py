@@ -0,0 +1,118 @@
+import threading
+import time
+from queue import Empty
+
+
+class ActivityTracker:
+    """Track the last activity and the execution state of a remote kernel from its iopub messages
+
+    Every request a frontend sends on the shell or control channel makes the kernel publish
+    busy/idle status messages on iopub, so the launcher's own kernel client sees the activity
+    of all frontends. kernel_info requests (sent by frontends when they (re)connect) do not
+    count as activity.
+
+    Interrupts are measured from the interrupt until the interrupted request finished (the
+    kernel went idle). interrupt_requests sent by others on the control channel are detected
+    from the status messages the kernel publishes for them.
+
+    The iopub channel is read in a daemon thread; the launcher publishes the state to the
+    status record from its main loop, since the record has a single writer.
+
+    Arguments:
+        kc {BlockingKernelClient} -- Started kernel client of the launcher
+        logger {logging.Logger} -- Logger to use
+    """
+
+    IGNORED = ("kernel_info_request",)
+
+    def __init__(self, kc, logger):
+        self.kc = kc
+        self.last_activity = time.time()
+        self.busy = False
+        self._interrupted = None
+        self._interrupt = None
+        self._logger = logger
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start reading iopub messages
+        """
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stop reading iopub messages, has to be called before the channels are stopped
+        """
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(2)
+            self._thread = None
+
+    def idle_time(self):
+        """Get the seconds since the last activity
+
+        Returns:
+            float -- idle time, 0 while the kernel is busy
+        """
+        return 0.0 if self.busy else time.time() - self.last_activity
+
+    def interrupted(self, mode):
+        """Start measuring the time until the interrupted request finished, nothing to measure
+        if the kernel is idle. A running measurement keeps its start and only changes the mode,
+        so a signal sent after an unanswered interrupt_request counts from the first attempt.
+
+        Arguments:
+            mode {str} -- "signal" or "message"
+        """
+        interrupted = self._interrupted
+        if interrupted is not None:
+            self._interrupted = (interrupted[0], mode)
+        elif self.busy:
+            self._interrupted = (time.monotonic(), mode)
+
+    def take_interrupt(self):
+        """Get the last measured interrupt once
+
+        Returns:
+            tuple -- (interrupt-to-idle latency in seconds, mode), None if nothing new
+        """
+        interrupt, self._interrupt = self._interrupt, None
+        return interrupt
+
+    def on_message(self, msg):
+        """Update activity and execution state from an iopub message
+
+        Arguments:
+            msg {dict} -- iopub message
+        """
+        parent_type = msg.get("parent_header", {}).get("msg_type")
+        if parent_type in ActivityTracker.IGNORED:
+            return
+        if parent_type == "interrupt_request":
+            # handled on control while the interrupted request still runs on shell
+            if msg["msg_type"] == "status" and self._interrupted is None:
+                self.interrupted("message")
+            return
+        if msg["msg_type"] == "status":
+            busy = msg["content"].get("execution_state") == "busy"
+            if not busy and self._interrupted is not None:
+                start, mode = self._interrupted
+                self._interrupted = None
+                self._interrupt = (time.monotonic() - start, mode)
+                self._logger.info("Remote kernel idle %.3fs after interrupt (%s)" % self._interrupt)
+            self.busy = busy
+        self.last_activity = time.time()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                msg = self.kc.get_iopub_msg(timeout=1)
+            except Empty:
+                continue
+            except Exception as ex:
+                if not self._stopped.is_set():
+                    self._logger.warning("Stopped tracking kernel activity: %s" % ex)
+                return
+            self.on_message(msg)
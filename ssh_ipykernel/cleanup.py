@@ -0,0 +1,398 @@
+"""Garbage collection of leaked remote connection files and stale local status files
+
+Every launch leaves /tmp/.ssh_ipykernel_<uuid>.json (and for ipc or detached kernels a socket
+folder and a log file) on the remote host, and launchers killed with SIGKILL leave their status,
+timings and console files in ~/.ssh_ipykernel. Run a cleanup from the command line
+
+    python -m ssh_ipykernel.cleanup --dry-run
+    python -m ssh_ipykernel.cleanup --host btest --min-age 86400
+
+or periodically from the server extension, e.g. in the jupyter server config
+
+    c.SshCleanup.interval = 3600
+    c.SshCleanup.min_age = 86400
+"""
+import argparse
+import asyncio
+import atexit
+import math
+import os
+import sys
+import threading
+import time
+
+from traitlets import Bool, Float, List, Unicode
+from traitlets.config import SingletonConfigurable
+
+from ssh_ipykernel.manage import PREFIX
+from ssh_ipykernel.status import Status
+from ssh_ipykernel.utils import is_windows, setup_logging, ssh_async
+
+# One round trip per host for all leaked files. A file is kept if it is younger than {minutes}
+# or if a process (the kernel or the detach monitor) still refers to its uuid; the [.] keeps
+# pgrep from matching its own command line. No tabs, no multiline, quote { and } !
+CLEANUP_SCRIPT = (
+    "for f in $(find /tmp -maxdepth 1 -name '.ssh_ipykernel_*' -mmin +{minutes}); do "
+    'u=${{f#/tmp/.ssh_ipykernel_}}; u=${{u%.json}}; u=${{u%.log}}; '
+    'if pgrep -f "[.]ssh_ipykernel_$u" >/dev/null; then echo "SSH_IPYKERNEL_INUSE $f"; '
+    'elif {remove}; then echo "SSH_IPYKERNEL_REMOVED $f"; '
+    'else echo "SSH_IPYKERNEL_FAILED $f"; fi; '
+    "done; true"
+)
+
+REMOVE = {False: 'rm -rf "$f"', True: 'sudo -n rm -rf "$f"'}
+DRY_RUN = "true"
+
+
+def ssh_kernel_hosts(kernel_spec_manager=None):
+    """Get the remote hosts of all installed ssh_ipykernel kernelspecs
+
+    Keyword Arguments:
+        kernel_spec_manager {KernelSpecManager} -- Kernelspec manager to use (default: {None})
+
+    Returns:
+        dict -- host => True if any kernelspec of the host uses sudo
+    """
+    from jupyter_client.kernelspec import KernelSpecManager
+
+    if kernel_spec_manager is None:
+        kernel_spec_manager = KernelSpecManager()
+
+    hosts = {}
+    for name in kernel_spec_manager.find_kernel_specs():
+        if not name.startswith(PREFIX + "_"):
+            continue
+        argv = kernel_spec_manager.get_kernel_spec(name).argv
+        if "--host" not in argv[:-1]:
+            continue
+        sudo = "-s" in argv or "--sudo" in argv
+        for host in argv[argv.index("--host") + 1].split(","):
+            hosts[host] = hosts.get(host, False) or sudo
+    return hosts
+
+
+def parse_cleanup(output):
+    """Parse the output of CLEANUP_SCRIPT
+
+    Arguments:
+        output {str} -- output of CLEANUP_SCRIPT
+
+    Returns:
+        dict -- {"removed", "in_use", "failed"} => list of remote paths
+    """
+    result = {"removed": [], "in_use": [], "failed": []}
+    keys = {
+        "SSH_IPYKERNEL_REMOVED": "removed",
+        "SSH_IPYKERNEL_INUSE": "in_use",
+        "SSH_IPYKERNEL_FAILED": "failed",
+    }
+    for line in output.splitlines():
+        tag, _, path = line.strip().partition(" ")
+        if tag in keys:
+            result[keys[tag]].append(path)
+    return result
+
+
+class Cleanup:
+    """Remove leaked remote files per host and local status files of dead launchers
+
+    Remote: all hosts are handled in parallel with one ssh command each (see CLEANUP_SCRIPT).
+    Local: status files whose launcher (owner pid of the record) is dead are removed together
+    with their timings and console files, registry slots of dead launchers are freed, and
+    timings and console files without status are removed once they are older than min_age.
+    Status files of the legacy layout carry no owner pid and are left alone.
+
+    Keyword Arguments:
+        min_age {float} -- Seconds a file must be unmodified before it is removed (default: {3600})
+        dry_run {bool} -- Only report what would be removed (default: {False})
+        timeout {int} -- Timeout of the ssh command per host in seconds (default: {30})
+        status_folder {str} -- Folder of the status files (default: {"~/.ssh_ipykernel"})
+        logger {logging.Logger} -- Logger to use (default: {None})
+    """
+
+    def __init__(
+        self,
+        min_age=3600,
+        dry_run=False,
+        timeout=30,
+        status_folder="~/.ssh_ipykernel",
+        logger=None,
+    ):
+        self.min_age = min_age
+        self.dry_run = dry_run
+        self.timeout = timeout
+        self.status_folder = os.path.expanduser(status_folder)
+        self._logger = setup_logging("SshCleanup") if logger is None else logger
+
+    def command(self, sudo=False):
+        """Get the remote shell command of the cleanup
+
+        Keyword Arguments:
+            sudo {bool} -- Remove files via sudo, e.g. written by root kernels (default: {False})
+
+        Returns:
+            str -- remote command
+        """
+        return CLEANUP_SCRIPT.format(
+            minutes=max(1, math.ceil(self.min_age / 60)),
+            remove=DRY_RUN if self.dry_run else REMOVE[sudo],
+        )
+
+    async def _clean_host(self, host, sudo):
+        result = await ssh_async(host, self.command(sudo), self.timeout)
+        if result["code"] != 0:
+            self._logger.warning("Cleaning up %s failed: %s" % (host, result["data"].strip()))
+            return host, None
+        return host, parse_cleanup(result["data"])
+
+    async def _clean_hosts(self, hosts):
+        return await asyncio.gather(*[self._clean_host(h, sudo) for h, sudo in hosts.items()])
+
+    def clean_remote(self, hosts):
+        """Remove leaked files on the remote hosts in parallel
+
+        Arguments:
+            hosts {dict} -- host => whether to use sudo
+
+        Returns:
+            dict -- host => parse_cleanup result, None if the host could not be cleaned up
+        """
+        if not hosts:
+            return {}
+        loop = asyncio.new_event_loop()
+        try:
+            results = dict(loop.run_until_complete(self._clean_hosts(hosts)))
+        finally:
+            loop.close()
+        for host, result in results.items():
+            if result is not None:
+                self._logger.info(
+                    "%s: %s %d, in use %d, failed %d"
+                    % (
+                        host,
+                        "stale" if self.dry_run else "removed",
+                        len(result["removed"]),
+                        len(result["in_use"]),
+                        len(result["failed"]),
+                    )
+                )
+        return results
+
+    def _is_old(self, path, now):
+        try:
+            return now - os.stat(path).st_mtime >= self.min_age
+        except FileNotFoundError:
+            return False
+
+    def _remove(self, path, removed):
+        if not self.dry_run:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                return
+            except Exception as ex:
+                self._logger.error("Cannot remove %s: %s" % (path, ex))
+                return
+        removed.append(path)
+
+    @staticmethod
+    def owner_pid(status_file):
+        """Get the launcher pid of a status file
+
+        Arguments:
+            status_file {str} -- path of the status file
+
+        Returns:
+            int -- owner pid, 0 if the launcher has not initialized the record yet,
+                   None for the legacy layout or an unreadable file
+        """
+        try:
+            with open(status_file, "rb") as fd:
+                data = fd.read(Status.RECORD_SIZE)
+        except OSError:
+            return None
+        if len(data) < Status.RECORD_SIZE or data[:4] != Status.MAGIC:
+            return None
+        # the owner pid is written once before the launcher starts, no need for the seqlock
+        return Status.PAYLOAD.unpack_from(data, Status.PAYLOAD_OFFSET)[5]
+
+    def _live_registry_hashes(self, removed):
+        from ssh_ipykernel.registry import Registry, pid_alive
+
+        if not os.path.exists(os.path.join(self.status_folder, "registry")):
+            return set()
+        registry = Registry.instance(
+            Status._empty_record(), status_folder=self.status_folder, logger=self._logger
+        )
+        live = set()
+        for _, key, owner_pid, _ in registry.used():
+            if pid_alive(owner_pid):
+                live.add(key.hex())
+            else:
+                removed.append("registry slot")
+        if not self.dry_run:
+            registry.reap()
+        return live
+
+    def clean_local(self):
+        """Remove stale files in the status folder
+
+        Returns:
+            list -- removed files ("registry slot" for each freed registry slot)
+        """
+        from ssh_ipykernel.registry import pid_alive
+
+        removed = []
+        if not os.path.isdir(self.status_folder):
+            return removed
+
+        now = time.time()
+        live = self._live_registry_hashes(removed)
+        names = os.listdir(self.status_folder)
+        for name in names:
+            hash, ext = os.path.splitext(name)
+            if ext != ".status":
+                continue
+            path = os.path.join(self.status_folder, name)
+            pid = Cleanup.owner_pid(path)
+            if pid is None or (pid == 0 and not self._is_old(path, now)):
+                continue
+            if pid == 0 or not pid_alive(pid):
+                self._remove(path, removed)
+            else:
+                live.add(hash)
+
+        for name in names:
+            hash, ext = os.path.splitext(name)
+            if ext not in (".timings", ".console") or hash in live:
+                continue
+            path = os.path.join(self.status_folder, name)
+            status_file = os.path.join(self.status_folder, hash + ".status")
+            if status_file in removed or (
+                not os.path.exists(status_file) and self._is_old(path, now)
+            ):
+                self._remove(path, removed)
+
+        if removed:
+            self._logger.info(
+                "%s %d local file(s) in %s"
+                % ("Stale" if self.dry_run else "Removed", len(removed), self.status_folder)
+            )
+        return removed
+
+    def run(self, hosts=None):
+        """Clean up locally and on the remote hosts
+
+        Keyword Arguments:
+            hosts {dict} -- host => whether to use sudo (default: {None}, all hosts of the
+                            installed ssh_ipykernel kernelspecs)
+
+        Returns:
+            dict -- {"local": removed local files, "remote": host => parse_cleanup result}
+        """
+        if hosts is None:
+            hosts = ssh_kernel_hosts()
+        local = [] if is_windows else self.clean_local()
+        return {"local": local, "remote": self.clean_remote(hosts)}
+
+
+class SshCleanup(SingletonConfigurable):
+    """Periodic cleanup (see Cleanup) in the notebook server, off unless interval > 0
+    """
+
+    interval = Float(0, config=True, help="Seconds between cleanup runs, 0 disables them")
+    min_age = Float(
+        86400, config=True, help="Seconds a file must be unmodified before it is removed"
+    )
+    hosts = List(
+        Unicode(),
+        config=True,
+        help="Hosts to clean up (default: all hosts of the ssh_ipykernel kernelspecs)",
+    )
+    local_only = Bool(False, config=True, help="Only clean up the local status folder")
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._stopped = threading.Event()
+        self._worker = None
+
+    def start(self):
+        """Start the cleanup thread if an interval is configured
+        """
+        if self.interval <= 0 or self._worker is not None:
+            return
+        self.log.info("Starting ssh_ipykernel cleanup (every %ds)" % self.interval)
+        atexit.register(self._stopped.set)
+        self._worker = threading.Thread(target=self._run, daemon=True)
+        self._worker.start()
+
+    def _hosts(self):
+        if self.local_only:
+            return {}
+        if self.hosts:
+            return {host: False for host in self.hosts}
+        return ssh_kernel_hosts()
+
+    def _run(self):
+        cleanup = Cleanup(min_age=self.min_age, logger=self.log)
+        while not self._stopped.wait(self.interval):
+            try:
+                cleanup.run(self._hosts())
+            except Exception as ex:
+                self.log.error("ssh_ipykernel cleanup failed: %s" % ex)
+
+
+def main(args):
+    cleanup = Cleanup(min_age=args.min_age, dry_run=args.dry_run, timeout=args.timeout)
+    if args.local_only:
+        hosts = {}
+    elif args.host:
+        hosts = {host: args.sudo for host in args.host}
+    else:
+        hosts = ssh_kernel_hosts()
+
+    result = cleanup.run(hosts)
+    verb = "stale" if args.dry_run else "removed"
+    print("local: %d %s" % (len(result["local"]), verb))
+    failed = 0
+    for host, remote in sorted(result["remote"].items()):
+        if remote is None:
+            print("%s: unreachable" % host)
+            failed += 1
+            continue
+        print(
+            "%s: %d %s, %d in use, %d failed"
+            % (host, len(remote["removed"]), verb, len(remote["in_use"]), len(remote["failed"]))
+        )
+        if args.verbose:
+            for path in remote["removed"]:
+                print("    %s" % path)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Remove leaked remote connection files and stale local status files"
+    )
+    parser.add_argument(
+        "--host",
+        "-H",
+        nargs="*",
+        help="remote hosts (default: all hosts of the ssh_ipykernel kernelspecs)",
+    )
+    parser.add_argument(
+        "--sudo", "-s", action="store_true", help="remove remote files via sudo (with --host)"
+    )
+    parser.add_argument(
+        "--min-age",
+        type=float,
+        default=3600,
+        help="seconds a file must be unmodified before it is removed (default: 3600)",
+    )
+    parser.add_argument("--timeout", "-t", type=int, default=30, help="ssh timeout per host")
+    parser.add_argument("--local-only", action="store_true", help="skip the remote hosts")
+    parser.add_argument(
+        "--dry-run", "-n", action="store_true", help="only report what would be removed"
+    )
+    parser.add_argument("--verbose", "-v", action="store_true", help="list removed remote files")
+    sys.exit(main(parser.parse_args()))
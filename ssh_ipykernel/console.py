@@ -0,0 +1,207 @@
+import mmap
+import os
+import struct
+import time
+
+
+class Console:
+    """Ring buffer of the recent remote console output in a mmap'd file next to the status file
+
+    The file has a fixed size (HEADER_SIZE + capacity bytes, little endian):
+
+        0   magic "SIPC"        4s
+        4   version             u16
+        6   reserved            u16
+        8   capacity            u32
+        16  sequence counter    u64
+        24  total bytes written u64
+        64  data                capacity bytes, byte n of the output is at n % capacity
+
+    As for the status record the launcher is the only writer and uses a seqlock, readers retry
+    until they copied a consistent snapshot, or for at most SEQLOCK_TIMEOUT seconds if the launcher
+    died in the middle of a write. Offsets are positions in the whole output stream,
+    so a reader can poll incrementally and learns how many bytes were overwritten in between.
+    The file survives the launcher (so the output of a dead kernel can still be read) and is
+    removed by the server extension when the kernel is gone.
+
+    Arguments:
+        hash {str} -- Status hash of the kernel (see Status.hash)
+        logger {logging.Logger} -- Logger to use
+
+    Keyword Arguments:
+        status_folder {str} -- Folder of the status files (default: {"~/.ssh_ipykernel"})
+        capacity {int} -- Bytes to keep, only used by the owner (default: {65536})
+        owner {bool} -- Whether this is the writing launcher (default: {False})
+    """
+
+    MAGIC = b"SIPC"
+    VERSION = 1
+    HEADER = struct.Struct("<4sHHI")
+    SEQ = struct.Struct("<Q")
+    SEQ_OFFSET = 16
+    TOTAL_OFFSET = 24
+    HEADER_SIZE = 64
+    CAPACITY = 65536
+    SEQLOCK_TIMEOUT = 0.005
+
+    def __init__(
+        self, hash, logger, status_folder="~/.ssh_ipykernel", capacity=CAPACITY, owner=False
+    ):
+        self._logger = logger
+        self.owner = owner
+        self.console_file = os.path.join(os.path.expanduser(status_folder), "%s.console" % hash)
+        self.capacity = capacity
+        self.buffer = None
+        self._fd = None
+        self._inode = None
+        if owner:
+            self._create_or_attach()
+
+    def _create_or_attach(self):
+        try:
+            if self._attach() and self.capacity == self._capacity():
+                # restarted kernel with the same connection info: keep the previous output
+                self.write(b"\n--- ssh_ipykernel: kernel restarted ---\n")
+                return
+            self.detach()
+            tmp_file = "%s.%d" % (self.console_file, os.getpid())
+            with open(tmp_file, "wb") as fd:
+                header = bytearray(Console.HEADER_SIZE)
+                Console.HEADER.pack_into(
+                    header, 0, Console.MAGIC, Console.VERSION, 0, self.capacity
+                )
+                fd.write(header)
+                fd.truncate(Console.HEADER_SIZE + self.capacity)
+            os.replace(tmp_file, self.console_file)
+            self._attach()
+        except Exception as ex:
+            self._logger.error("Cannot initialize %s" % self.console_file)
+            self._logger.error(str(ex))
+            self.detach()
+
+    def _attach(self):
+        if self.buffer is not None:
+            return True
+        if not os.path.exists(self.console_file):
+            return False
+        self._fd = open(self.console_file, "r+b" if self.owner else "rb")
+        self._inode = os.fstat(self._fd.fileno()).st_ino
+        access = mmap.ACCESS_WRITE if self.owner else mmap.ACCESS_READ
+        self.buffer = mmap.mmap(self._fd.fileno(), 0, access=access)
+        if len(self.buffer) < Console.HEADER_SIZE or self.buffer[:4] != Console.MAGIC:
+            self._logger.warning("Ignoring invalid console file %s" % self.console_file)
+            self.detach()
+            return False
+        return True
+
+    def _capacity(self):
+        return Console.HEADER.unpack_from(self.buffer, 0)[3]
+
+    def _read_u64(self, offset):
+        return Console.SEQ.unpack_from(self.buffer, offset)[0]
+
+    def write(self, data):
+        """Append output, only the last capacity bytes are kept
+
+        Arguments:
+            data {bytes|str} -- Output of the remote console (str is utf-8 encoded)
+        """
+        if self.buffer is None or not data:
+            return
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+
+        total = self._read_u64(Console.TOTAL_OFFSET)
+        new_total = total + len(data)
+        data = data[-self.capacity :]
+        start = (new_total - len(data)) % self.capacity
+        first = min(len(data), self.capacity - start)
+
+        seq = self._read_u64(Console.SEQ_OFFSET)
+        # odd if the previous launcher died in the middle of a write
+        seq += seq % 2
+        Console.SEQ.pack_into(self.buffer, Console.SEQ_OFFSET, seq + 1)
+        base = Console.HEADER_SIZE
+        self.buffer[base + start : base + start + first] = data[:first]
+        if first < len(data):
+            self.buffer[base : base + len(data) - first] = data[first:]
+        Console.SEQ.pack_into(self.buffer, Console.TOTAL_OFFSET, new_total)
+        Console.SEQ.pack_into(self.buffer, Console.SEQ_OFFSET, seq + 2)
+
+    def flush(self):
+        """No-op, allows to use the console as pexpect logfile_read
+        """
+
+    def read(self, offset=0, limit=None):
+        """Get the output from offset on (seqlock read)
+
+        Keyword Arguments:
+            offset {int} -- Stream position to start from (default: {0})
+            limit {int} -- Maximum number of bytes to return (default: {None})
+
+        Returns:
+            tuple -- (data bytes, stream position after data, number of bytes lost since offset),
+                     None if there is no console file (yet), no data if the buffer stayed
+                     locked for SEQLOCK_TIMEOUT seconds
+        """
+        if self.buffer is not None and not self.owner:
+            try:
+                replaced = os.stat(self.console_file).st_ino != self._inode
+            except FileNotFoundError:
+                replaced = True
+            if replaced:
+                # a new launcher created a fresh file
+                self.detach()
+        if self.buffer is None and not self._attach():
+            return None
+
+        capacity = self._capacity()
+        base = Console.HEADER_SIZE
+        deadline = None
+        spins = 0
+        while True:
+            seq1 = self._read_u64(Console.SEQ_OFFSET)
+            if seq1 % 2 == 0:
+                total = self._read_u64(Console.TOTAL_OFFSET)
+                # an offset beyond the end belongs to a previous file, start over
+                start = max(offset if offset <= total else 0, total - capacity)
+                end = total if limit is None else min(total, start + limit)
+                first = start % capacity
+                length = end - start
+                if first + length <= capacity:
+                    data = self.buffer[base + first : base + first + length]
+                else:
+                    data = self.buffer[base + first : base + capacity]
+                    data += self.buffer[base : base + length - (capacity - first)]
+                if self._read_u64(Console.SEQ_OFFSET) == seq1:
+                    return data, end, max(0, start - offset)
+            spins += 1
+            if spins % 100 == 0:
+                now = time.monotonic()
+                if deadline is None:
+                    deadline = now + Console.SEQLOCK_TIMEOUT
+                elif now > deadline:
+                    # the launcher was killed in the middle of a write
+                    return b"", offset, 0
+                time.sleep(0)
+
+    def detach(self):
+        """Unmap and close the console file without removing it
+        """
+        if self.buffer is not None:
+            self.buffer.close()
+            self.buffer = None
+        if self._fd is not None:
+            self._fd.close()
+            self._fd = None
+
+    def remove(self):
+        """Detach and remove the console file
+        """
+        self.detach()
+        try:
+            os.remove(self.console_file)
+        except FileNotFoundError:
+            pass
+        except Exception as ex:
+            self._logger.error(str(ex))
@@ -0,0 +1,154 @@
+import asyncio
+import math
+import time
+from collections import deque
+
+
+class HeartbeatMonitor:
+    """Ping the heartbeat channel of the remote kernel through the forwarded hb_port
+
+    The ipykernel heartbeat echoes every message in a separate thread, so it answers while the
+    kernel is busy and only stops when the kernel process, the host or the tunnel is gone.
+    A DEALER socket is used instead of REQ so that a lost ping does not block the socket; replies
+    are matched by their sequence number and late replies are dropped.
+
+    A ping is lost when no reply arrives within an adaptive timeout: FACTOR times the 99th
+    percentile of the recent round trip times, within [MIN_TIMEOUT, MAX_TIMEOUT]. After MISSES
+    lost pings in a row the kernel is considered unresponsive.
+
+    Arguments:
+        connection_info {dict} -- Local ipykernel connection info
+        logger {logging.Logger} -- Logger to use
+
+    Keyword Arguments:
+        interval {float} -- Seconds between pings (default: {1.0})
+    """
+
+    MIN_TIMEOUT = 1.0
+    MAX_TIMEOUT = 10.0
+    INITIAL_TIMEOUT = 5.0
+    FACTOR = 3
+    PERCENTILE = 0.99
+    MISSES = 2
+    HISTORY = 100
+
+    def __init__(self, connection_info, logger, interval=1.0):
+        self.url = "%s://%s:%d" % (
+            connection_info.get("transport", "tcp"),
+            connection_info["ip"],
+            connection_info["hb_port"],
+        )
+        self.interval = interval
+        self.rtts = deque(maxlen=HeartbeatMonitor.HISTORY)
+        self.responsive = True
+        self.misses = 0
+        self._logger = logger
+
+    def percentile(self, p):
+        """Get a percentile of the recent round trip times
+
+        Arguments:
+            p {float} -- percentile between 0 and 1
+
+        Returns:
+            float -- round trip time in seconds, None without measurements
+        """
+        if not self.rtts:
+            return None
+        values = sorted(self.rtts)
+        return values[max(0, math.ceil(p * len(values)) - 1)]
+
+    def timeout(self):
+        """Get the current timeout of a ping
+
+        Returns:
+            float -- timeout in seconds
+        """
+        rtt = self.percentile(HeartbeatMonitor.PERCENTILE)
+        if rtt is None:
+            return HeartbeatMonitor.INITIAL_TIMEOUT
+        return min(
+            HeartbeatMonitor.MAX_TIMEOUT,
+            max(HeartbeatMonitor.MIN_TIMEOUT, HeartbeatMonitor.FACTOR * rtt),
+        )
+
+    def on_ping(self, rtt):
+        """Account for the result of a ping
+
+        Arguments:
+            rtt {float} -- round trip time in seconds, None if the ping was lost
+
+        Returns:
+            bool -- True if the responsiveness changed
+        """
+        if rtt is None:
+            self.misses += 1
+            if self.responsive and self.misses >= HeartbeatMonitor.MISSES:
+                self.responsive = False
+                return True
+            return False
+
+        self.rtts.append(rtt)
+        self.misses = 0
+        if not self.responsive:
+            self.responsive = True
+            return True
+        return False
+
+    async def _ping(self, socket, ping, deadline):
+        try:
+            # blocks once sndhwm pings are queued for a dead connection
+            await asyncio.wait_for(socket.send(ping), deadline - time.monotonic())
+        except asyncio.TimeoutError:
+            return False
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            try:
+                reply = await asyncio.wait_for(socket.recv(), remaining)
+            except asyncio.TimeoutError:
+                return False
+            if reply == ping:
+                return True
+            # late reply of an earlier ping
+
+    async def run(self, on_rtt, on_change):
+        """Ping every interval seconds until cancelled
+
+        Arguments:
+            on_rtt {callable} -- called with the round trip time of each answered ping
+            on_change {callable} -- called with the new responsiveness when it changes
+        """
+        import zmq
+        import zmq.asyncio
+
+        context = zmq.asyncio.Context()
+        socket = context.socket(zmq.DEALER)
+        socket.linger = 0
+        # do not pile up pings while the tunnel is down
+        socket.sndhwm = 10
+        socket.connect(self.url)
+        seq = 0
+        try:
+            while True:
+                seq += 1
+                ping = b"ssh_ipykernel %d" % seq
+                start = time.monotonic()
+                timeout = self.timeout()
+                answered = await self._ping(socket, ping, start + timeout)
+                rtt = time.monotonic() - start if answered else None
+                if rtt is not None:
+                    on_rtt(rtt)
+                if self.on_ping(rtt):
+                    if self.responsive:
+                        self._logger.info("Heartbeat is back (rtt %.3fs)" % rtt)
+                    else:
+                        self._logger.warning(
+                            "No heartbeat for %d pings (timeout %.2fs)" % (self.misses, timeout)
+                        )
+                    on_change(self.responsive)
+                await asyncio.sleep(max(0, self.interval - (time.monotonic() - start)))
+        finally:
+            socket.close()
+            context.term()
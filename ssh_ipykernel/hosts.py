@@ -0,0 +1,178 @@
+import asyncio
+import json
+import os
+import time
+from collections import namedtuple
+
+from ssh_ipykernel.utils import setup_logging, ssh_async
+
+# One round trip per host: load average, available memory (kB), cpus, running ssh_ipykernels.
+# The [i] keeps pgrep from counting the shell running this command
+PROBE_SCRIPT = (
+    "cat /proc/loadavg; grep MemAvailable /proc/meminfo; nproc; "
+    "pgrep -fc '[i]pykernel_launcher -f /tmp/.ssh_ipykernel_'; true"
+)
+
+HostProbe = namedtuple("HostProbe", ["host", "load", "mem_available", "cpus", "kernels", "rtt"])
+
+
+def parse_probe(host, output, rtt):
+    """Parse the output of PROBE_SCRIPT
+
+    Arguments:
+        host {str} -- remote host
+        output {str} -- output of PROBE_SCRIPT
+        rtt {float} -- duration of the probe in seconds
+
+    Returns:
+        HostProbe -- probe result, None if the output cannot be parsed
+    """
+    lines = output.strip().splitlines()
+    try:
+        load = float(lines[0].split()[0])
+        mem_available = int(lines[1].split()[1])
+        cpus = max(1, int(lines[2]))
+        kernels = int(lines[3]) if len(lines) > 3 else 0
+    except (IndexError, ValueError):
+        return None
+    return HostProbe(host, load, mem_available, cpus, kernels, rtt)
+
+
+class HostSelector:
+    """Select the least loaded host of a list of equivalent candidate hosts
+
+    All candidates are probed in parallel with one ssh command each (reusing master connections
+    if available). Results are cached for ttl seconds in hosts.json in the status folder, so
+    kernels started in quick succession do not probe again; the kernel count of a chosen host
+    is incremented in the cache, so they do not all pile onto the same host either.
+
+    Arguments:
+        hosts {list} -- candidate hosts
+
+    Keyword Arguments:
+        ttl {int} -- Seconds a probe result stays valid (default: {30})
+        timeout {int} -- Timeout of a probe in seconds (default: {5})
+        status_folder {str} -- Folder of the cache file (default: {"~/.ssh_ipykernel"})
+        logger {logging.Logger} -- Logger to use (default: {None})
+    """
+
+    MIN_MEMORY = 1024 * 1024  # kB
+
+    def __init__(self, hosts, ttl=30, timeout=5, status_folder="~/.ssh_ipykernel", logger=None):
+        self.hosts = hosts
+        self.ttl = ttl
+        self.timeout = timeout
+        self.cache_file = os.path.join(os.path.expanduser(status_folder), "hosts.json")
+        self._logger = setup_logging("HostSelector") if logger is None else logger
+
+    @staticmethod
+    def score(probe):
+        """Rank a probe result, lower is better
+
+        Load and ssh_ipykernels per cpu, a penalty for low available memory and the probe rtt.
+
+        Arguments:
+            probe {HostProbe} -- probe result
+
+        Returns:
+            float -- score
+        """
+        score = (probe.load + probe.kernels) / probe.cpus + probe.rtt
+        if probe.mem_available < HostSelector.MIN_MEMORY:
+            score += 10
+        return score
+
+    def _load_cache(self):
+        try:
+            with open(self.cache_file, "r") as fd:
+                cache = json.load(fd)
+        except (OSError, ValueError):
+            return {}
+        now = time.time()
+        return {
+            host: entry
+            for host, entry in cache.items()
+            if isinstance(entry, dict)
+            and all(field in entry for field in HostProbe._fields)
+            and now - entry.get("time", 0) < self.ttl
+        }
+
+    def _save_cache(self, cache):
+        try:
+            os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
+            tmp_file = "%s.%d" % (self.cache_file, os.getpid())
+            with open(tmp_file, "w") as fd:
+                json.dump(cache, fd)
+            os.replace(tmp_file, self.cache_file)
+        except Exception as ex:
+            self._logger.warning("Cannot write %s: %s" % (self.cache_file, ex))
+
+    async def _probe(self, host):
+        start = time.monotonic()
+        result = await ssh_async(host, PROBE_SCRIPT, self.timeout)
+        rtt = time.monotonic() - start
+        if result["code"] != 0:
+            self._logger.warning("Probing %s failed: %s" % (host, result["data"]))
+            return None
+        return parse_probe(host, result["data"], rtt)
+
+    async def _probe_all(self, hosts):
+        return await asyncio.gather(*[self._probe(host) for host in hosts])
+
+    def probe(self, hosts):
+        """Probe hosts in parallel
+
+        Arguments:
+            hosts {list} -- hosts to probe
+
+        Returns:
+            list -- HostProbe results, None for hosts that could not be probed
+        """
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(self._probe_all(hosts))
+        finally:
+            loop.close()
+
+    def select(self):
+        """Select the best host, probing all candidates without a cached result
+
+        Returns:
+            str -- selected host, the first candidate if no host could be probed
+        """
+        cache = self._load_cache()
+        stale = [host for host in self.hosts if host not in cache]
+        if stale:
+            now = time.time()
+            for probe in self.probe(stale):
+                if probe is not None:
+                    cache[probe.host] = dict(probe._asdict(), time=now)
+
+        probes = [
+            HostProbe(**{field: cache[host][field] for field in HostProbe._fields})
+            for host in self.hosts
+            if host in cache
+        ]
+        if not probes:
+            self._logger.warning("No candidate host could be probed, using %s" % self.hosts[0])
+            return self.hosts[0]
+
+        best = min(probes, key=HostSelector.score)
+        for probe in probes:
+            self._logger.debug(
+                "Host %s: load=%.2f cpus=%d mem_available=%dkB kernels=%d rtt=%.3fs score=%.3f"
+                % (
+                    probe.host,
+                    probe.load,
+                    probe.cpus,
+                    probe.mem_available,
+                    probe.kernels,
+                    probe.rtt,
+                    HostSelector.score(probe),
+                )
+            )
+        self._logger.info("Selected host %s of %s" % (best.host, ",".join(self.hosts)))
+
+        cache[best.host]["kernels"] += 1
+        self._save_cache(cache)
+        return best.host
@@ -1,17 +1,18 @@
+import importlib
 import json
 import os
+from queue import Empty
 from pathlib import Path, PurePosixPath
 import platform
 import re
 import signal
 import subprocess
 import sys
+import threading
+import time
 import uuid
 
-from jupyter_client import BlockingKernelClient
-from tornado.log import LogFormatter
-
-from ssh_ipykernel.utils import setup_logging
+from ssh_ipykernel.utils import SSH, execute_async, setup_logging
 
 if platform.system() == "Windows":
     # os.environ["WEXPECT_SPAWN_CLASS"] = "SpawnPipe"
@@ -20,18 +21,24 @@ if platform.system() == "Windows":
     # from wexpect.wexpect_util import SIGNAL_CHARS  # pylint: disable=import-error
 
     is_windows = True
-    SSH = "ssh.exe"
     ENCODING = {"codepage": 65001}
     # SIGINT = SIGNAL_CHARS[signal.SIGINT]
 else:
     import pexpect as expect  # pylint: disable=import-error
 
     is_windows = False
-    SSH = "ssh"
     ENCODING = {"encoding": "utf-8"}
     # SIGINT = signal.SIGINT
 
+from .activity import ActivityTracker
+from .console import Console
+from .heartbeat import HeartbeatMonitor
+from .multiplex import SshMaster
+from .preflight import Preflight
 from .status import Status
+from .supervisor import OutputPump, Supervisor
+from .telemetry import TelemetrySampler
+from .timing import PhaseTimer
 
 
 # No tabs, no multiline, quote { and } !
@@ -48,11 +55,141 @@ ports = json.dumps({{k:v for k,v in ci.items() if "_port" in k}})
 print(ports)
 """
 
+# No tabs, no multiline, quote { and } !
+# Writes the connection file, reports pid and ports and then replaces itself with the kernel,
+# so the pid stays valid and only one remote python interpreter is started
+BOOTSTRAP_SCRIPT = """
+import json
+import os
+import sys
+fname = os.path.expanduser("{fname}")
+from jupyter_client import write_connection_file
+write_connection_file(fname=fname, ip="{ip}", key=b"{key}", transport="{transport}", signature_scheme="{signature_scheme}", kernel_name="{kernel_name}")
+fd = open(fname, "r")
+ci = json.loads(fd.read())
+fd.close()
+ports = json.dumps({{k:v for k,v in ci.items() if "_port" in k}})
+print("SSH_IPYKERNEL_BOOTSTRAP %d %s" % (os.getpid(), ports), flush=True)
+os.execv(sys.executable, [sys.executable, "-m", "ipykernel_launcher", "-f", fname])
+"""
+
+BOOTSTRAP_PATTERN = re.compile(r"SSH_IPYKERNEL_BOOTSTRAP (\d+) (\{.*?\})")
+
+# No tabs, no multiline, quote { and } !
+# Reports the pid and then replaces itself with the kernel (without importing jupyter_client)
+LAUNCH_SCRIPT = """
+import os
+import sys
+print("SSH_IPYKERNEL_PID %d" % os.getpid(), flush=True)
+os.execv(sys.executable, [sys.executable, "-m", "ipykernel_launcher", "-f", "{fname}"])
+"""
+
+PID_PATTERN = re.compile(r"SSH_IPYKERNEL_PID (\d+)")
+
+# No tabs, no multiline, quote { and } !
+# ipc transport: the connection info is known upfront (hex encoded to survive shell quoting).
+# The sockets live in a private folder owned by the ssh user, also when the kernel runs via sudo
+IPC_SETUP_SCRIPT = """
+import os
+os.makedirs("{folder}", mode=0o700, exist_ok=True)
+os.chown("{folder}", int(os.environ.get("SUDO_UID", -1)), int(os.environ.get("SUDO_GID", -1)))
+os.umask(0o077 if os.environ.get("SUDO_UID") is None else 0)
+fd = os.fdopen(os.open("{fname}", os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "w")
+fd.write(bytes.fromhex("{info}").decode("utf-8"))
+fd.close()
+"""
+
+IPC_LAUNCH_SCRIPT = IPC_SETUP_SCRIPT + LAUNCH_SCRIPT
+
+# Runs via exec (see SshKernel._exec_command), so multiline statements are fine.
+# Detaches the kernel from the ssh session: the remote kernel survives a lost connection
+DETACH_SCRIPT = """
+import os
+import sys
+pid = os.fork()
+if pid > 0:
+    print("SSH_IPYKERNEL_PID %d" % pid, flush=True)
+    os._exit(0)
+os.setsid()
+null = os.open(os.devnull, os.O_RDONLY)
+log = os.open("{log}", os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+os.dup2(null, 0)
+os.dup2(log, 1)
+os.dup2(log, 2)
+os.execv(sys.executable, [sys.executable, "-m", "ipykernel_launcher", "-f", "{fname}"])
+"""
+
+# Runs via exec (see SshKernel._exec_command).
+# Verifies that the detached kernel still runs (pid and key) and streams its log until it exits
+MONITOR_SCRIPT = """
+import json
+import os
+import sys
+import time
+pid = {pid}
+def alive():
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    try:
+        with open("/proc/%d/cmdline" % pid, "rb") as fd:
+            return b"{fname}" in fd.read()
+    except OSError:
+        return True
+def cleanup():
+    for name in ("{fname}", "{log}"):
+        try:
+            os.remove(name)
+        except OSError:
+            pass
+try:
+    with open("{fname}") as fd:
+        key = json.load(fd)["key"]
+except (OSError, ValueError, KeyError):
+    key = None
+if key != "{key}":
+    print("SSH_IPYKERNEL_GONE", flush=True)
+    sys.exit(0)
+if not alive():
+    cleanup()
+    print("SSH_IPYKERNEL_GONE", flush=True)
+    sys.exit(0)
+print("SSH_IPYKERNEL_ATTACHED %d" % pid, flush=True)
+out = sys.stdout.buffer
+with open("{log}", "rb") as fd:
+    fd.seek(0, {whence})
+    while True:
+        data = fd.read(65536)
+        if data:
+            out.write(data)
+            out.flush()
+        elif alive():
+            time.sleep(0.2)
+        else:
+            break
+cleanup()
+"""
+
+MONITOR_PATTERN = re.compile(r"SSH_IPYKERNEL_(ATTACHED|GONE)")
+
+IPC_PORTS = {"shell_port": 1, "iopub_port": 2, "stdin_port": 3, "control_port": 4, "hb_port": 5}
+
 
 class SshKernelException(Exception):
     pass
 
 
+def _prefetch(module):
+    try:
+        importlib.import_module(module)
+    except ImportError:
+        # reported by the actual import
+        pass
+
+
 class SshKernel:
     """Remote ipykernel via SSH
 
@@ -71,8 +208,26 @@ class SshKernel:
             timeout {int} -- SSH connection timeout (default: {5})
             env {str} -- Environment variables passd to the ipykernel "VAR1=VAL1 VAR2=VAL2" (default: {""})
             ssh_config {str} -- Path to the local SSH config file (default: {Path.home() / ".ssh" / "config"})
+            multiplex {bool} -- Run all SSH operations over one ControlMaster connection (default: {False})
+            persist {int} -- Seconds the master connection outlives its last session (default: {60})
+            bootstrap {bool} -- Allocate ports and start ipykernel in one remote process (default: {False})
+            ready_timeout {int} -- Deadline in seconds for the remote kernel to answer (default: {60})
+            console_size {int} -- Bytes of recent remote output to keep (default: {65536})
+            ipc {bool} -- Run the remote kernel with ipc transport and forward to its unix sockets (default: {False})
+            detach {bool} -- Detach the remote kernel from the ssh session and reconnect if it drops (default: {False})
+            reconnect_timeout {int} -- Seconds to keep reconnecting to a detached kernel (default: {600})
+            preflight {bool} -- Check the remote environment before starting (default: {True})
+            preflight_ttl {int} -- Seconds to cache a successful check, 0 disables the cache (default: {3600})
+            cull_idle {int} -- Seconds without activity after which an idle remote kernel is shut down, 0 disables culling (default: {0})
+            telemetry_interval {int} -- Seconds between resource samples of the remote kernel, 0 disables sampling (default: {0})
+            heartbeat_interval {float} -- Seconds between heartbeat pings, 0 disables the heartbeat monitor (default: {1.0})
+            interrupt_mode {str} -- "message" sends an interrupt_request over the control channel, "signal" a SIGINT (default: {"signal"})
     """
 
+    CULL_GRACE = 30
+    INTERRUPT_TIMEOUT = 2
+    CONTROL_POLL = 0.05
+
     def __init__(
         self,
         host,
@@ -86,6 +241,20 @@ class SshKernel:
         verbose=False,
         msg_interval=30,
         logger=None,
+        multiplex=False,
+        persist=60,
+        bootstrap=False,
+        ready_timeout=60,
+        console_size=Console.CAPACITY,
+        ipc=False,
+        detach=False,
+        reconnect_timeout=600,
+        preflight=True,
+        preflight_ttl=3600,
+        cull_idle=0,
+        telemetry_interval=0,
+        heartbeat_interval=1.0,
+        interrupt_mode="signal",
     ):
         self.host = host
         self.connection_info = connection_info
@@ -100,11 +269,32 @@ class SshKernel:
         self.quiet = quiet
         self.verbose = verbose
 
+        self.bootstrap = bootstrap
+        self.ready_timeout = ready_timeout
+        self.ipc = ipc
+        self.detach = detach and not is_windows
+        self.reconnect_timeout = reconnect_timeout
+        self.cull_idle = cull_idle
+        self.interrupt_mode = interrupt_mode
+        self.activity = None
+        self.culled = None
+        if self.bootstrap and (self.ipc or self.detach):
+            # both start the kernel in one remote process anyway
+            self.bootstrap = False
+
         self._connection = None
+        self._tunnel = None
+        self.supervisor = None
+        self._tunnels = []
+        # interrupts run outside of the supervisor loop, which also shuts down culled kernels.
+        # Held only for single socket operations, so the loop never waits for an interrupt_reply
+        self._control_lock = threading.Lock()
 
         self.remote_ports = {}
         self.uuid = str(uuid.uuid4())
         self.fname = "/tmp/.ssh_ipykernel_%s.json" % self.uuid  # POSIX path
+        self.ipc_folder = "/tmp/.ssh_ipykernel_%s" % self.uuid  # POSIX path
+        self.log_file = "/tmp/.ssh_ipykernel_%s.log" % self.uuid  # POSIX path
 
         if logger is None:
             self._logger = setup_logging("SshKernel")
@@ -114,11 +304,49 @@ class SshKernel:
         self._logger.debug("Remote kernel info file: {0}".format(self.fname))
         self._logger.debug("Local connection info: {0}".format(connection_info))
 
+        # jupyter_client is only needed once the kernel runs, import it while ssh is busy
+        threading.Thread(target=_prefetch, args=("jupyter_client",), daemon=True).start()
+
         self.kernel_pid = 0
-        self.status = Status(connection_info, self._logger)
+        self.timer = PhaseTimer()
+        self.status = Status(connection_info, self._logger, host=host)
+        self.console = Console(self.status.hash, self._logger, capacity=console_size, owner=True)
         self.msg_interval = int(msg_interval / timeout)
         self.msg_counter = 0
 
+        self._preflight = None
+        if preflight:
+            self._preflight = Preflight(
+                host, self.python_full_path, self._logger, sudo=sudo, ttl=preflight_ttl
+            )
+
+        self.telemetry = None
+        if telemetry_interval > 0 and not is_windows:
+            # sampled from the supervisor loop, the Windows expect loop has no event loop
+            self.telemetry = TelemetrySampler(
+                host,
+                self._logger,
+                interval=telemetry_interval,
+                timeout=max(10, timeout),
+                execute=self._ssh_async,
+            )
+
+        self.heartbeat = None
+        if heartbeat_interval > 0 and not is_windows:
+            self.heartbeat = HeartbeatMonitor(
+                connection_info, self._logger, interval=heartbeat_interval
+            )
+
+        self._master = None
+        if multiplex:
+            self._master = SshMaster(
+                host,
+                ssh_config=self.ssh_config,
+                timeout=timeout,
+                persist=persist,
+                logger=self._logger,
+            )
+
     def _execute(self, cmd):
         try:
             result = subprocess.check_output(cmd)
@@ -126,16 +354,99 @@ class SshKernel:
         except subprocess.CalledProcessError as e:
             return e.returncode, e.args
 
+    def _ssh_args(self):
+        return [] if self._master is None else self._master.ssh_args()
+
+    def _mark_once(self, phase):
+        if phase not in self.timer.marks:
+            self.timer.mark(phase)
+
     def _ssh(self, cmd):
-        return self._execute([SSH, self.host, cmd])
+        start = time.monotonic()
+        result = self._execute([SSH] + self._ssh_args() + [self.host, cmd])
+        if result[0] != 255:
+            # ssh exits with 255 if it could not connect
+            self._mark_once(PhaseTimer.CONNECT)
+        if self._master is not None:
+            self._master.log_saved("Remote command", time.monotonic() - start)
+        return result
+
+    async def _ssh_async(self, cmd, timeout):
+        # same ssh config and master connection as the session
+        args = ["-F", str(self.ssh_config)] + self._ssh_args() + [self.host, cmd]
+        return await execute_async([SSH] + args, timeout)
+
+    def connect(self):
+        """Start the SSH master connection if multiplexing is enabled
+
+        Returns:
+            bool -- True if remote operations will be multiplexed
+        """
+        if self._master is None:
+            return False
+        if not self._master.available:
+            self._master.start()
+            if self._master.available:
+                self._mark_once(PhaseTimer.CONNECT)
+        return self._master.available
+
+    def run_preflight(self):
+        """Check the remote environment unless a recent check succeeded (see Preflight)
+
+        Raises:
+            SshKernelException: The reason why the kernel cannot be started
+
+        Returns:
+            dict -- remote python, ipykernel and jupyter_client versions (empty if disabled)
+        """
+        if self._preflight is None:
+            return {}
+        result = self._preflight.cached()
+        if result is not None:
+            self._logger.debug("Using cached preflight result %s" % result)
+            return result
+
+        self.connect()
+        start = time.monotonic()
+        code, output = self._ssh(self._preflight.command())
+        output = output.decode("utf-8", "replace") if isinstance(output, bytes) else str(output)
+        result, error = self._preflight.evaluate(code, output)
+        if error is not None:
+            self.status.set_connect_failed(sudo=self.sudo)
+            raise SshKernelException(error)
+
+        self._preflight.store(result)
+        self._logger.info(
+            "Preflight ok in %.3fs: python %s, ipykernel %s, jupyter_client %s"
+            % (
+                time.monotonic() - start,
+                result["python"],
+                result["ipykernel"],
+                result["jupyter_client"],
+            )
+        )
+        return result
+
+    def launch_failed(self):
+        """Forget the cached preflight result, the environment may have changed
+        """
+        if self._preflight is not None:
+            self._preflight.invalidate()
 
     def close(self):
         """Close pcssh connection
         """
+        if self._master is not None:
+            self._master.cancel_forwards(self._tunnels)
+        if self._tunnel is not None and self._tunnel.isalive():
+            self._tunnel.terminate(force=True)
+            self._logger.debug("Ssh tunnel connection closed")
         if self._connection is not None:  # and self._connection.isalive():
             if self._connection.isalive():
                 self._connection.logout()
                 self._logger.debug("Ssh connection closed")
+            if self.activity is not None:
+                self.activity.stop()
             if self.kc.is_alive():
                 self.kc.stop_channels()
                 self._logger.debug("Kernel client channels stopped")
@@ -146,9 +457,19 @@ class SshKernel:
         The remote ports will be returned as json and stored to built the SSH tunnels later.
         The pxssh connection will be closed at the end.
 
+        With ipc transport no remote ports need to be allocated and nothing is executed remotely,
+        the connection info file is written by IPC_LAUNCH_SCRIPT.
+
         Raises:
             SshKernelException: "Could not create kernel_info file"
         """
+        if self.ipc:
+            self.remote_ports = dict(IPC_PORTS)
+            self.timer.mark(PhaseTimer.CONNECTION_INFO)
+            self._logger.debug("Remote ipc sockets in %s" % self.ipc_folder)
+            return
+
+        self.connect()
         self._logger.info("Creating remote connection info")
         script = KERNEL_SCRIPT.format(fname=self.fname, **self.connection_info)
 
@@ -159,6 +480,7 @@ class SshKernel:
         result = self._ssh(cmd)
         self._logger.debug(result)
         if result[0] == 0:
+            self.timer.mark(PhaseTimer.CONNECTION_INFO)
             self.remote_ports = json.loads(result[1].decode("utf-8"))
             self._logger.debug(
                 "Local ports  = %s"
@@ -169,49 +491,306 @@ class SshKernel:
             self.status.set_unreachable(self.kernel_pid, self.sudo)
             raise SshKernelException("Could not create kernel_info file")
 
+    def _remote_command(self, command):
+        sudo = "sudo " if self.sudo else ""
+        env = "" if self.env is None else " ".join(self.env)
+        return "{sudo} {env} {python} {command}".format(
+            sudo=sudo, env=env, python=self.python_full_path, command=command
+        )
+
+    def _exec_command(self, script):
+        """Get the remote command to run a multiline python script
+        The script is hex encoded, so it needs no quoting and may contain any statement.
+
+        Arguments:
+            script {str} -- python source
+
+        Returns:
+            str -- remote command
+        """
+        code = script.strip().encode("utf-8").hex()
+        return self._remote_command("-c 'exec(bytes.fromhex(\"{}\").decode())'".format(code))
+
+    def _ssh_spawn_args(self):
+        if self.quiet:
+            return ["-q"]
+        elif self.verbose:
+            return ["-v"]
+        else:
+            return []
+
+    def _remote_connection_info(self):
+        """Get the connection info of the remote kernel with ipc transport
+
+        Returns:
+            dict -- connection info with the ipc socket path prefix as ip
+        """
+        info = dict(self.connection_info)
+        info.update(IPC_PORTS, transport="ipc", ip="%s/kernel" % self.ipc_folder)
+        return info
+
+    def _tunnel_args(self):
+        ssh_tunnels = []
+        for port_name in self.remote_ports.keys():
+            if self.ipc:
+                # streamlocal forwarding: local TCP port to the remote unix socket "<ip>-<port>"
+                target = "{ip}-{port}".format(
+                    ip=self._remote_connection_info()["ip"], port=self.remote_ports[port_name]
+                )
+            else:
+                target = "127.0.0.1:%d" % self.remote_ports[port_name]
+            ssh_tunnels += [
+                "-L",
+                "{local_port}:{target}".format(
+                    local_port=self.connection_info[port_name], target=target
+                ),
+            ]
+        return ssh_tunnels
+
+    def _bootstrap_kernel(self):
+        """Start the remote kernel via BOOTSTRAP_SCRIPT and forward its ports
+        One remote process writes the connection file, reports its pid and the remote ports
+        and execs into ipykernel. The tunnels are set up as soon as the ports line arrives,
+        via the master connection if available, else via a separate "ssh -N" session.
+
+        Raises:
+            SshKernelException: "Could not bootstrap remote kernel"
+        """
+        self.connect()
+        self._logger.info("Bootstrapping remote kernel")
+        script = BOOTSTRAP_SCRIPT.format(fname=self.fname, **self.connection_info)
+        cmd = self._remote_command("-c '{}'".format("; ".join(script.strip().split("\n"))))
+        args = self._ssh_spawn_args()
+        args += ["-t", "-F", str(self.ssh_config)] + self._ssh_args() + [self.host, cmd]
+        self._logger.debug("%s %s" % (SSH, " ".join(args)))
+
+        self._connection = expect.spawn(SSH, args=args, timeout=self.timeout, **ENCODING)
+        try:
+            self._connection.logfile_read = self.console
+            self._connection.expect(BOOTSTRAP_PATTERN, timeout=max(self.timeout, 30))
+        except (expect.TIMEOUT, expect.EOF):
+            self._logger.error(self._connection.before)
+            self.status.set_unreachable(self.kernel_pid, self.sudo)
+            raise SshKernelException("Could not bootstrap remote kernel")
+
+        self._mark_once(PhaseTimer.CONNECT)
+        self.timer.mark(PhaseTimer.CONNECTION_INFO)
+        self.kernel_pid = int(self._connection.match.group(1))
+        self.remote_ports = json.loads(self._connection.match.group(2))
+        self._logger.debug("Remote kernel pid %d" % self.kernel_pid)
+        self._logger.debug("Remote ports = %s" % self.remote_ports)
+
+        self._tunnels = self._tunnel_args()
+        if self._master is not None and self._master.forward(self._tunnels):
+            self._logger.info("Set up ssh tunnels over master connection")
+        else:
+            self._logger.info("Setting up ssh tunnels")
+            args = self._ssh_spawn_args()
+            args += ["-N", "-F", str(self.ssh_config)] + self._ssh_args()
+            args += self._tunnels + [self.host]
+            self._logger.debug("%s %s" % (SSH, " ".join(args)))
+            self._tunnel = expect.spawn(SSH, args=args, timeout=self.timeout, **ENCODING)
+            self._tunnel.logfile_read = self.console
+
+    def _start_detached(self):
+        """Start the remote kernel detached from the ssh session via DETACH_SCRIPT and attach to it
+        The kernel runs in its own session with its output going to a remote log file, so it
+        survives a lost ssh connection.
+
+        Raises:
+            SshKernelException: "Could not start detached remote kernel"
+        """
+        self.connect()
+        self._logger.info("Starting detached remote kernel")
+        script = DETACH_SCRIPT.format(fname=self.fname, log=self.log_file)
+        if self.ipc:
+            info = json.dumps(self._remote_connection_info()).encode("utf-8").hex()
+            setup = IPC_SETUP_SCRIPT.format(fname=self.fname, folder=self.ipc_folder, info=info)
+            script = setup + script
+        code, output = self._ssh(self._exec_command(script))
+        match = PID_PATTERN.search(output.decode("utf-8", "replace")) if code == 0 else None
+        if match is None:
+            self._logger.error(output)
+            raise SshKernelException("Could not start detached remote kernel")
+        self.kernel_pid = int(match.group(1))
+        self._logger.debug("Remote kernel pid %d" % self.kernel_pid)
+
+        self._tunnels = self._tunnel_args()
+        if not self.reattach(initial=True):
+            raise SshKernelException("Detached remote kernel exited right after start")
+
+    def reattach(self, initial=False):
+        """Attach to the detached remote kernel via MONITOR_SCRIPT
+        The remote side verifies pid and key of the kernel and streams its log into the new
+        ssh session, which also carries the tunnels (unless the master connection does).
+
+        Keyword Arguments:
+            initial {bool} -- First attach after the start, streams the whole log (default: {False})
+
+        Raises:
+            SshKernelException: "Could not reach <host>"
+
+        Returns:
+            bool -- True if attached, False if the remote kernel is gone
+        """
+        if self._connection is not None:
+            self._connection.close(force=True)
+
+        forward = initial
+        if self._master is not None and not initial and not self._master.check():
+            # the master connection was lost as well, and its forwards with it
+            self._master.available = False
+            forward = True
+        tunnels = self._tunnels
+        if self.connect() and (not forward or self._master.forward(self._tunnels)):
+            tunnels = []
+
+        script = MONITOR_SCRIPT.format(
+            pid=self.kernel_pid,
+            fname=self.fname,
+            log=self.log_file,
+            key=self.connection_info["key"],
+            whence=0 if initial else 2,
+        )
+        args = self._ssh_spawn_args()
+        args += ["-t", "-F", str(self.ssh_config)] + self._ssh_args()
+        args += ["-o", "ServerAliveInterval=%d" % self.timeout, "-o", "ServerAliveCountMax=3"]
+        args += tunnels + [self.host, self._exec_command(script)]
+        self._logger.debug("%s %s" % (SSH, " ".join(args)))
+
+        self._connection = expect.spawn(SSH, args=args, timeout=self.timeout, **ENCODING)
+        self._connection.logfile_read = self.console
+        try:
+            self._connection.expect(MONITOR_PATTERN, timeout=max(self.timeout, 30))
+        except (expect.TIMEOUT, expect.EOF):
+            self._connection.close(force=True)
+            raise SshKernelException("Could not reach %s" % self.host)
+        self._mark_once(PhaseTimer.CONNECT)
+        return self._connection.match.group(1) == "ATTACHED"
+
+    def session_lost(self):
+        """Check whether the ssh session of a detached kernel ended because the connection dropped
+
+        Returns:
+            bool -- True if the connection dropped, False if the remote kernel exited
+        """
+        self._connection.close(force=True)
+        return self._connection.exitstatus != 0
+
+    def signal_remote_kernel(self, sig):
+        """Send a signal to the remote kernel process over a separate ssh command
+
+        Arguments:
+            sig {int} -- signal number
+
+        Returns:
+            bool -- True if the signal was delivered
+        """
+        cmd = "kill -{sig} {pid}".format(sig=int(sig), pid=self.kernel_pid)
+        if self.sudo:
+            cmd = "sudo " + cmd
+        return self._ssh(cmd)[0] == 0
+
     def kernel_client(self):
+        from jupyter_client import BlockingKernelClient
+
         self.kc = BlockingKernelClient()
         self.kc.load_connection_info(self.connection_info)
         self.kc.start_channels()
 
-    def kernel_init(self):
-        done = False
-        if self.check_alive(show_pid=False):
-            i = 0
-            while not done:
+    def _wait_for_pid(self):
+        """Read the remote kernel pid reported by LAUNCH_SCRIPT from the SSH session
+
+        Raises:
+            SshKernelException: "Remote kernel did not report its pid"
+        """
+        try:
+            self._connection.expect(PID_PATTERN, timeout=self.ready_timeout)
+        except (expect.TIMEOUT, expect.EOF):
+            self._logger.error(self._connection.before)
+            raise SshKernelException("Remote kernel did not report its pid")
+        self._mark_once(PhaseTimer.CONNECT)
+        self.kernel_pid = int(self._connection.match.group(1))
+        self._logger.debug("Remote kernel pid %d" % self.kernel_pid)
+
+    def wait_for_ready(self):
+        """Wait until the remote kernel answers a kernel_info_request
+        The request is repeated with exponential backoff (50ms up to 2s), since requests sent
+        before the tunnels and the kernel sockets are up can get lost. The first heartbeat or
+        reply is the first traffic through the tunnels and marks them as up.
+
+        Raises:
+            SshKernelException: "Remote kernel not ready within <ready_timeout>s"
+        """
+        deadline = time.monotonic() + self.ready_timeout
+        delay = 0.05
+        msg_ids = set()
+        while True:
+            msg_ids.add(self.kc.kernel_info())
+            wait_until = min(time.monotonic() + delay, deadline)
+            while time.monotonic() < wait_until:
+                if (
+                    PhaseTimer.FIRST_HEARTBEAT not in self.timer.marks
+                    and self.kc.hb_channel.is_beating()
+                ):
+                    self._mark_once(PhaseTimer.TUNNEL_UP)
+                    self.timer.mark(PhaseTimer.FIRST_HEARTBEAT)
                 try:
-                    i += 1
-                    self._logger.debug("Retrieving kernel pid, attempt %d" % i)
-                    result = self.kc.execute_interactive(
-                        "import os",
-                        user_expressions={"pid": "os.getpid()"},
-                        store_history=False,
-                        silent=True,
-                        timeout=2,
-                    )
-                    self._logger.debug("result = %s" % str(result["content"]))
-                    self.kernel_pid = int(
-                        result["content"]["user_expressions"]["pid"]["data"]["text/plain"]
-                    )
-                    self._logger.debug("Remote kernel pid %d" % self.kernel_pid)
-                    done = True
-                except Exception as ex:
-                    msg = str(ex)
-                    if msg == "Timeout waiting for output":
-                        self._logger.warning("Warning: {}".format(msg))
-                        if i > 5:
-                            self._logger.error("Max attempts (5) reached, stopping")
-                            raise SshKernelException("Could not initialize kernel")
-                            break
-                    else:
-                        self._logger.error("Warning: {}".format(str(ex)))
-        return done
+                    reply = self.kc.get_shell_msg(timeout=min(0.05, delay))
+                except Empty:
+                    continue
+                if reply["parent_header"].get("msg_id") in msg_ids:
+                    self._mark_once(PhaseTimer.TUNNEL_UP)
+                    self._mark_once(PhaseTimer.FIRST_HEARTBEAT)
+                    self._logger.debug("Remote kernel ready after %d request(s)" % len(msg_ids))
+                    return
+            if time.monotonic() >= deadline:
+                raise SshKernelException("Remote kernel not ready within %ds" % self.ready_timeout)
+            delay = min(2 * delay, 2.0)
+
+    def _execute_pid(self):
+        result = self.kc.execute_interactive(
+            "import os",
+            user_expressions={"pid": "os.getpid()"},
+            store_history=False,
+            silent=True,
+            timeout=self.ready_timeout,
+        )
+        return int(result["content"]["user_expressions"]["pid"]["data"]["text/plain"])
+
+    def kernel_init(self):
+        """Wait for the remote kernel to be ready and make sure its pid is known
+        The pid is reported by the launch process, the execute round trip is only a fallback.
+
+        Returns:
+            bool -- True if the kernel is ready
+        """
+        if not self.check_alive(show_pid=False):
+            return False
+
+        self.wait_for_ready()
+        if self.kernel_pid == 0:
+            self._logger.debug("Retrieving kernel pid via execute request")
+            self.kernel_pid = self._execute_pid()
+            self._logger.debug("Remote kernel pid %d" % self.kernel_pid)
+        self.timer.mark(PhaseTimer.PID_KNOWN)
+        return True
 
     def kernel_customize(self):
         pass
 
+    def log_timings(self):
+        """Log the startup phase timings as one line and persist them with the status
+        """
+        self._logger.info("Startup timings host=%s %s" % (self.host, self.timer.format()))
+        self.status.set_timings(self.timer.as_dict())
+
     def check_alive(self, show_pid=True):
         alive = self._connection.isalive() and self.kc.is_alive()
+        if self.heartbeat is not None:
+            alive = alive and self.heartbeat.responsive
+        if self._tunnel is not None:
+            alive = alive and self._tunnel.isalive()
         if show_pid:
             msg = "Remote kernel ({}, pid = {}) is {}alive".format(
                 self.host, self.kernel_pid, "" if alive else "not "
@@ -226,12 +805,103 @@ class SshKernel:
         self.msg_counter += 1
         return alive
 
+    def check_idle(self):
+        """Publish the kernel activity to the status record and cull the kernel if it is idle
+        for cull_idle seconds. Busy kernels are never culled.
+        """
+        if self.activity is None:
+            return
+        self.status.set_activity(self.activity.last_activity, self.activity.busy)
+        interrupt = self.activity.take_interrupt()
+        if interrupt is not None:
+            self.status.add_interrupt(*interrupt)
+        if self.culled is not None:
+            if time.monotonic() - self.culled > SshKernel.CULL_GRACE:
+                # the kernel ignored the shutdown request
+                self._logger.warning("Remote kernel did not shut down, terminating it")
+                self.signal_remote_kernel(signal.SIGTERM)
+                self.culled = time.monotonic()
+            return
+
+        idle = self.activity.idle_time()
+        if self.cull_idle > 0 and idle >= self.cull_idle:
+            self._logger.warning(
+                "Shutting down remote kernel (%s, pid = %d) after %ds without activity"
+                % (self.host, self.kernel_pid, idle)
+            )
+            self.culled = time.monotonic()
+            with self._control_lock:
+                self.kc.shutdown()
+
+    def _wait_for_shutdown(self):
+        """Keep the launcher of a culled kernel alive until Jupyter shuts it down,
+        a dead launcher would make Jupyter restart the kernel right away
+        """
+        self._logger.info("Remote kernel was culled, restart the kernel to continue")
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        try:
+            while True:
+                try:
+                    time.sleep(3600)
+                except KeyboardInterrupt:
+                    self._logger.warning("Remote kernel was culled, restart the kernel to continue")
+        except SystemExit:
+            pass
+
+    def send_interrupt_request(self):
+        """Send an interrupt_request over the forwarded control channel and wait for the reply
+
+        Returns:
+            bool -- True if the kernel answered within INTERRUPT_TIMEOUT seconds
+        """
+        msg = self.kc.session.msg("interrupt_request", {})
+        with self._control_lock:
+            self.kc.control_channel.send(msg)
+        deadline = time.monotonic() + SshKernel.INTERRUPT_TIMEOUT
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            # poll in short steps, a cull shutdown must not wait for the whole timeout
+            try:
+                with self._control_lock:
+                    reply = self.kc.control_channel.get_msg(
+                        timeout=min(remaining, SshKernel.CONTROL_POLL)
+                    )
+            except Empty:
+                continue
+            # skip late replies of earlier requests
+            if reply["parent_header"].get("msg_id") == msg["header"]["msg_id"]:
+                return reply["content"].get("status") == "ok"
+
     def interrupt_kernel(self):
-        if self._connection.isalive():
+        """Interrupt the remote kernel. In interrupt_mode "message" an interrupt_request is sent
+        over the control channel, which needs no extra ssh command or pty, and a signal only if
+        the kernel does not answer (ipykernel < 5 does not know interrupt_request).
+        """
+        if self.interrupt_mode == "message":
+            if self.activity is not None:
+                self.activity.interrupted("message")
+            self._logger.warning("Sending interrupt_request to remote kernel")
+            if self.send_interrupt_request():
+                return
+            self._logger.warning(
+                "No interrupt_reply within %ds, sending a signal" % SshKernel.INTERRUPT_TIMEOUT
+            )
+
+        if self.detach:
+            # the detached kernel is not attached to the pty of the session
+            self._logger.warning("Sending interrupt to remote kernel")
+            if self.activity is not None:
+                self.activity.interrupted("signal")
+            self.signal_remote_kernel(signal.SIGINT)
+        elif self._connection.isalive():
             if is_windows:
                 self._logger.warning('On Windows use "Interrupt remote kernel" button')
             else:
                 self._logger.warning("Sending interrupt to remote kernel")
+                if self.activity is not None:
+                    self.activity.interrupted("signal")
                 self._connection.sendintr()  # send SIGINT
 
     def start_kernel_and_tunnels(self):
@@ -239,82 +909,114 @@ class SshKernel:
         A new pxssh connection will be created that will
         - set up the necessary ssh tunnels between remote kernel ports and local kernel ports
         - start the ipykernel on the remote host
+        In bootstrap and ipc mode the remote connection info is written by the kernel process,
+        in detach mode the kernel runs detached from the ssh session (see reattach).
         """
-        self._logger.info("Setting up ssh tunnels")
-
-        ssh_tunnels = []
-        for port_name in self.remote_ports.keys():
-            ssh_tunnels += [
-                "-L",
-                "{local_port}:127.0.0.1:{remote_port}".format(
-                    local_port=self.connection_info[port_name],
-                    remote_port=self.remote_ports[port_name],
-                ),
-            ]
-
-        self._logger.info("Starting remote kernel")
-
-        # Build remote command
-        sudo = "sudo " if self.sudo else ""
-
-        if self.env is not None:
-            env = " ".join(self.env)
-        cmd = "{sudo} {env} {python} -m ipykernel_launcher -f {fname}".format(
-            sudo=sudo, env=env, python=self.python_full_path, fname=self.fname
-        )
-
-        # Build ssh command with all flags and tunnels
-        if self.quiet:
-            args = ["-q"]
-        elif self.verbose:
-            args = ["-v"]
-        else:
-            args = []
-        args += ["-t", "-F", str(self.ssh_config)] + ssh_tunnels + [self.host, cmd]
-
-        self._logger.debug("%s %s" % (SSH, " ".join(args)))
-
         try:
-            # Start the child process
-            self._connection = expect.spawn(SSH, args=args, timeout=self.timeout, **ENCODING)
-            # subprocess.check_output([SSH] + args)
+            if self.detach:
+                self._start_detached()
+            elif self.bootstrap:
+                self._bootstrap_kernel()
+            else:
+                self._logger.info("Setting up ssh tunnels")
+                self._tunnels = self._tunnel_args()
+
+                self._logger.info("Starting remote kernel")
+                if self.ipc:
+                    info = json.dumps(self._remote_connection_info()).encode("utf-8").hex()
+                    script = IPC_LAUNCH_SCRIPT.format(
+                        fname=self.fname, folder=self.ipc_folder, info=info
+                    )
+                else:
+                    script = LAUNCH_SCRIPT.format(fname=self.fname)
+                cmd = self._remote_command("-c '{}'".format("; ".join(script.strip().split("\n"))))
+
+                # Build ssh command with all flags and tunnels
+                args = self._ssh_spawn_args()
+                args += ["-t", "-F", str(self.ssh_config)] + self._ssh_args()
+                args += self._tunnels + [self.host, cmd]
+                self._logger.debug("%s %s" % (SSH, " ".join(args)))
+
+                # Start the child process
+                self._connection = expect.spawn(SSH, args=args, timeout=self.timeout, **ENCODING)
+                self._connection.logfile_read = self.console
+                self._wait_for_pid()
             #
             # get blocking kernel client
             self.kernel_client()
             # initialize it
             if self.kernel_init():
+                self.activity = ActivityTracker(self.kc, self._logger)
+                self.activity.start()
                 self.status.set_running(self.kernel_pid, self.sudo)
                 # run custom code if part of sub class
                 self.kernel_customize()
+                self.timer.mark(PhaseTimer.CUSTOMIZED)
             else:
                 self.status.set_connect_failed(sudo=self.sudo)
+            self.log_timings()
         except Exception as e:
             tb = sys.exc_info()[2]
+            self.status.set_connect_failed(self.kernel_pid, self.sudo)
+            self.launch_failed()
             self._logger.error(str(e.with_traceback(tb)))
             self._logger.error("Cannot contiune, exiting")
             sys.exit(1)
 
-        prompt = re.compile(r"\n")
+        if is_windows:
+            self._expect_loop()
+        else:
+            self.supervisor = Supervisor(self)
+            if self.telemetry is not None:
+                self.supervisor.add_task(
+                    lambda: self.telemetry.run(
+                        lambda: self.kernel_pid if self.status.is_running() else 0,
+                        self.status.add_telemetry,
+                    )
+                )
+            self.supervisor.run()
+
+        self.close()
+        if self.culled is not None:
+            self.status.set_kernel_killed(self.kernel_pid, self.sudo)
+            self._wait_for_shutdown()
+        self.status.close()
+        # keep the console output of the kernel for the server extension
+        self.console.detach()
+
+    def _expect_loop(self):
+        """Supervise the SSH session by polling with pexpect (wexpect has no pty file descriptor)
+        """
+        pump = OutputPump(self._logger)
+        if self._connection.buffer:
+            pump.feed(0, self._connection.buffer)
+        last_check = time.monotonic()
 
         while True:
             try:
-                # Wait for prompt
-                self._connection.expect(prompt)
-                # print the outputs
-                self._logger.info(self._connection.before.strip("\r\n"))
+                pump.flush()
+                # read everything available instead of matching line by line
+                pump.feed(0, self._connection.read_nonblocking(Supervisor.CHUNK_SIZE, self.timeout))
+                # continuous output must not delay the liveness checks
+                if time.monotonic() - last_check >= self.timeout:
+                    self.check_alive()
+                    self.check_idle()
+                    last_check = time.monotonic()
 
             except KeyboardInterrupt:
                 self.interrupt_kernel()
                 self.check_alive()
+                last_check = time.monotonic()
 
             except expect.TIMEOUT:
                 self.check_alive()
+                self.check_idle()
+                last_check = time.monotonic()
 
             except expect.EOF:
+                pump.feed(0, "", final=True)
+                pump.flush()
                 # The program has exited
                 self._logger.info("The program has exited.")
                 self.status.set_down(self.kernel_pid, self.sudo)
                 break
-
-        self.close()
-        self.status.close()
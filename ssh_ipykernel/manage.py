@@ -10,47 +10,38 @@ from jupyter_client import kernelspec as ks
 PREFIX = "ssh_"
 
 
-def add_kernel(
+def kernel_spec(
     host,
     display_name,
     local_python_path,
     remote_python_path,
     env=None,
     sudo=False,
-    system=False,
     timeout=5,
     module="ssh_ipykernel",
     opt_args=None,
+    multiplex=False,
+    bootstrap=False,
+    ipc=False,
+    detach=False,
+    cull_idle=0,
+    interrupt_mode="signal",
 ):
-    """Add a new kernel specification for an SSH Kernel
-
-    Arguments:
-        host {str} -- host where the remote ipykernel should be started
-        display_name {str} -- Display name for the new kernel
-        local_python_path {[type]} -- Local python path to be used (without bin/python)
-        remote_python_path {[type]} -- Remote python path to be used (without bin/python)
-
-    Keyword Arguments:
-        env {str} -- Environment variables passd to the ipykernel "VAR1=VAL1 VAR2=VAL2" (default: {""})
-        sudo {bool} -- Start ipykernel as root if necessary (default: {False})
-        system {bool} -- Create kernelspec as user (False) or system (True) (default: {False})
-        timeout {int} -- SSH connection timeout (default: {5})
+    """Create the kernel name and kernel.json content of an SSH Kernel (see add_kernel)
 
     Returns:
-        [type] -- [description]
+        tuple -- (kernel name, kernel.json dict)
     """
 
     def simplify(name):
         return re.sub(r"[^a-zA-Z0-9\-\.\_]", "", name)
 
-    if system:
-        username = False
-    else:
-        username = getpass.getuser()
-
     if opt_args is None:
         opt_args = []
 
+    if isinstance(host, (list, tuple)):
+        host = ",".join(host)
+
     kernel_json = {
         "argv": [
             local_python_path,
@@ -75,9 +66,44 @@ def add_kernel(
     if sudo:
         kernel_json["argv"].insert(-2, "-s")
 
+    if multiplex:
+        kernel_json["argv"].insert(-2, "--multiplex")
+
+    if bootstrap:
+        kernel_json["argv"].insert(-2, "--bootstrap")
+
+    if ipc:
+        kernel_json["argv"].insert(-2, "--ipc")
+
+    if detach:
+        kernel_json["argv"].insert(-2, "--detach")
+
+    if cull_idle > 0:
+        kernel_json["argv"].insert(-2, "--cull-idle")
+        kernel_json["argv"].insert(-2, str(cull_idle))
+
+    if interrupt_mode != "signal":
+        # Jupyter keeps signalling the launcher, which sends the interrupt_request
+        kernel_json["argv"].insert(-2, "--interrupt-mode")
+        kernel_json["argv"].insert(-2, interrupt_mode)
+
     kernel_name = "{prefix}_{display_name}".format(
         prefix=PREFIX, host=host, display_name=simplify(display_name)
     )
+    return kernel_name, kernel_json
+
+
+def install_kernel(kernel_name, kernel_json, system=False):
+    """Install (or replace) a kernel specification
+
+    Arguments:
+        kernel_name {str} -- Name of the kernel
+        kernel_json {dict} -- Content of kernel.json
+
+    Keyword Arguments:
+        system {bool} -- Create kernelspec as user (False) or system (True) (default: {False})
+    """
+    username = False if system else getpass.getuser()
     with tempfile.TemporaryDirectory() as temp_dir:
         os.chmod(temp_dir, 0o755)
 
@@ -86,6 +112,68 @@ def add_kernel(
 
         ks.install_kernel_spec(temp_dir, kernel_name, user=username, replace=True)
 
+
+def add_kernel(
+    host,
+    display_name,
+    local_python_path,
+    remote_python_path,
+    env=None,
+    sudo=False,
+    system=False,
+    timeout=5,
+    module="ssh_ipykernel",
+    opt_args=None,
+    multiplex=False,
+    bootstrap=False,
+    ipc=False,
+    detach=False,
+    cull_idle=0,
+    interrupt_mode="signal",
+):
+    """Add a new kernel specification for an SSH Kernel
+
+    Arguments:
+        host {str} -- host where the remote ipykernel should be started, or a list (or comma
+                      separated string) of equivalent hosts to pick the least loaded one from
+        display_name {str} -- Display name for the new kernel
+        local_python_path {[type]} -- Local python path to be used (without bin/python)
+        remote_python_path {[type]} -- Remote python path to be used (without bin/python)
+
+    Keyword Arguments:
+        env {str} -- Environment variables passd to the ipykernel "VAR1=VAL1 VAR2=VAL2" (default: {""})
+        sudo {bool} -- Start ipykernel as root if necessary (default: {False})
+        system {bool} -- Create kernelspec as user (False) or system (True) (default: {False})
+        timeout {int} -- SSH connection timeout (default: {5})
+        multiplex {bool} -- Reuse one SSH master connection for all remote operations (default: {False})
+        bootstrap {bool} -- Allocate ports and start ipykernel in one remote process (default: {False})
+        ipc {bool} -- Use ipc transport remotely and forward to its unix sockets (default: {False})
+        detach {bool} -- Detach the remote kernel from the ssh session and reconnect (default: {False})
+        cull_idle {int} -- Seconds after which an idle remote kernel is shut down (default: {0})
+        interrupt_mode {str} -- "message" to interrupt over the control channel (default: {"signal"})
+
+    Returns:
+        [type] -- [description]
+    """
+
+    kernel_name, kernel_json = kernel_spec(
+        host,
+        display_name,
+        local_python_path,
+        remote_python_path,
+        env=env,
+        sudo=sudo,
+        timeout=timeout,
+        module=module,
+        opt_args=opt_args,
+        multiplex=multiplex,
+        bootstrap=bootstrap,
+        ipc=ipc,
+        detach=detach,
+        cull_idle=cull_idle,
+        interrupt_mode=interrupt_mode,
+    )
+    install_kernel(kernel_name, kernel_json, system=system)
     return kernel_name
 
 
@@ -117,12 +205,82 @@ if __name__ == "__main__":
         nargs="*",
         help="environment variables for the remote kernel in the form: VAR1=value1 VAR2=value2",
     )
+    optional.add_argument(
+        "--multiplex",
+        "-m",
+        action="store_true",
+        help="reuse one SSH master connection (ControlMaster) for all remote operations",
+    )
+    optional.add_argument(
+        "--bootstrap",
+        "-b",
+        action="store_true",
+        help="allocate ports and start the kernel in one remote process",
+    )
+    optional.add_argument(
+        "--ipc",
+        "-i",
+        action="store_true",
+        help="use ipc transport remotely and forward local ports to its unix sockets",
+    )
+    optional.add_argument(
+        "--detach",
+        action="store_true",
+        help="keep the remote kernel running when the ssh connection drops and reconnect",
+    )
+    optional.add_argument(
+        "--cull-idle",
+        type=int,
+        help="shut down the remote kernel after this many seconds without activity (0: never)",
+        default=0,
+    )
+    optional.add_argument(
+        "--interrupt-mode",
+        choices=["signal", "message"],
+        help="interrupt with a signal or with an interrupt_request on the control channel",
+        default="signal",
+    )
+
+    bulk = parser.add_argument_group("bulk mode")
+    bulk.add_argument(
+        "--inventory",
+        "-I",
+        help="install, update and remove kernelspecs to match an inventory file (yaml or json)",
+    )
+    bulk.add_argument(
+        "--concurrency", type=int, default=32, help="parallel remote checks (default: 32)"
+    )
+    bulk.add_argument(
+        "--no-validate", action="store_true", help="do not check the remote interpreters"
+    )
+    bulk.add_argument(
+        "--no-prune", action="store_true", help="keep ssh_ kernelspecs missing in the inventory"
+    )
+    bulk.add_argument("--dry-run", "-n", action="store_true", help="only report the changes")
+    bulk.add_argument("--verbose", "-v", action="store_true", help="list the changed kernels")
 
-    required = parser.add_argument_group("required arguments")
-    required.add_argument("--host", "-H", required=True, help="remote host")
-    required.add_argument("--python", "-p", required=True, help="remote python_path")
+    required = parser.add_argument_group("required arguments (without --inventory)")
+    required.add_argument("--host", "-H", help="remote host or comma separated candidate hosts")
+    required.add_argument("--python", "-p", help="remote python_path")
     args = parser.parse_args()
 
+    if args.inventory is not None:
+        from ssh_ipykernel.provision import Provisioner, load_inventory, print_summary
+
+        provisioner = Provisioner(
+            concurrency=args.concurrency,
+            validate=not args.no_validate,
+            prune=not args.no_prune,
+            dry_run=args.dry_run,
+        )
+        summary = provisioner.run(load_inventory(args.inventory))
+        print_summary(summary, verbose=args.verbose)
+        sys.exit(1 if summary["failed"] else 0)
+
+    if args.host is None or args.python is None:
+        parser.error("the following arguments are required: --host/-H, --python/-p")
+
+    env = None
     if args.env:
         env = " ".join(args.env)
 
@@ -134,4 +292,10 @@ if __name__ == "__main__":
         sudo=args.sudo,
         env=env,
         timeout=args.timeout,
+        multiplex=args.multiplex,
+        bootstrap=args.bootstrap,
+        ipc=args.ipc,
+        detach=args.detach,
+        cull_idle=args.cull_idle,
+        interrupt_mode=args.interrupt_mode,
     )
@@ -0,0 +1,257 @@
+import sys
+import threading
+
+from ssh_ipykernel.status import Status
+
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    items = []
+    for name, value in zip(names, values):
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        items.append('%s="%s"' % (name, value))
+    return "{%s}" % ",".join(items)
+
+
+class Metric:
+    """Base class of a labelled metric in the Prometheus text format
+
+    Arguments:
+        name {str} -- metric name
+        documentation {str} -- HELP text
+
+    Keyword Arguments:
+        labels {list} -- label names (default: {None})
+    """
+
+    TYPE = "untyped"
+
+    def __init__(self, name, documentation, labels=None):
+        self.name = name
+        self.documentation = documentation
+        self.labels = [] if labels is None else list(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def clear(self):
+        with self._lock:
+            self._values = {}
+
+    def samples(self):
+        """Get all samples
+
+        Returns:
+            list -- (name suffix, label names, label values, value) tuples
+        """
+        with self._lock:
+            return [("", self.labels, key, value) for key, value in sorted(self._values.items())]
+
+    def render(self):
+        lines = [
+            "# HELP %s %s" % (self.name, self.documentation),
+            "# TYPE %s %s" % (self.name, self.TYPE),
+        ]
+        for suffix, names, values, value in self.samples():
+            labels = _format_labels(names, values)
+            lines.append("%s%s%s %s" % (self.name, suffix, labels, repr(float(value))))
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    TYPE = "counter"
+
+    def inc(self, labels=(), value=1):
+        with self._lock:
+            key = tuple(labels)
+            self._values[key] = self._values.get(key, 0) + value
+
+
+class Gauge(Metric):
+    TYPE = "gauge"
+
+    def set(self, labels=(), value=0):
+        with self._lock:
+            self._values[tuple(labels)] = value
+
+
+class Histogram(Metric):
+    TYPE = "histogram"
+
+    def __init__(self, name, documentation, labels=None, buckets=None):
+        super().__init__(name, documentation, labels)
+        self.buckets = sorted(buckets) + [float("inf")]
+
+    def observe(self, labels=(), value=0):
+        with self._lock:
+            key = tuple(labels)
+            if key not in self._values:
+                self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            counts, _, _ = entry = self._values[key]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def samples(self):
+        result = []
+        names = self.labels + ["le"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._values.items()):
+                for bound, bucket_count in zip(self.buckets, counts):
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    result.append(("_bucket", names, key + (le,), bucket_count))
+                result.append(("_sum", self.labels, key, total))
+                result.append(("_count", self.labels, key, count))
+        return result
+
+
+class MetricsCollector:
+    """Metrics of the ssh_ipykernels managed by a jupyter server
+
+    Kernel gauges are recomputed from the status records at every scrape, counters and
+    histograms accumulate over the lifetime of the server.
+    """
+
+    LATENCY_BUCKETS = [0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+    STARTUP_BUCKETS = [0.5, 1, 2, 3, 5, 7.5, 10, 15, 20, 30, 60, 120]
+    FAILED_STATES = ("UNREACHABLE", "CONNECT_FAILED", "KERNEL_KILLED")
+
+    def __init__(self):
+        self.kernels = Gauge(
+            "ssh_ipykernel_kernels", "Number of ssh kernels per host and state", ["host", "state"]
+        )
+        self.starts = Counter(
+            "ssh_ipykernel_kernel_starts_total", "Number of ssh kernels started", ["host"]
+        )
+        self.failures = Counter(
+            "ssh_ipykernel_kernel_failures_total",
+            "Number of ssh kernels that entered a failed state",
+            ["host", "state"],
+        )
+        self.startup = Histogram(
+            "ssh_ipykernel_startup_seconds",
+            "Startup duration of ssh kernels",
+            ["host"],
+            MetricsCollector.STARTUP_BUCKETS,
+        )
+        self.interrupts = Histogram(
+            "ssh_ipykernel_interrupt_seconds",
+            "Latency of interrupt requests",
+            ["host", "mode"],
+            MetricsCollector.LATENCY_BUCKETS,
+        )
+        self.interrupt_idle = Histogram(
+            "ssh_ipykernel_interrupt_idle_seconds",
+            "Time from an interrupt until the interrupted kernel was idle",
+            ["host", "mode"],
+            MetricsCollector.LATENCY_BUCKETS,
+        )
+        self.heartbeat = Histogram(
+            "ssh_ipykernel_heartbeat_rtt_seconds",
+            "Heartbeat round trip times of ssh kernels (sampled at scrape time)",
+            ["host"],
+            MetricsCollector.LATENCY_BUCKETS,
+        )
+        self.memory = Gauge(
+            "ssh_ipykernel_kernel_memory_bytes",
+            "Resident memory of remote kernels and their child processes (latest sample)",
+            ["host", "kernel_id"],
+        )
+        self.cpu = Gauge(
+            "ssh_ipykernel_kernel_cpu_percent",
+            "Cpu utilization of remote kernels in percent of one core (latest sample)",
+            ["host", "kernel_id"],
+        )
+        self.pool = Gauge(
+            "ssh_ipykernel_pool", "Kernel pool state per kernelspec", ["kernel_name", "kind"]
+        )
+        self.metrics = [
+            self.kernels,
+            self.starts,
+            self.failures,
+            self.startup,
+            self.interrupts,
+            self.interrupt_idle,
+            self.heartbeat,
+            self.memory,
+            self.cpu,
+            self.pool,
+        ]
+        self._seen = {}
+        self._interrupts = {}
+
+    def observe_interrupt(self, host, latency, mode="signal"):
+        self.interrupts.observe((host, mode), latency)
+
+    def collect(self, kernels):
+        """Update the metrics from the status records of the running kernels
+
+        Arguments:
+            kernels {list} -- SshKernelInfo objects of all running ssh kernels
+        """
+        self.kernels.clear()
+        self.memory.clear()
+        self.cpu.clear()
+        counts = {}
+        seen = {}
+        interrupts = {}
+        for kernel in kernels:
+            record = kernel.status.read()
+            if record is None:
+                continue
+            state = Status.NAMES.get(record.state, "UNKNOWN")
+            counts[(kernel.host, state)] = counts.get((kernel.host, state), 0) + 1
+
+            previous = self._seen.get(kernel.kernel_id)
+            if previous is None:
+                self.starts.inc((kernel.host,))
+            if state in MetricsCollector.FAILED_STATES and state != previous:
+                self.failures.inc((kernel.host, state))
+            if record.heartbeat_rtt > 0:
+                self.heartbeat.observe((kernel.host,), record.heartbeat_rtt)
+            if (previous is None or previous == "STARTING") and state == "RUNNING":
+                total = kernel.status.get_timings().get("total")
+                if total is not None:
+                    self.startup.observe((kernel.host,), total)
+            if record.interrupts > self._interrupts.get(kernel.kernel_id, 0):
+                # only the latest of several interrupts between two scrapes is known
+                mode = Status.INTERRUPT_MODES.get(record.interrupt_mode, "unknown")
+                self.interrupt_idle.observe((kernel.host, mode), record.interrupt_latency)
+            interrupts[kernel.kernel_id] = record.interrupts
+            telemetry = kernel.status.get_telemetry()
+            if telemetry:
+                self.memory.set((kernel.host, kernel.kernel_id), telemetry[-1].rss)
+                self.cpu.set((kernel.host, kernel.kernel_id), telemetry[-1].cpu)
+            seen[kernel.kernel_id] = state
+        self._seen = seen
+        self._interrupts = interrupts
+
+        for (host, state), count in counts.items():
+            self.kernels.set((host, state), count)
+
+        self.pool.clear()
+        pool = self._pool()
+        if pool is not None:
+            for kernel_name, stats in pool.stats().items():
+                for kind, value in stats.items():
+                    self.pool.set((kernel_name, kind), value)
+
+    def _pool(self):
+        # only report the pool if the pool kernel manager is in use
+        pool_module = sys.modules.get("ssh_ipykernel.pool")
+        if pool_module is None or not pool_module.KernelPool.initialized():
+            return None
+        return pool_module.KernelPool.instance()
+
+    def render(self):
+        """Render all metrics in the Prometheus text exposition format
+
+        Returns:
+            str -- metrics text
+        """
+        return "\n".join(metric.render() for metric in self.metrics) + "\n"
+
+
+METRICS = MetricsCollector()
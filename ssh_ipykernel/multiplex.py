@@ -0,0 +1,174 @@
+import os
+import subprocess
+import time
+
+from ssh_ipykernel.utils import SSH, control_path, is_windows, setup_logging
+
+
+class SshMaster:
+    """Shared SSH ControlMaster connection to a remote host
+
+    Only the first operation against a host pays the SSH handshake, all later commands,
+    the kernel session and the tunnels of a kernel are multiplexed over the master socket.
+    The socket is shared per host and local user (see utils.control_path). The master is
+    started with ControlPersist, so it terminates by itself once the last session using it
+    has been idle for `persist` seconds.
+
+    Arguments:
+        host {str} -- remote host
+
+    Keyword Arguments:
+        ssh_config {str} -- Path to the local SSH config file (default: {None})
+        timeout {int} -- SSH connection timeout (default: {5})
+        persist {int} -- Seconds the master stays alive after the last session closed (default: {60})
+        logger {logging.Logger} -- Logger to use (default: {None})
+    """
+
+    def __init__(self, host, ssh_config=None, timeout=5, persist=60, logger=None):
+        self.host = host
+        self.ssh_config = ssh_config
+        self.timeout = timeout
+        self.persist = persist
+        self.control_path = control_path(host)
+        self.available = False
+        self.handshake_time = 0.0
+
+        if logger is None:
+            self._logger = setup_logging("SshMaster")
+        else:
+            self._logger = logger
+
+    def _control(self, command, args=None):
+        cmd = [SSH, "-o", "ControlPath=%s" % self.control_path, "-O", command]
+        if args is not None:
+            cmd += args
+        cmd.append(self.host)
+        try:
+            result = subprocess.run(
+                cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=self.timeout
+            )
+            return result.returncode == 0
+        except subprocess.TimeoutExpired:
+            return False
+
+    def check(self):
+        """Check whether a master connection is listening on the control socket
+
+        Returns:
+            bool -- True if the master is alive
+        """
+        if is_windows or not os.path.exists(self.control_path):
+            return False
+        return self._control("check")
+
+    def start(self):
+        """Start a master connection unless one is already running for host
+
+        Returns:
+            bool -- True if a master connection can be used
+        """
+        if is_windows:
+            self._logger.info("SSH connection multiplexing is not supported on Windows")
+            return False
+
+        if self.check():
+            self._logger.info("Reusing SSH master connection %s" % self.control_path)
+            self.available = True
+            return True
+
+        os.makedirs(os.path.dirname(self.control_path), exist_ok=True)
+        cmd = [SSH]
+        if self.ssh_config is not None:
+            cmd += ["-F", str(self.ssh_config)]
+        cmd += [
+            "-o",
+            "ControlMaster=yes",
+            "-o",
+            "ControlPath=%s" % self.control_path,
+            "-o",
+            "ControlPersist=%d" % self.persist,
+            "-o",
+            "ConnectTimeout=%d" % self.timeout,
+            "-N",
+            "-f",
+            self.host,
+        ]
+        self._logger.debug(" ".join(cmd))
+
+        start = time.monotonic()
+        try:
+            result = subprocess.run(
+                cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=2 * self.timeout
+            )
+            self.available = result.returncode == 0
+        except subprocess.TimeoutExpired:
+            self.available = False
+        self.handshake_time = time.monotonic() - start
+
+        if self.available:
+            self._logger.info(
+                "SSH master connection to %s established in %.3fs"
+                % (self.host, self.handshake_time)
+            )
+        else:
+            self._logger.warning(
+                "Could not start SSH master connection to %s, using direct connections" % self.host
+            )
+        return self.available
+
+    def ssh_args(self):
+        """Get SSH options for a client connection to reuse the master
+
+        Returns:
+            list -- SSH options, empty if no master is available
+        """
+        if not self.available:
+            return []
+        return ["-o", "ControlMaster=no", "-o", "ControlPath=%s" % self.control_path]
+
+    def log_saved(self, what, elapsed):
+        """Log the duration of a multiplexed operation and the handshake time it saved
+
+        Arguments:
+            what {str} -- Description of the operation
+            elapsed {float} -- Duration of the operation in seconds
+        """
+        if self.available:
+            self._logger.info(
+                "%s took %.3fs over master connection (saved handshake of ~%.3fs)"
+                % (what, elapsed, self.handshake_time)
+            )
+        else:
+            self._logger.info("%s took %.3fs" % (what, elapsed))
+
+    def forward(self, tunnels):
+        """Add port forwards to the master connection without opening a new session
+
+        Arguments:
+            tunnels {list} -- SSH tunnel arguments, e.g. ["-L", "1234:127.0.0.1:5678"]
+
+        Returns:
+            bool -- True if the forwards were established
+        """
+        if not self.available:
+            return False
+        start = time.monotonic()
+        result = self._control("forward", tunnels)
+        if result:
+            self.log_saved("Port forwarding", time.monotonic() - start)
+        return result
+
+    def cancel_forwards(self, tunnels):
+        """Remove port forwards of a client session from the master
+
+        Forwards requested by multiplexed sessions are owned by the master and would otherwise
+        stay bound until the master exits.
+
+        Arguments:
+            tunnels {list} -- SSH tunnel arguments, e.g. ["-L", "1234:127.0.0.1:5678"]
+        """
+        if self.available and tunnels and self.check():
+            if self._control("cancel", tunnels):
+                self._logger.debug("Cancelled forwards %s" % " ".join(tunnels))
+            else:
+                self._logger.warning("Could not cancel forwards %s" % " ".join(tunnels))
@@ -0,0 +1,313 @@
+"""Pool of pre-warmed remote kernels per kernelspec
+
+Enable it in the jupyter server config, e.g.
+
+    c.MappingKernelManager.kernel_manager_class = "ssh_ipykernel.pool.AsyncSshPoolKernelManager"
+    c.KernelPool.size = 2
+    c.KernelPool.kernel_names = ["ssh__ssh_btest_demo_abc_"]
+
+(use "ssh_ipykernel.pool.SshPoolKernelManager" for the synchronous MappingKernelManager)
+"""
+import atexit
+import os
+import subprocess
+import threading
+import time
+import uuid
+
+from jupyter_client.connect import write_connection_file
+from jupyter_client.ioloop import AsyncIOLoopKernelManager, IOLoopKernelManager
+from jupyter_client.kernelspec import KernelSpecManager
+from jupyter_core.paths import jupyter_runtime_dir
+from traitlets import Float, Integer, List, Unicode
+from traitlets.config import SingletonConfigurable
+
+from ssh_ipykernel.manage import PREFIX
+from ssh_ipykernel.status import Status
+
+
+class PooledKernel:
+    """A started, idle ssh_ipykernel launcher process
+
+    Arguments:
+        kernel_name {str} -- Name of the kernelspec
+        process {subprocess.Popen} -- The launcher process
+        connection_file {str} -- Local connection file of the kernel
+        connection_info {dict} -- Local connection info of the kernel
+    """
+
+    def __init__(self, kernel_name, process, connection_file, connection_info):
+        self.kernel_name = kernel_name
+        self.process = process
+        self.connection_file = connection_file
+        self.connection_info = connection_info
+        self.created = time.monotonic()
+
+    def age(self):
+        return time.monotonic() - self.created
+
+    def is_alive(self):
+        return self.process.poll() is None
+
+    def shutdown(self):
+        """Terminate the launcher, which ends the ssh session and the remote kernel
+        """
+        if self.is_alive():
+            self.process.terminate()
+            try:
+                self.process.wait(5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        if os.path.exists(self.connection_file):
+            os.remove(self.connection_file)
+
+
+class KernelPool(SingletonConfigurable):
+    """Keeps `size` idle, fully started remote kernels per kernelspec
+
+    Kernels are started in the background with the argv of their kernelspec and handed out
+    by acquire() once the status record of the launcher says RUNNING.
+    """
+
+    size = Integer(1, config=True, help="Number of idle kernels kept per kernelspec")
+    kernel_names = List(
+        Unicode(),
+        config=True,
+        help="Kernelspecs to pool (default: all ssh_ipykernel kernelspecs)",
+    )
+    max_idle_age = Float(
+        3600, config=True, help="Seconds after which an idle kernel is replaced by a fresh one"
+    )
+    start_timeout = Float(120, config=True, help="Seconds to wait for a pooled kernel to start")
+    maintain_interval = Float(10, config=True, help="Seconds between pool maintenance runs")
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._idle = {}
+        self._starting = {}
+        self.hits = {}
+        self.misses = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._maintainer = None
+        self.kernel_spec_manager = KernelSpecManager(parent=self)
+
+    def manages(self, kernel_name):
+        """Check whether kernels of a kernelspec are pooled
+
+        Arguments:
+            kernel_name {str} -- Name of the kernelspec
+
+        Returns:
+            bool -- True if the kernelspec is pooled
+        """
+        if self.size <= 0:
+            return False
+        if self.kernel_names:
+            return kernel_name in self.kernel_names
+        return kernel_name.startswith(PREFIX + "_")
+
+    def pooled_names(self):
+        if self.kernel_names:
+            return list(self.kernel_names)
+        return [name for name in self.kernel_spec_manager.find_kernel_specs() if self.manages(name)]
+
+    def start(self):
+        """Fill the pools of all pooled kernelspecs and start the maintenance thread
+        """
+        if self._maintainer is not None:
+            return
+        self.log.info("Starting kernel pool (size %d)" % self.size)
+        atexit.register(self.shutdown)
+        self._maintainer = threading.Thread(target=self._maintain, daemon=True)
+        self._maintainer.start()
+
+    def acquire(self, kernel_name):
+        """Hand out an idle kernel and trigger a refill
+
+        Arguments:
+            kernel_name {str} -- Name of the kernelspec
+
+        Returns:
+            PooledKernel -- An idle kernel or None if the pool is empty
+        """
+        self.start()
+        kernel = None
+        with self._lock:
+            idle = self._idle.get(kernel_name, [])
+            while idle and kernel is None:
+                candidate = idle.pop(0)
+                if candidate.is_alive():
+                    kernel = candidate
+            if kernel is None:
+                self.misses[kernel_name] = self.misses.get(kernel_name, 0) + 1
+            else:
+                self.hits[kernel_name] = self.hits.get(kernel_name, 0) + 1
+
+        self.log.info(
+            "Kernel pool %s for %s (hits=%d, misses=%d)"
+            % (
+                "hit" if kernel is not None else "miss",
+                kernel_name,
+                self.hits.get(kernel_name, 0),
+                self.misses.get(kernel_name, 0),
+            )
+        )
+        self.refill(kernel_name)
+        return kernel
+
+    def refill(self, kernel_name):
+        """Start kernels in the background until the pool of kernel_name is full
+
+        Arguments:
+            kernel_name {str} -- Name of the kernelspec
+        """
+        with self._lock:
+            idle = len(self._idle.get(kernel_name, []))
+            missing = self.size - idle - self._starting.get(kernel_name, 0)
+            if missing <= 0:
+                return
+            self._starting[kernel_name] = self._starting.get(kernel_name, 0) + missing
+
+        for _ in range(missing):
+            threading.Thread(target=self._start_kernel, args=(kernel_name,), daemon=True).start()
+
+    def _start_kernel(self, kernel_name):
+        try:
+            kernel = self._launch(kernel_name)
+        except Exception as ex:
+            self.log.error("Cannot start pooled kernel for %s: %s" % (kernel_name, ex))
+            kernel = None
+
+        with self._lock:
+            self._starting[kernel_name] -= 1
+            if kernel is not None:
+                if self._stopped.is_set():
+                    kernel.shutdown()
+                else:
+                    self._idle.setdefault(kernel_name, []).append(kernel)
+
+    def _launch(self, kernel_name):
+        spec = self.kernel_spec_manager.get_kernel_spec(kernel_name)
+        connection_file = os.path.join(
+            jupyter_runtime_dir(), "kernel-ssh-pool-%s.json" % uuid.uuid4()
+        )
+        connection_file, connection_info = write_connection_file(
+            connection_file, key=str(uuid.uuid4()).encode(), kernel_name=kernel_name
+        )
+        argv = [arg.format(connection_file=connection_file) for arg in spec.argv]
+        env = os.environ.copy()
+        env.update(spec.env or {})
+
+        start = time.monotonic()
+        process = subprocess.Popen(argv, env=env, stdin=subprocess.DEVNULL)
+        kernel = PooledKernel(kernel_name, process, connection_file, connection_info)
+
+        status = Status(connection_info, self.log)
+        try:
+            while time.monotonic() - start < self.start_timeout:
+                if not kernel.is_alive():
+                    break
+                if status.is_running():
+                    elapsed = time.monotonic() - start
+                    self.log.info("Pooled kernel for %s started in %.3fs" % (kernel_name, elapsed))
+                    return kernel
+                time.sleep(0.1)
+        finally:
+            status.detach()
+
+        kernel.shutdown()
+        raise RuntimeError("kernel did not reach RUNNING within %ds" % self.start_timeout)
+
+    def _maintain(self):
+        while not self._stopped.is_set():
+            expired = []
+            with self._lock:
+                for kernel_name, idle in self._idle.items():
+                    keep = []
+                    for kernel in idle:
+                        if kernel.is_alive() and kernel.age() < self.max_idle_age:
+                            keep.append(kernel)
+                        else:
+                            expired.append(kernel)
+                    self._idle[kernel_name] = keep
+            for kernel in expired:
+                self.log.info("Replacing idle pooled kernel for %s" % kernel.kernel_name)
+                kernel.shutdown()
+
+            for kernel_name in self.pooled_names():
+                self.refill(kernel_name)
+            self._stopped.wait(self.maintain_interval)
+
+    def stats(self):
+        """Get the pool state per kernelspec
+
+        Returns:
+            dict -- kernel_name => {"idle", "starting", "hits", "misses"}
+        """
+        with self._lock:
+            names = set(self._idle) | set(self._starting) | set(self.hits) | set(self.misses)
+            return {
+                name: {
+                    "idle": len(self._idle.get(name, [])),
+                    "starting": self._starting.get(name, 0),
+                    "hits": self.hits.get(name, 0),
+                    "misses": self.misses.get(name, 0),
+                }
+                for name in names
+            }
+
+    def shutdown(self):
+        """Stop maintenance and terminate all idle kernels
+        """
+        self._stopped.set()
+        with self._lock:
+            idle = [kernel for kernels in self._idle.values() for kernel in kernels]
+            self._idle = {}
+        for kernel in idle:
+            kernel.shutdown()
+
+
+class SshPoolKernelManagerMixin:
+    """Adopt a pooled kernel instead of launching a new one if the pool has one
+
+    Only the first start adopts: restarts (also by the auto restarter) call start_kernel again
+    and have to keep the ports and connection file the frontends are connected to.
+    """
+
+    def _adopt_pooled_kernel(self, **kw):
+        if self._launch_args is not None:
+            # restart
+            return False
+        pool = KernelPool.instance(parent=self.parent, log=self.log)
+        if not pool.manages(self.kernel_name):
+            return False
+
+        kernel = pool.acquire(self.kernel_name)
+        if kernel is None:
+            return False
+
+        self._launch_args = kw.copy()
+        self.load_connection_info(kernel.connection_info)
+        self.connection_file = kernel.connection_file
+        self._connection_file_written = True
+        self.kernel = kernel.process
+        self.start_restarter()
+        self._connect_control_socket()
+        return True
+
+
+class SshPoolKernelManager(SshPoolKernelManagerMixin, IOLoopKernelManager):
+    """Kernel manager handing out pre-warmed kernels of pooled kernelspecs"""
+
+    def start_kernel(self, **kw):
+        if not self._adopt_pooled_kernel(**kw):
+            super().start_kernel(**kw)
+
+
+class AsyncSshPoolKernelManager(SshPoolKernelManagerMixin, AsyncIOLoopKernelManager):
+    """Async kernel manager handing out pre-warmed kernels of pooled kernelspecs"""
+
+    async def start_kernel(self, **kw):
+        if not self._adopt_pooled_kernel(**kw):
+            await super().start_kernel(**kw)
@@ -0,0 +1,165 @@
+import json
+import os
+import re
+import time
+
+# Runs via exec, prints versions of python, ipykernel and jupyter_client and whether /tmp is
+# writable. Versions come from the package metadata, which is much faster than importing
+PREFLIGHT_SCRIPT = """
+import json
+import sys
+import tempfile
+result = {"python": "%d.%d.%d" % sys.version_info[:3]}
+for name in ("ipykernel", "jupyter_client"):
+    try:
+        from importlib.metadata import version
+        result[name] = version(name)
+    except ImportError:
+        try:
+            result[name] = __import__(name).__version__
+        except Exception:
+            result[name] = None
+    except Exception:
+        result[name] = None
+try:
+    with tempfile.NamedTemporaryFile(dir="/tmp"):
+        result["tmp"] = True
+except OSError:
+    result["tmp"] = False
+print("SSH_IPYKERNEL_PREFLIGHT " + json.dumps(result))
+"""
+
+PREFLIGHT_PATTERN = re.compile(r"SSH_IPYKERNEL_PREFLIGHT (\{.*\})")
+
+
+class Preflight:
+    """Check the remote environment of a kernel with one ssh round trip and cache the result
+
+    Verifies that the interpreter exists, that ipykernel and jupyter_client are installed, that
+    /tmp is writable and, if the kernel runs as root, that sudo works without a password.
+    Successful checks are cached per (host, python path, sudo) for ttl seconds in
+    preflight.json in the status folder; failed launches invalidate the entry.
+
+    Arguments:
+        host {str} -- remote host
+        python_full_path {str} -- remote python interpreter
+        logger {logging.Logger} -- Logger to use
+
+    Keyword Arguments:
+        sudo {bool} -- Whether the kernel runs as root (default: {False})
+        ttl {int} -- Seconds a successful check stays valid, 0 disables the cache (default: {3600})
+        status_folder {str} -- Folder of the cache file (default: {"~/.ssh_ipykernel"})
+    """
+
+    def __init__(
+        self,
+        host,
+        python_full_path,
+        logger,
+        sudo=False,
+        ttl=3600,
+        status_folder="~/.ssh_ipykernel",
+    ):
+        self.host = host
+        self.python_full_path = str(python_full_path)
+        self.sudo = sudo
+        self.ttl = ttl
+        self.cache_file = os.path.join(os.path.expanduser(status_folder), "preflight.json")
+        self.key = "%s %s%s" % (host, self.python_full_path, " sudo" if sudo else "")
+        self._logger = logger
+
+    def command(self):
+        """Get the remote shell command of the check
+
+        Returns:
+            str -- remote command
+        """
+        code = PREFLIGHT_SCRIPT.strip().encode("utf-8").hex()
+        cmd = "test -x %s || { echo SSH_IPYKERNEL_PREFLIGHT_NO_PYTHON; exit 0; }; " % (
+            self.python_full_path
+        )
+        if self.sudo:
+            cmd += "sudo -n true || { echo SSH_IPYKERNEL_PREFLIGHT_NO_SUDO; exit 0; }; "
+        cmd += "{python} -c 'exec(bytes.fromhex(\"{code}\").decode())'".format(
+            python=self.python_full_path, code=code
+        )
+        return cmd
+
+    def evaluate(self, code, output):
+        """Evaluate the output of the remote check
+
+        Arguments:
+            code {int} -- exit code of the ssh command
+            output {str} -- output of the ssh command
+
+        Returns:
+            tuple -- (result dict or None, error message or None)
+        """
+        if code != 0:
+            return None, "Cannot run the check on %s (ssh exit code %d)" % (self.host, code)
+        if "SSH_IPYKERNEL_PREFLIGHT_NO_PYTHON" in output:
+            return None, "%s: %s does not exist" % (self.host, self.python_full_path)
+        if "SSH_IPYKERNEL_PREFLIGHT_NO_SUDO" in output:
+            return None, "%s: sudo requires a password" % self.host
+        match = PREFLIGHT_PATTERN.search(output)
+        if match is None:
+            return None, "%s: %s failed: %s" % (self.host, self.python_full_path, output.strip())
+
+        result = json.loads(match.group(1))
+        missing = [name for name in ("ipykernel", "jupyter_client") if result.get(name) is None]
+        if missing:
+            return result, "%s: %s not installed for %s" % (
+                self.host,
+                " and ".join(missing),
+                self.python_full_path,
+            )
+        if not result.get("tmp"):
+            return result, "%s: /tmp is not writable" % self.host
+        return result, None
+
+    def _load_cache(self):
+        try:
+            with open(self.cache_file, "r") as fd:
+                return json.load(fd)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_cache(self, cache):
+        try:
+            os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
+            tmp_file = "%s.%d" % (self.cache_file, os.getpid())
+            with open(tmp_file, "w") as fd:
+                json.dump(cache, fd)
+            os.replace(tmp_file, self.cache_file)
+        except Exception as ex:
+            self._logger.warning("Cannot write %s: %s" % (self.cache_file, ex))
+
+    def cached(self):
+        """Get the cached result of a successful check
+
+        Returns:
+            dict -- versions, None if there is no valid cache entry
+        """
+        if self.ttl <= 0:
+            return None
+        entry = self._load_cache().get(self.key)
+        if entry is None or time.time() - entry.get("time", 0) >= self.ttl:
+            return None
+        return entry
+
+    def store(self, result):
+        if self.ttl <= 0:
+            return
+        cache = self._load_cache()
+        now = time.time()
+        cache = {k: v for k, v in cache.items() if now - v.get("time", 0) < self.ttl}
+        cache[self.key] = dict(result, time=now)
+        self._save_cache(cache)
+
+    def invalidate(self):
+        """Remove the cache entry, e.g. after a failed launch
+        """
+        cache = self._load_cache()
+        if cache.pop(self.key, None) is not None:
+            self._logger.debug("Invalidated preflight cache for %s" % self.key)
+            self._save_cache(cache)
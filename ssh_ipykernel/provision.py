@@ -0,0 +1,298 @@
+"""Bulk provisioning of ssh_ipykernel kernelspecs from an inventory file (JSON or YAML)
+
+    defaults:                       # optional, apply to all kernels
+      timeout: 10
+      multiplex: true
+    kernels:
+      - hosts: [btest1, btest2]     # one kernelspec per host
+        python: [/opt/anaconda/envs/python38, /opt/anaconda/envs/python39]
+        display_name: "SSH {host}:{env}"
+        env: {VAR1: demo}
+      - host: gpu1,gpu2             # one kernelspec with candidate hosts
+        python: /opt/conda
+        sudo: true
+
+Each kernel entry expands to one kernelspec per host (hosts) and python path; {host} and {env}
+(last component of the python path) are replaced in display_name. Entries accept the options
+of add_kernel (env, sudo, timeout, multiplex, bootstrap, ipc, detach, cull_idle,
+interrupt_mode).
+
+    python -m ssh_ipykernel.manage --inventory inventory.yml [--dry-run] [--no-prune]
+"""
+import asyncio
+import hashlib
+import json
+import os
+import sys
+import time
+from pathlib import PurePosixPath
+
+from jupyter_client import kernelspec as ks
+from jupyter_core.paths import SYSTEM_JUPYTER_PATH
+
+from ssh_ipykernel.manage import PREFIX, install_kernel, kernel_spec
+from ssh_ipykernel.preflight import Preflight
+from ssh_ipykernel.utils import setup_logging, ssh_async
+
+OPTIONS = (
+    "env",
+    "sudo",
+    "timeout",
+    "multiplex",
+    "bootstrap",
+    "ipc",
+    "detach",
+    "cull_idle",
+    "interrupt_mode",
+)
+
+
+def load_inventory(filename):
+    """Load an inventory file, YAML (needs PyYAML) or JSON depending on the file extension
+
+    Arguments:
+        filename {str} -- path of the inventory
+
+    Returns:
+        dict -- inventory
+    """
+    with open(filename, "r") as fd:
+        if filename.endswith((".yml", ".yaml")):
+            try:
+                import yaml
+            except ImportError:
+                raise ValueError("PyYAML is needed for YAML inventories, use JSON or install it")
+            return yaml.safe_load(fd)
+        return json.load(fd)
+
+
+def expand_inventory(inventory):
+    """Expand the kernel entries of an inventory into one entry per kernelspec
+
+    Arguments:
+        inventory {dict} -- inventory
+
+    Returns:
+        list -- dicts with host, python, display_name and the add_kernel options
+    """
+
+    def as_list(value):
+        return list(value) if isinstance(value, (list, tuple)) else [value]
+
+    defaults = inventory.get("defaults", {})
+    result = []
+    for entry in inventory.get("kernels", []):
+        entry = dict(defaults, **entry)
+        if "hosts" in entry:
+            hosts = as_list(entry["hosts"])
+        elif "host" in entry:
+            hosts = [entry["host"]]
+        else:
+            raise ValueError("Inventory entry without host: %s" % entry)
+        if "python" not in entry:
+            raise ValueError("Inventory entry without python: %s" % entry)
+
+        for host in hosts:
+            for python in as_list(entry["python"]):
+                env_name = PurePosixPath(python).name
+                display_name = entry.get("display_name", "SSH {host}:{env}")
+                spec = {
+                    "host": host,
+                    "python": python,
+                    "display_name": display_name.format(host=host, env=env_name),
+                }
+                for option in OPTIONS:
+                    if option in entry:
+                        spec[option] = entry[option]
+                if isinstance(spec.get("env"), dict):
+                    spec["env"] = " ".join("%s=%s" % item for item in spec["env"].items())
+                result.append(spec)
+    return result
+
+
+def spec_hash(kernel_json):
+    """Hash of the canonical json of a kernelspec, independent of key order and formatting
+
+    Arguments:
+        kernel_json {dict} -- content of kernel.json
+
+    Returns:
+        str -- hex digest
+    """
+    return hashlib.sha256(json.dumps(kernel_json, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class Provisioner:
+    """Install, update and remove ssh_ipykernel kernelspecs to match an inventory
+
+    The remote interpreters are validated in parallel (at most `concurrency` ssh commands at a
+    time) with the preflight check, which also verifies ipykernel and jupyter_client. Only specs
+    whose content changed are written, specs of failed hosts are left untouched, and ssh_
+    kernelspecs in the target kernel folder that are not in the inventory are removed (prune).
+
+    Keyword Arguments:
+        local_python_path {str} -- Local python of the launcher (default: {sys.executable})
+        system {bool} -- Manage system (True) or user (False) kernelspecs (default: {False})
+        concurrency {int} -- Maximum number of parallel ssh commands (default: {32})
+        timeout {int} -- Timeout of a validation in seconds (default: {30})
+        validate {bool} -- Validate the remote interpreters (default: {True})
+        prune {bool} -- Remove ssh_ kernelspecs missing in the inventory (default: {True})
+        dry_run {bool} -- Only report the changes (default: {False})
+        logger {logging.Logger} -- Logger to use (default: {None})
+    """
+
+    def __init__(
+        self,
+        local_python_path=None,
+        system=False,
+        concurrency=32,
+        timeout=30,
+        validate=True,
+        prune=True,
+        dry_run=False,
+        logger=None,
+    ):
+        self.local_python_path = sys.executable if local_python_path is None else local_python_path
+        self.system = system
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.validate = validate
+        self.prune = prune
+        self.dry_run = dry_run
+        self._logger = setup_logging("Provisioner") if logger is None else logger
+        self.kernel_spec_manager = ks.KernelSpecManager()
+        if system:
+            self.kernels_dir = os.path.join(SYSTEM_JUPYTER_PATH[0], "kernels")
+        else:
+            self.kernels_dir = self.kernel_spec_manager.user_kernel_dir
+
+    def installed(self):
+        """Get the installed ssh_ipykernel kernelspecs of the target kernel folder
+
+        Returns:
+            dict -- kernel name => spec hash, None if the kernel.json cannot be read
+        """
+        result = {}
+        for name, folder in self.kernel_spec_manager.find_kernel_specs().items():
+            if not name.startswith(PREFIX + "_"):
+                continue
+            if os.path.dirname(os.path.abspath(folder)) != os.path.abspath(self.kernels_dir):
+                continue
+            try:
+                with open(os.path.join(folder, "kernel.json"), "r") as fd:
+                    result[name] = spec_hash(json.load(fd))
+            except (OSError, ValueError):
+                result[name] = None
+        return result
+
+    async def _check(self, semaphore, host, python, sudo):
+        preflight = Preflight(host, PurePosixPath(python) / "bin/python", self._logger, sudo=sudo)
+        if preflight.cached() is not None:
+            return None
+        async with semaphore:
+            result = await ssh_async(host, preflight.command(), self.timeout)
+        output = result["data"] if result["code"] == 0 else ""
+        versions, error = preflight.evaluate(result["code"], output)
+        if error is None:
+            preflight.store(versions)
+        return error
+
+    async def _check_all(self, checks):
+        semaphore = asyncio.Semaphore(self.concurrency)
+        return await asyncio.gather(*[self._check(semaphore, *check) for check in checks])
+
+    def check(self, specs):
+        """Validate the remote interpreters of all specs, each (host, python, sudo) once
+
+        Arguments:
+            specs {list} -- expanded inventory entries
+
+        Returns:
+            dict -- (host, python, sudo) => error message or None
+        """
+        checks = []
+        for spec in specs:
+            for host in spec["host"].split(","):
+                check = (host.strip(), spec["python"], bool(spec.get("sudo", False)))
+                if check not in checks:
+                    checks.append(check)
+        loop = asyncio.new_event_loop()
+        try:
+            errors = loop.run_until_complete(self._check_all(checks))
+        finally:
+            loop.close()
+        return dict(zip(checks, errors))
+
+    def _failures(self, spec, errors):
+        sudo = bool(spec.get("sudo", False))
+        checks = [(host.strip(), spec["python"], sudo) for host in spec["host"].split(",")]
+        return [errors[check] for check in checks if errors.get(check) is not None]
+
+    def run(self, inventory):
+        """Bring the installed kernelspecs in line with the inventory
+
+        Arguments:
+            inventory {dict} -- inventory
+
+        Returns:
+            dict -- {"created", "updated", "unchanged", "removed"} => kernel names,
+                    "failed" => kernel name => error messages, "seconds" => duration
+        """
+        start = time.monotonic()
+        specs = expand_inventory(inventory)
+        errors = self.check(specs) if self.validate else {}
+        installed = self.installed()
+
+        summary = {"created": [], "updated": [], "unchanged": [], "removed": [], "failed": {}}
+        wanted = set()
+        for spec in specs:
+            options = {option: spec[option] for option in OPTIONS if option in spec}
+            kernel_name, kernel_json = kernel_spec(
+                spec["host"],
+                spec["display_name"],
+                self.local_python_path,
+                spec["python"],
+                **options
+            )
+            if kernel_name in wanted:
+                summary["failed"][kernel_name] = ["duplicate kernel name (display_name)"]
+                self._logger.error("%s: duplicate kernel name" % kernel_name)
+                continue
+            wanted.add(kernel_name)
+            failures = self._failures(spec, errors)
+            if failures:
+                summary["failed"][kernel_name] = failures
+                for failure in failures:
+                    self._logger.error("%s: %s" % (kernel_name, failure))
+                continue
+
+            if kernel_name not in installed:
+                summary["created"].append(kernel_name)
+            elif installed[kernel_name] != spec_hash(kernel_json):
+                summary["updated"].append(kernel_name)
+            else:
+                summary["unchanged"].append(kernel_name)
+                continue
+            if not self.dry_run:
+                install_kernel(kernel_name, kernel_json, system=self.system)
+
+        if self.prune:
+            for kernel_name in sorted(set(installed) - wanted):
+                summary["removed"].append(kernel_name)
+                if not self.dry_run:
+                    self.kernel_spec_manager.remove_kernel_spec(kernel_name)
+
+        summary["seconds"] = time.monotonic() - start
+        return summary
+
+
+def print_summary(summary, verbose=False):
+    for key in ("created", "updated", "unchanged", "removed"):
+        print("%-10s %d" % (key, len(summary[key])))
+        if verbose and key != "unchanged":
+            for kernel_name in summary[key]:
+                print("    %s" % kernel_name)
+    print("%-10s %d" % ("failed", len(summary["failed"])))
+    for kernel_name, failures in sorted(summary["failed"].items()):
+        print("    %s: %s" % (kernel_name, "; ".join(failures)))
+    print("done in %.1fs" % summary["seconds"])
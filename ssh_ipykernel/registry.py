@@ -0,0 +1,295 @@
+import mmap
+import os
+import struct
+import time
+
+from ssh_ipykernel.utils import is_windows
+
+if not is_windows:
+    import fcntl
+
+
+def pid_alive(pid):
+    """Check whether a local process exists
+
+    Arguments:
+        pid {int} -- process id
+
+    Returns:
+        bool -- True if the process exists
+    """
+    if pid <= 0:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class Registry:
+    """Shared, preallocated table of status records in one memory mapped file
+
+    Layout (little endian):
+
+        0           header      magic "SIPR" 4s, version u16, reserved u16, slots u32, slot size u32
+        64 + i * SLOT_SIZE      slot i: state u32, reserved u32, key 32s (sha256 of the connection
+                                info), owner pid u64, liveness stamp f64, reserved, status record
+
+    Slots are found by open addressing with linear probing over the key, freed slots become
+    tombstones so that probing continues past them. Allocation reuses the first tombstone of the
+    probe sequence once the key is known to be absent. Tombstones that lie on no probe path of a
+    used slot are turned back into empty slots on every free, so misses stay short on a long
+    running server. Slots never move, since launchers keep writing to their slot.
+    Allocation and freeing take an exclusive flock on the file, lookups and record reads/writes
+    are lock free.
+
+    Arguments:
+        record_template {bytes} -- Initial content of the status record of a new slot
+
+    Keyword Arguments:
+        status_folder {str} -- Folder of the registry file (default: {"~/.ssh_ipykernel"})
+        slots {int} -- Number of slots of a new registry file (default: {1024})
+        logger {logging.Logger} -- Logger to use (default: {None})
+    """
+
+    MAGIC = b"SIPR"
+    VERSION = 1
+    HEADER = struct.Struct("<4sHHII")
+    HEADER_SIZE = 64
+    SLOT = struct.Struct("<II32sQd")
+    SLOT_HEADER_SIZE = 64
+
+    EMPTY = 0
+    USED = 1
+    FREED = 2
+
+    _instances = {}
+
+    def __init__(self, record_template, status_folder="~/.ssh_ipykernel", slots=1024, logger=None):
+        self._logger = logger
+        self.record_size = len(record_template)
+        self.slot_size = Registry.SLOT_HEADER_SIZE + self.record_size
+        self.record_template = record_template
+        self.filename = os.path.join(os.path.expanduser(status_folder), "registry")
+
+        os.makedirs(os.path.dirname(self.filename), exist_ok=True)
+        self._fd = os.open(self.filename, os.O_RDWR | os.O_CREAT, 0o600)
+        with self._locked():
+            if os.fstat(self._fd).st_size < Registry.HEADER_SIZE:
+                size = Registry.HEADER_SIZE + slots * self.slot_size
+                os.ftruncate(self._fd, size)
+                header = Registry.HEADER.pack(
+                    Registry.MAGIC, Registry.VERSION, 0, slots, self.slot_size
+                )
+                os.pwrite(self._fd, header, 0)
+        self.mmap = mmap.mmap(self._fd, 0)
+
+        magic, _, _, self.slots, slot_size = Registry.HEADER.unpack_from(self.mmap, 0)
+        if magic != Registry.MAGIC or slot_size != self.slot_size:
+            raise ValueError("%s is not a compatible status registry" % self.filename)
+
+    @classmethod
+    def instance(cls, record_template, status_folder="~/.ssh_ipykernel", logger=None):
+        """Get the registry of status_folder, shared by all Status objects of the process
+        """
+        folder = os.path.expanduser(status_folder)
+        if folder not in cls._instances:
+            cls._instances[folder] = cls(record_template, status_folder=folder, logger=logger)
+        return cls._instances[folder]
+
+    def _locked(self):
+        registry = self
+
+        class Lock:
+            def __enter__(self):
+                fcntl.flock(registry._fd, fcntl.LOCK_EX)
+
+            def __exit__(self, *args):
+                fcntl.flock(registry._fd, fcntl.LOCK_UN)
+
+        return Lock()
+
+    def _slot_offset(self, index):
+        return Registry.HEADER_SIZE + index * self.slot_size
+
+    def record_offset(self, index):
+        """Get the offset of the status record of a slot in the memory map
+
+        Arguments:
+            index {int} -- slot index
+
+        Returns:
+            int -- offset
+        """
+        return self._slot_offset(index) + Registry.SLOT_HEADER_SIZE
+
+    def _slot(self, index):
+        return Registry.SLOT.unpack_from(self.mmap, self._slot_offset(index))
+
+    def _probe(self, key):
+        start = int.from_bytes(key[:8], "little") % self.slots
+        for i in range(self.slots):
+            yield (start + i) % self.slots
+
+    def lookup(self, key):
+        """Find the slot of a key (lock free)
+
+        Arguments:
+            key {bytes} -- 32 byte key
+
+        Returns:
+            int -- slot index or None
+        """
+        for index in self._probe(key):
+            state, _, slot_key, _, _ = self._slot(index)
+            if state == Registry.EMPTY:
+                return None
+            if state == Registry.USED and slot_key == key:
+                return index
+        return None
+
+    def holds(self, index, key):
+        """Check whether a slot is in use for key (lock free)
+
+        Arguments:
+            index {int} -- slot index (None is allowed)
+            key {bytes} -- 32 byte key
+
+        Returns:
+            bool -- True if the slot is used by key
+        """
+        if index is None:
+            return False
+        state, _, slot_key, _, _ = self._slot(index)
+        return state == Registry.USED and slot_key == key
+
+    def allocate(self, key, owner_pid=None):
+        """Get the slot of a key, allocate a new one if necessary
+
+        Arguments:
+            key {bytes} -- 32 byte key
+
+        Keyword Arguments:
+            owner_pid {int} -- pid of the owning launcher (default: {os.getpid()})
+
+        Returns:
+            int -- slot index or None if the registry is full
+        """
+        owner_pid = os.getpid() if owner_pid is None else owner_pid
+        with self._locked():
+            index = self._allocate(key, owner_pid)
+            if index is None and self._reap() > 0:
+                index = self._allocate(key, owner_pid)
+        if index is None and self._logger is not None:
+            self._logger.error("Status registry %s is full" % self.filename)
+        return index
+
+    def _allocate(self, key, owner_pid):
+        free = None
+        for index in self._probe(key):
+            state, _, slot_key, _, _ = self._slot(index)
+            if state == Registry.USED and slot_key == key:
+                free = index
+                break
+            if state != Registry.USED and free is None:
+                free = index
+            if state == Registry.EMPTY:
+                break
+        if free is not None:
+            offset = self._slot_offset(free)
+            self.mmap[offset + Registry.SLOT_HEADER_SIZE : offset + self.slot_size] = (
+                self.record_template
+            )
+            Registry.SLOT.pack_into(
+                self.mmap, offset, Registry.USED, 0, key, owner_pid, time.time()
+            )
+        return free
+
+    def stamp(self, index):
+        """Update the liveness stamp of a slot
+
+        Arguments:
+            index {int} -- slot index
+        """
+        offset = self._slot_offset(index) + Registry.SLOT.size - 8
+        struct.pack_into("<d", self.mmap, offset, time.time())
+
+    def free(self, index):
+        """Free a slot
+
+        Arguments:
+            index {int} -- slot index
+        """
+        with self._locked():
+            self._free(index)
+
+    def _free(self, index):
+        state, _, key, _, _ = self._slot(index)
+        if state == Registry.USED:
+            Registry.SLOT.pack_into(
+                self.mmap, self._slot_offset(index), Registry.FREED, 0, key, 0, time.time()
+            )
+            self._clear_tombstones()
+
+    def _clear_tombstones(self):
+        """Turn tombstones no lookup has to probe past into empty slots (lock held)
+
+        A tombstone is needed only between the start of the probe sequence of a used slot's key
+        and that slot, lookups of keys that are not in the table may stop at any other one.
+
+        Returns:
+            int -- number of cleared tombstones
+        """
+        slots = [self._slot(index) for index in range(self.slots)]
+        needed = set()
+        for index, (state, _, key, _, _) in enumerate(slots):
+            if state == Registry.USED:
+                for probed in self._probe(key):
+                    if probed == index:
+                        break
+                    needed.add(probed)
+        count = 0
+        for index, (state, _, _, _, _) in enumerate(slots):
+            if state == Registry.FREED and index not in needed:
+                Registry.SLOT.pack_into(
+                    self.mmap, self._slot_offset(index), Registry.EMPTY, 0, b"", 0, 0.0
+                )
+                count += 1
+        return count
+
+    def used(self):
+        """Get all used slots
+
+        Returns:
+            list -- (index, key, owner pid, liveness stamp) tuples
+        """
+        result = []
+        for index in range(self.slots):
+            state, _, key, owner_pid, stamp = self._slot(index)
+            if state == Registry.USED:
+                result.append((index, key, owner_pid, stamp))
+        return result
+
+    def reap(self):
+        """Free all slots whose owning launcher process is gone
+
+        Returns:
+            int -- number of freed slots
+        """
+        with self._locked():
+            return self._reap()
+
+    def _reap(self):
+        count = 0
+        for index, _, owner_pid, _ in self.used():
+            if not pid_alive(owner_pid):
+                self._free(index)
+                count += 1
+        # tombstones of registries written before they were cleared on free
+        self._clear_tombstones()
+        if count > 0 and self._logger is not None:
+            self._logger.info("Reaped %d stale slot(s) of %s" % (count, self.filename))
+        return count
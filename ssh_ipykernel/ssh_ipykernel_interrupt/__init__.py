@@ -1 +1,5 @@
 from .interrupt_handler import SshInterruptHandler
+from .bulk_handler import SshBulkHandler
+from .metrics_handler import SshMetricsHandler
+from .console_handler import SshConsoleHandler
+from .telemetry_handler import SshTelemetryHandler
@@ -0,0 +1,170 @@
+import asyncio
+import inspect
+import json
+import signal
+import time
+
+from notebook.base.handlers import IPythonHandler
+from tornado import web
+
+from ssh_ipykernel.metrics import METRICS
+from ssh_ipykernel.utils import ssh_async, setup_logging
+
+from .interrupt_handler import SshInterruptHandler
+
+logger = setup_logging("ssh_ipykernel:bulk")
+
+# No quotes in here, it runs inside sh -c '...' when sudo is required
+BULK_SCRIPT = "for p in {pids}; do kill -{sig} $p 2>/dev/null && echo $p ok || echo $p failed; done"
+
+
+class SshBulkHandler(IPythonHandler):
+    """Interrupt or shut down many remote ssh ipykernels with one ssh command per host
+
+    POST body (json):
+        action {str} -- "interrupt" or "shutdown"
+        host {str} -- only kernels running on this host (optional)
+        ids {list} -- only these kernel ids (optional)
+
+    The response has a result for every selected kernel and every requested id. Shutdown only
+    removes kernels locally whose remote process was signalled or was already down.
+    """
+
+    timeout = 20
+    SIGNALS = {"interrupt": signal.SIGINT, "shutdown": signal.SIGTERM}
+
+    def select(self, host=None, ids=None):
+        """Select running ssh_ipykernels by host and/or kernel ids
+
+        Keyword Arguments:
+            host {str} -- remote host (default: {None})
+            ids {list} -- kernel ids (default: {None})
+
+        Returns:
+            list -- SshKernelInfo objects
+        """
+        km = SshInterruptHandler.nbapp.kernel_manager
+        kernels = SshInterruptHandler.kernels.all(km)
+        if host is not None:
+            kernels = [k for k in kernels if k.host == host]
+        if ids is not None:
+            kernels = [k for k in kernels if k.kernel_id in ids]
+        return kernels
+
+    async def signal_host(self, host, sudo, kernels, sig):
+        """Signal all kernels of one host with one ssh command
+
+        Arguments:
+            host {str} -- remote host
+            sudo {bool} -- whether the kernels run as root
+            kernels {list} -- (SshKernelInfo, pid) tuples
+            sig {int} -- signal number
+
+        Returns:
+            dict -- kernel id => result
+        """
+        script = BULK_SCRIPT.format(pids=" ".join(str(pid) for _, pid in kernels), sig=sig)
+        if sudo:
+            script = "sudo sh -c '%s'" % script
+        logger.warning("Sending signal %d to %d remote kernel(s) on %s" % (sig, len(kernels), host))
+        start = time.monotonic()
+        result = await ssh_async(host, script, SshBulkHandler.timeout)
+        if sig == signal.SIGINT:
+            METRICS.observe_interrupt(host, time.monotonic() - start, mode="bulk")
+
+        answers = {}
+        if result["code"] == 0:
+            for line in result["data"].splitlines():
+                parts = line.split()
+                if len(parts) == 2:
+                    answers[parts[0]] = parts[1]
+
+        results = {}
+        for kernel, pid in kernels:
+            answer = answers.get(str(pid))
+            if answer is None:
+                code, data = -1, result["data"]
+            else:
+                code, data = (0 if answer == "ok" else 1), answer
+            results[kernel.kernel_id] = {"host": host, "pid": pid, "code": code, "data": data}
+        return results
+
+    async def shutdown_local(self, kernel_ids):
+        km = SshInterruptHandler.nbapp.kernel_manager
+        for kernel_id in kernel_ids:
+            result = km.shutdown_kernel(kernel_id, now=True)
+            if inspect.isawaitable(result):
+                await result
+            SshInterruptHandler.kernels.evict(kernel_id)
+
+    @web.authenticated
+    async def post(self):
+        """POST handler to interrupt or shut down many remote ssh ipykernels"""
+
+        start = time.monotonic()
+        try:
+            body = json.loads(self.request.body or b"{}")
+        except ValueError:
+            raise web.HTTPError(400, "Request body is not valid json")
+        if not isinstance(body, dict):
+            raise web.HTTPError(400, "Request body needs to be a json object")
+
+        action = body.get("action", "interrupt")
+        if action not in SshBulkHandler.SIGNALS:
+            raise web.HTTPError(400, "Unknown action %s" % action)
+        host = body.get("host")
+        ids = body.get("ids")
+        if host is None and ids is None:
+            raise web.HTTPError(400, "Either host or ids is required")
+        if host is not None and not isinstance(host, str):
+            raise web.HTTPError(400, "host needs to be a string")
+        if ids is not None and (
+            not isinstance(ids, list) or not all(isinstance(i, str) for i in ids)
+        ):
+            raise web.HTTPError(400, "ids needs to be a list of strings")
+
+        groups = {}
+        results = {}
+        down = []
+        kernels = self.select(host, ids)
+        for kernel in kernels:
+            record = kernel.status.read()
+            if kernel.status.is_running():
+                groups.setdefault((kernel.host, record.sudo == 1), []).append((kernel, record.pid))
+            else:
+                results[kernel.kernel_id] = {
+                    "host": kernel.host,
+                    "pid": record.pid,
+                    "code": -1,
+                    "data": "Remote kernel not running",
+                }
+                if kernel.status.is_down() or kernel.status.is_kernel_killed():
+                    down.append(kernel.kernel_id)
+        selected = set(kernel.kernel_id for kernel in kernels)
+        for kernel_id in ids or []:
+            if kernel_id not in selected:
+                # not running, not an ssh_ipykernel or on another host
+                results[kernel_id] = {
+                    "host": None,
+                    "pid": None,
+                    "code": -1,
+                    "data": "Unknown kernel",
+                }
+
+        sig = SshBulkHandler.SIGNALS[action].real
+        tasks = [
+            self.signal_host(host, sudo, kernels, sig) for (host, sudo), kernels in groups.items()
+        ]
+        for host_results in await asyncio.gather(*tasks):
+            results.update(host_results)
+
+        if action == "shutdown":
+            # kernels whose remote shutdown failed stay, the remote process may still run
+            stopped = [kernel_id for kernel_id, r in results.items() if r["code"] == 0] + down
+            await self.shutdown_local(stopped)
+            for kernel_id, result in results.items():
+                result["shutdown"] = kernel_id in stopped
+
+        self.finish(
+            json.dumps({"action": action, "results": results, "latency": time.monotonic() - start})
+        )
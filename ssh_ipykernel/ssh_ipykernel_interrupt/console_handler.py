@@ -0,0 +1,56 @@
+import json
+
+from notebook.base.handlers import IPythonHandler
+from tornado import web
+
+from ssh_ipykernel.status import Status
+
+from .interrupt_handler import SshInterruptHandler
+
+
+class SshConsoleHandler(IPythonHandler):
+    """Recent console output (stdout and stderr) of a remote ssh ipykernel
+
+    Query arguments:
+        id {str} -- Internal jupyter kernel ID
+        offset {int} -- Stream position to read from, "next" of the previous answer (default: 0)
+        limit {int} -- Maximum number of bytes to return (optional)
+    """
+
+    @web.authenticated
+    def get(self):
+        """GET handler returning the console output from offset on"""
+
+        kernel_id = self.get_argument("id", None, True)
+        try:
+            offset = int(self.get_argument("offset", "0", True))
+            limit = self.get_argument("limit", None, True)
+            limit = None if limit is None else int(limit)
+        except ValueError:
+            raise web.HTTPError(400, "offset and limit need to be integers")
+
+        km = SshInterruptHandler.nbapp.kernel_manager
+        kernel = SshInterruptHandler.kernels.get(km, kernel_id)
+        if kernel is None:
+            raise web.HTTPError(404, "Unknown kernel")
+
+        record = kernel.status.read()
+        state = "UNKNOWN" if record is None else Status.NAMES.get(record.state, "UNKNOWN")
+        result = kernel.console.read(max(0, offset), limit)
+        if result is None:
+            data, next_offset, lost = b"", offset, 0
+        else:
+            data, next_offset, lost = result
+
+        self.finish(
+            json.dumps(
+                {
+                    "id": kernel_id,
+                    "state": state,
+                    "offset": next_offset - len(data),
+                    "next": next_offset,
+                    "lost": lost,
+                    "data": data.decode("utf-8", "replace"),
+                }
+            )
+        )
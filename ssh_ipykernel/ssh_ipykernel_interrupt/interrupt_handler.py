@@ -1,73 +1,127 @@
+import asyncio
 import json
 import os
 import signal
+import time
 
+import zmq
+import zmq.asyncio
+from jupyter_client.session import Session
 from notebook.base.handlers import IPythonHandler
 from tornado import web
 
-from ssh_ipykernel.utils import ssh, setup_logging
+from ssh_ipykernel.metrics import METRICS
+from ssh_ipykernel.utils import ssh_async, setup_logging
 
-from ssh_ipykernel.status import Status
+from .kernels import KernelLookup
 
 logger = setup_logging("ssh_ipykernel:interrupt")
 
 
+async def send_interrupt_request(connection_info, timeout):
+    """Send an interrupt_request to the control port of a kernel and wait for the reply
+
+    The control port is forwarded to the remote kernel by the launcher, so no ssh command
+    is needed.
+
+    Arguments:
+        connection_info {dict} -- Local connection info of the kernel
+        timeout {float} -- Seconds to wait for the interrupt_reply
+
+    Returns:
+        bool -- True if the kernel answered in time
+    """
+    key = connection_info["key"]
+    session = Session(
+        key=key.encode("utf-8") if isinstance(key, str) else key,
+        signature_scheme=connection_info.get("signature_scheme", "hmac-sha256"),
+    )
+    url = "%s://%s:%d" % (
+        connection_info.get("transport", "tcp"),
+        connection_info["ip"],
+        connection_info["control_port"],
+    )
+    socket = zmq.asyncio.Context.instance().socket(zmq.DEALER)
+    socket.linger = 0
+    socket.connect(url)
+    deadline = time.monotonic() + timeout
+    msg = session.msg("interrupt_request", {})
+    try:
+        await asyncio.wait_for(socket.send_multipart(session.serialize(msg)), timeout)
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            frames = await asyncio.wait_for(socket.recv_multipart(), remaining)
+            _, frames = session.feed_identities(frames)
+            reply = session.deserialize(frames)
+            if reply["parent_header"].get("msg_id") == msg["header"]["msg_id"]:
+                return reply["content"].get("status") == "ok"
+    except asyncio.TimeoutError:
+        return False
+    finally:
+        socket.close()
+
+
 class SshInterruptHandler(IPythonHandler):
     """Kernel handler to interrupt remote ssh ipykernel"""
 
     nbapp = None
+    timeout = 10
+    reply_timeout = 2
+    kernels = KernelLookup(logger)
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
     def get_kernel(self, kernel_id):
-        """Get jupyter kernel for given kernel Id
-        
+        """Get cached info of a running ssh_ipykernel for given kernel Id
+
         Args:
             kernel_id (str): Internal jupyter kernel ID
-        
+
         Returns:
-            KernelManager: KernelManager object
+            SshKernelInfo: host and status of the kernel, None if not found
         """
         km = SshInterruptHandler.nbapp.kernel_manager
-
-        kernel_info = None
-        for kernel_info in km.list_kernels():
-            if kernel_info["id"] == kernel_id:
-                break
-
-        if kernel_info is not None:
-            return km.get_kernel(kernel_info["id"])
-        else:
-            return None
+        return SshInterruptHandler.kernels.get(km, kernel_id)
 
     @web.authenticated
-    def get(self):
+    async def get(self):
         """GET handler to interrrupt remote ssh ipykernel"""
 
+        start = time.monotonic()
         kernel_id = self.get_argument("id", None, True)
         logger.debug("kernel id %s" % kernel_id)
         kernel = self.get_kernel(kernel_id)
 
-        status = Status(kernel.get_connection_info(), logger)
-        if status.is_running():
-            pid = status.get_pid()
-
-            host = ""
-            for i, v in enumerate(kernel.kernel_spec.argv):
-                if v == "--host":
-                    host = kernel.kernel_spec.argv[i + 1]
-                    break
-
-            logger.warning("Interrupt remote kernel ({}, pid = {})".format(host, pid))
-
-            cmd = "kill -{sig} {pid}".format(sig=signal.SIGINT.real, pid=pid)
-            if status.is_sudo():
-                cmd = "sudo " + cmd
-            result = ssh(host, cmd)
+        if kernel is None:
+            result = {"code": -1, "data": "Unknown kernel"}
+        elif kernel.status.is_running():
+            record = kernel.status.read()
+            logger.warning("Interrupt remote kernel ({}, pid = {})".format(kernel.host, record.pid))
+
+            mode = "signal"
+            if kernel.interrupt_mode == "message":
+                if await send_interrupt_request(
+                    kernel.connection_info, SshInterruptHandler.reply_timeout
+                ):
+                    mode = "message"
+                    result = {"code": 0, "data": "interrupt_reply"}
+                else:
+                    logger.warning("No interrupt_reply from remote kernel, sending a signal")
+
+            if mode == "signal":
+                cmd = "kill -{sig} {pid}".format(sig=signal.SIGINT.real, pid=record.pid)
+                if record.sudo == 1:
+                    cmd = "sudo " + cmd
+                result = await ssh_async(kernel.host, cmd, SshInterruptHandler.timeout)
+            result["mode"] = mode
+            METRICS.observe_interrupt(kernel.host, time.monotonic() - start, mode=mode)
         else:
             result = {"code": -1, "data": "Remote kernel not running"}
 
+        result["latency"] = time.monotonic() - start
         self.finish(json.dumps(result))
 
 
@@ -0,0 +1,153 @@
+from ssh_ipykernel.console import Console
+from ssh_ipykernel.status import Status
+
+
+class SshKernelInfo:
+    """Cached facts about a running ssh_ipykernel
+
+    Arguments:
+        kernel_id {str} -- Internal jupyter kernel ID
+        host {str} -- Remote host from the kernelspec (comma separated candidates possible)
+        status {Status} -- Status record reader of the kernel
+
+    Keyword Arguments:
+        interrupt_mode {str} -- "signal" or "message" from the kernelspec (default: {"signal"})
+        connection_info {dict} -- Local connection info of the kernel (default: {None})
+    """
+
+    def __init__(self, kernel_id, host, status, interrupt_mode="signal", connection_info=None):
+        self.kernel_id = kernel_id
+        self.interrupt_mode = interrupt_mode
+        self.connection_info = connection_info
+        self.candidates = host.split(",")
+        self._host = host if len(self.candidates) == 1 else None
+        self.status = status
+        self._console = None
+
+    @property
+    def host(self):
+        """Remote host of the kernel, for several candidates the one the launcher selected
+        (identified by the host hash in the status record)
+        """
+        if self._host is None:
+            record = self.status.read()
+            host_hash = 0 if record is None else record.host_hash
+            for candidate in self.candidates:
+                if Status.host_hash(candidate) == host_hash:
+                    self._host = candidate
+                    break
+            else:
+                # not selected yet
+                return ",".join(self.candidates)
+        return self._host
+
+    @property
+    def console(self):
+        """Reader of the console ring buffer of the kernel, attached on first use
+        """
+        if self._console is None:
+            self._console = Console(self.status.hash, self.status._logger)
+        return self._console
+
+
+class KernelLookup:
+    """Cache of kernel id => host and Status for the server extension handlers
+
+    The kernelspec argv is parsed and the Status reader is attached only once per kernel.
+    Entries of kernels unknown to the kernel manager are evicted and their console files removed.
+
+    Arguments:
+        logger {logging.Logger} -- Logger to use
+    """
+
+    def __init__(self, logger):
+        self._logger = logger
+        self._cache = {}
+
+    @staticmethod
+    def option_from_argv(argv, option):
+        """Get the value of an option from a kernelspec argv
+
+        Arguments:
+            argv {list} -- kernelspec argv
+            option {str} -- option name, e.g. "--host"
+
+        Returns:
+            str -- value, None if the option is not given
+        """
+        for i, v in enumerate(argv):
+            if v == option and i + 1 < len(argv):
+                return argv[i + 1]
+        return None
+
+    @staticmethod
+    def host_from_argv(argv):
+        """Get the value of --host from a kernelspec argv
+
+        Arguments:
+            argv {list} -- kernelspec argv
+
+        Returns:
+            str -- host, None if the kernel is not an ssh_ipykernel
+        """
+        return KernelLookup.option_from_argv(argv, "--host")
+
+    def get(self, kernel_manager, kernel_id):
+        """Get cached info for a kernel id
+
+        Arguments:
+            kernel_manager {MultiKernelManager} -- The kernel manager of the jupyter server
+            kernel_id {str} -- Internal jupyter kernel ID
+
+        Returns:
+            SshKernelInfo -- kernel info or None if unknown or not an ssh_ipykernel
+        """
+        if kernel_id is None or kernel_id not in kernel_manager:
+            self.evict(kernel_id)
+            return None
+
+        info = self._cache.get(kernel_id)
+        if info is None:
+            kernel = kernel_manager.get_kernel(kernel_id)
+            host = self.host_from_argv(kernel.kernel_spec.argv)
+            if host is None:
+                return None
+            connection_info = kernel.get_connection_info()
+            status = Status(connection_info, self._logger)
+            interrupt_mode = self.option_from_argv(kernel.kernel_spec.argv, "--interrupt-mode")
+            info = SshKernelInfo(
+                kernel_id,
+                host,
+                status,
+                interrupt_mode=interrupt_mode or "signal",
+                connection_info=connection_info,
+            )
+            self._cache[kernel_id] = info
+        return info
+
+    def all(self, kernel_manager):
+        """Get cached info of all running ssh_ipykernels
+
+        Arguments:
+            kernel_manager {MultiKernelManager} -- The kernel manager of the jupyter server
+
+        Returns:
+            list -- SshKernelInfo objects
+        """
+        kernel_ids = set(kernel_manager.list_kernel_ids())
+        for kernel_id in list(self._cache):
+            if kernel_id not in kernel_ids:
+                self.evict(kernel_id)
+        result = []
+        for kernel_id in kernel_ids:
+            info = self.get(kernel_manager, kernel_id)
+            if info is not None:
+                result.append(info)
+        return result
+
+    def evict(self, kernel_id):
+        info = self._cache.pop(kernel_id, None)
+        if info is not None:
+            info.status.detach()
+            # the launcher leaves the console output behind for post mortem reading
+            info.console.remove()
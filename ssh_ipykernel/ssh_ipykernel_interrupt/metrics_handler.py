@@ -0,0 +1,19 @@
+from notebook.base.handlers import IPythonHandler
+from tornado import web
+
+from ssh_ipykernel.metrics import METRICS
+
+from .interrupt_handler import SshInterruptHandler
+
+
+class SshMetricsHandler(IPythonHandler):
+    """Metrics of all ssh_ipykernels in the Prometheus text format"""
+
+    @web.authenticated
+    def get(self):
+        """GET handler returning the metrics"""
+
+        km = SshInterruptHandler.nbapp.kernel_manager
+        METRICS.collect(SshInterruptHandler.kernels.all(km))
+        self.set_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.finish(METRICS.render())
@@ -0,0 +1,53 @@
+import json
+
+from notebook.base.handlers import IPythonHandler
+from tornado import web
+
+from ssh_ipykernel.status import Status
+
+from .interrupt_handler import SshInterruptHandler
+
+
+def kernel_telemetry(kernel):
+    """Resource samples of a remote kernel as json serializable dict
+
+    Arguments:
+        kernel {SshKernelInfo} -- kernel info
+
+    Returns:
+        dict -- {"id", "host", "state", "pid", "latest", "history"}
+    """
+    record = kernel.status.read()
+    history = [sample._asdict() for sample in kernel.status.get_telemetry()]
+    return {
+        "id": kernel.kernel_id,
+        "host": kernel.host,
+        "state": "UNKNOWN" if record is None else Status.NAMES.get(record.state, "UNKNOWN"),
+        "pid": 0 if record is None else record.pid,
+        "latest": history[-1] if history else None,
+        "history": history,
+    }
+
+
+class SshTelemetryHandler(IPythonHandler):
+    """Memory (rss bytes), cpu (percent of one core) and threads of remote ssh ipykernels
+
+    Query arguments:
+        id {str} -- Internal jupyter kernel ID (optional, default: all ssh ipykernels)
+    """
+
+    @web.authenticated
+    def get(self):
+        """GET handler returning the latest sample and the recent history per kernel"""
+
+        kernel_id = self.get_argument("id", None, True)
+        km = SshInterruptHandler.nbapp.kernel_manager
+        if kernel_id is None:
+            kernels = SshInterruptHandler.kernels.all(km)
+            self.finish(json.dumps({"kernels": [kernel_telemetry(k) for k in kernels]}))
+            return
+
+        kernel = SshInterruptHandler.kernels.get(km, kernel_id)
+        if kernel is None:
+            raise web.HTTPError(404, "Unknown kernel")
+        self.finish(json.dumps(kernel_telemetry(kernel)))
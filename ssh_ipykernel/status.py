@@ -1,18 +1,77 @@
 import os
+import json
 import mmap
 import hashlib
-
-from ssh_ipykernel.utils import decode_utf8
+import struct
+import time
+from collections import namedtuple
+
+from ssh_ipykernel.utils import decode_utf8, is_windows
+
+StatusRecord = namedtuple(
+    "StatusRecord",
+    [
+        "version",
+        "state",
+        "sudo",
+        "restarts",
+        "pid",
+        "host_hash",
+        "owner_pid",
+        "started",
+        "changed",
+        "heartbeat_rtt",
+        "last_activity",
+        "busy",
+        "interrupts",
+        "interrupt_latency",
+        "interrupt_mode",
+    ],
+)
+
+TelemetrySample = namedtuple("TelemetrySample", ["time", "rss", "cpu", "threads", "processes"])
 
 
 class Status:
     """Store status of kernel start in mmap'd file for external tools
 
+    The record has a fixed layout (RECORD_SIZE bytes, little endian):
+
+        0   magic "SIPK"        4s
+        4   version             u16
+        6   reserved            u16
+        8   sequence counter    u64
+        16  payload             PAYLOAD (state, sudo, restarts, pid, host hash, launcher pid,
+                                         start time, last change time, last heartbeat rtt,
+                                         time of the last kernel activity, busy flag,
+                                         measured interrupts, last interrupt-to-idle latency,
+                                         mode of the last measured interrupt)
+        128 telemetry count     u32, number of resource samples written so far
+        132 reserved            u32
+        136 telemetry history   TELEMETRY_HISTORY x TELEMETRY_SAMPLE (time, rss bytes,
+                                cpu percent, threads, processes), sample n is at n % history
+
+    The launcher is the only writer and uses a seqlock: the sequence counter is odd while the
+    payload is written. Readers copy the payload and retry until the counter was even and
+    unchanged, so they always get a consistent snapshot without locks or syscalls. A launcher
+    killed in the middle of a write leaves the counter odd, so readers give up after
+    SEQLOCK_TIMEOUT seconds and the next launcher of the record starts from the following even
+    value. Readers of a status file check its inode at most every REATTACH_INTERVAL seconds and
+    re-attach when a restarted launcher created a new file for the same connection info.
+    Status files of the old 12 byte layout (state u16, pid u64, sudo u16) are still supported.
+    Fields appended to the payload read as 0 in records of older launchers.
+
+    In registry mode (registry=True or environment variable SSH_IPYKERNEL_REGISTRY=1) the record
+    lives in a slot of the shared registry file (see Registry) instead of its own file.
+
     Arguments:
         connection_info {dict} -- A ipykernel connection info
+        logger {logging.Logger} -- Logger to use
 
     Keyword Arguments:
         status_folder {str} -- Folder where to save the status (default: {"~/.ssh_ipykernel"})
+        host {str} -- Remote host, only given by the launcher which owns the record (default: {None})
+        registry {bool} -- Use the shared status registry (default: {SSH_IPYKERNEL_REGISTRY})
     """
 
     UNKNOWN = 0
@@ -34,16 +93,65 @@ class Status:
         CONNECT_FAILED: "Connect failed",
     }
 
+    NAMES = {
+        UNKNOWN: "UNKNOWN",
+        DOWN: "DOWN",
+        UNREACHABLE: "UNREACHABLE",
+        KERNEL_KILLED: "KERNEL_KILLED",
+        STARTING: "STARTING",
+        RUNNING: "RUNNING",
+        CONNECT_FAILED: "CONNECT_FAILED",
+        RUNNING_EXT: "RUNNING_EXT",
+    }
+
+    INTERRUPT_MODES = {1: "signal", 2: "message"}
+
     ENDIAN = "little"
 
-    def __init__(self, connection_info, logger, status_folder="~/.ssh_ipykernel"):
+    MAGIC = b"SIPK"
+    VERSION = 2
+    HEADER = struct.Struct("<4sHH")
+    SEQ = struct.Struct("<Q")
+    SEQ_OFFSET = 8
+    PAYLOAD = struct.Struct("<HHIQQQddddHIdH")
+    PAYLOAD_OFFSET = 16
+    RECORD_SIZE = 1024
+    LEGACY_SIZE = 12
+    TELEMETRY_OFFSET = 128
+    TELEMETRY_HEADER = struct.Struct("<II")
+    TELEMETRY_SAMPLE = struct.Struct("<dQdII")
+    TELEMETRY_HISTORY = 16
+    SEQLOCK_TIMEOUT = 0.005
+    REATTACH_INTERVAL = 1.0
+
+    def __init__(
+        self, connection_info, logger, status_folder="~/.ssh_ipykernel", host=None, registry=None
+    ):
         self._logger = logger
+        self.legacy = False
+        self.owner = host is not None
+        if registry is None:
+            registry = os.environ.get("SSH_IPYKERNEL_REGISTRY", "0").lower() in ("1", "true", "yes")
+        self.registry_mode = registry and not is_windows
 
         self.status_folder = os.path.expanduser(status_folder)
-        filename = "%s.status" % self.create_hash(connection_info)
+        self.hash = self.create_hash(connection_info)
+        filename = "%s.status" % self.hash
         self.status_file = os.path.join(self.status_folder, filename)
+        self.timings_file = os.path.join(self.status_folder, "%s.timings" % self.hash)
         self.status_available = True
-        self.status = self.create_or_get()
+        self._fd = None
+        self._inode = None
+        self._checked = None
+        self._base = 0
+        self._registry = None
+        self._slot = None
+        if self.registry_mode:
+            self.status = self.attach_registry()
+        else:
+            self.status = self.create_or_get()
+        if host is not None:
+            self._init_record(host)
 
     def create_hash(self, connection_info):
         conn_str = "%d-%d-%d-%d-%d" % (
@@ -57,6 +165,20 @@ class Status:
         h.update(conn_str.encode())
         return h.hexdigest()
 
+    @staticmethod
+    def host_hash(host):
+        """Get the 64 bit hash of a host name as stored in the status record
+
+        Arguments:
+            host {str} -- remote host
+
+        Returns:
+            int -- hash value
+        """
+        h = hashlib.sha256()
+        h.update(host.encode())
+        return int.from_bytes(h.digest()[:8], Status.ENDIAN)
+
     def create_or_get(self):
         """Create the status file
 
@@ -75,7 +197,7 @@ class Status:
             self._logger.debug("Creating new status file %s" % self.status_file)
             try:
                 with open(self.status_file, "wb") as fd:
-                    fd.write((0).to_bytes(12, Status.ENDIAN))
+                    fd.write(self._empty_record())
             except Exception as ex:
                 self._logger.error("Cannot initialize %s" % self.status_folder)
                 self._logger.error(str(ex))
@@ -83,17 +205,217 @@ class Status:
 
         if self.status_available:
             self._logger.debug("Attaching to status file %s" % self.status_file)
-            fd = open(self.status_file, "r+b")
-            return mmap.mmap(fd.fileno(), 0)
+            return self._map()
         else:
             return None
 
+    def _map(self):
+        self._fd = open(self.status_file, "r+b")
+        self._inode = os.fstat(self._fd.fileno()).st_ino
+        self._checked = time.monotonic()
+        status = mmap.mmap(self._fd.fileno(), 0)
+        self.legacy = len(status) < Status.RECORD_SIZE or status[:4] != Status.MAGIC
+        if self.legacy:
+            self._logger.debug("Status file %s has the legacy layout" % self.status_file)
+        return status
+
+    def _unmap(self):
+        if self.status is not None:
+            self.status.close()
+            self._fd.close()
+            self.status = None
+            self._inode = None
+
+    def _reattach(self):
+        """Follow the status file of a reader to the file of a restarted launcher (same path,
+        new inode), the old launcher removed the mapped one. The inode is checked at most every
+        REATTACH_INTERVAL seconds while a file is mapped.
+
+        Returns:
+            bool -- False if there is no status file at the moment
+        """
+        now = time.monotonic()
+        if self.status is not None and now - self._checked < Status.REATTACH_INTERVAL:
+            return True
+        self._checked = now
+        try:
+            inode = os.stat(self.status_file).st_ino
+        except FileNotFoundError:
+            self._unmap()
+            return False
+        if inode != self._inode:
+            self._unmap()
+            try:
+                self.status = self._map()
+            except (OSError, ValueError):
+                # created but not written yet
+                self._unmap()
+                return False
+        return True
+
+    def attach_registry(self):
+        """Attach to the shared status registry, the owner allocates the slot
+
+        Returns:
+            [mmap] -- Memory mapped registry file
+        """
+        from ssh_ipykernel.registry import Registry
+
+        try:
+            self._registry = Registry.instance(
+                self._empty_record(), status_folder=self.status_folder, logger=self._logger
+            )
+        except Exception as ex:
+            self._logger.error("Cannot open status registry in %s" % self.status_folder)
+            self._logger.error(str(ex))
+            self.status_available = False
+            return None
+
+        self._find_slot()
+        return self._registry.mmap
+
+    def _find_slot(self):
+        key = bytes.fromhex(self.hash)
+        if self.owner:
+            self._slot = self._registry.allocate(key)
+        else:
+            self._slot = self._registry.lookup(key)
+        if self._slot is not None:
+            self._base = self._registry.record_offset(self._slot)
+        return self._slot is not None
+
+    @staticmethod
+    def _unknown_record():
+        return StatusRecord(Status.VERSION, *([0] * 6 + [0.0] * 4 + [0, 0, 0.0, 0]))
+
+    @staticmethod
+    def _empty_record():
+        record = bytearray(Status.RECORD_SIZE)
+        Status.HEADER.pack_into(record, 0, Status.MAGIC, Status.VERSION, 0)
+        return bytes(record)
+
     def _to_bytes(self, value, length):
         return value.to_bytes(length, Status.ENDIAN, signed=False)
 
     def _from_bytes(self, value):
         return int.from_bytes(value, Status.ENDIAN, signed=False)
 
+    def _read_seq(self):
+        return Status.SEQ.unpack_from(self.status, self._base + Status.SEQ_OFFSET)[0]
+
+    def _snapshot(self, copy):
+        """Copy protected fields of the record until no write of the launcher interfered
+
+        Arguments:
+            copy {callable} -- copies the fields from self.status
+
+        Returns:
+            object -- result of copy, None if the counter stayed odd for SEQLOCK_TIMEOUT
+                      seconds (launcher killed in the middle of a write)
+        """
+        deadline = None
+        spins = 0
+        while True:
+            seq1 = self._read_seq()
+            if seq1 % 2 == 0:
+                result = copy()
+                if self._read_seq() == seq1:
+                    return result
+            spins += 1
+            if spins % 100 == 0:
+                now = time.monotonic()
+                if deadline is None:
+                    deadline = now + Status.SEQLOCK_TIMEOUT
+                elif now > deadline:
+                    return None
+                # the writer got descheduled in the middle of an update
+                time.sleep(0)
+
+    def read(self):
+        """Get a consistent snapshot of the status record (seqlock read, no locks or syscalls
+        apart from the inode check of file readers every REATTACH_INTERVAL seconds)
+
+        Returns:
+            StatusRecord -- The record, None if no status file is available
+        """
+        if not self.status_available:
+            return None
+
+        if self.registry_mode and not self._registry.holds(self._slot, bytes.fromhex(self.hash)):
+            # slot freed by the launcher or never allocated
+            self._slot = None
+        if self.registry_mode and self._slot is None and not self._find_slot():
+            # the launcher has not registered the kernel (yet)
+            return Status._unknown_record()
+        if not self.registry_mode and not self.owner and not self._reattach():
+            # between two launchers of a restarted kernel
+            return Status._unknown_record()
+
+        if self.legacy:
+            return StatusRecord(
+                version=1,
+                state=self._from_bytes(self.status[:2]),
+                pid=self._from_bytes(self.status[2:10]),
+                sudo=self._from_bytes(self.status[10:12]),
+                restarts=0,
+                host_hash=0,
+                owner_pid=0,
+                started=0.0,
+                changed=0.0,
+                heartbeat_rtt=0.0,
+                last_activity=0.0,
+                busy=0,
+                interrupts=0,
+                interrupt_latency=0.0,
+                interrupt_mode=0,
+            )
+
+        record = self._snapshot(
+            lambda: StatusRecord(
+                Status.HEADER.unpack_from(self.status, self._base)[1],
+                *Status.PAYLOAD.unpack_from(self.status, self._base + Status.PAYLOAD_OFFSET)
+            )
+        )
+        if record is None:
+            self._logger.debug("Status record %s is locked by a dead launcher" % self.hash)
+            return Status._unknown_record()
+        return record
+
+    def _write(self, **fields):
+        """Update fields of the record using the seqlock protocol (single writer)
+
+        Keyword Arguments:
+            fields -- StatusRecord fields to change
+        """
+        if not self.status_available or (self.registry_mode and self._slot is None):
+            return
+
+        record = self.read()._replace(**fields)
+        if self.legacy:
+            new_status = self._to_bytes(record.state, 2) + self._to_bytes(record.pid, 8)
+            new_status += self._to_bytes(1 if record.sudo else 0, 2)
+            self.status[: Status.LEGACY_SIZE] = new_status
+            return
+
+        seq = self._read_seq()
+        # odd if the previous launcher of the record died in the middle of a write
+        seq += seq % 2
+        Status.SEQ.pack_into(self.status, self._base + Status.SEQ_OFFSET, seq + 1)
+        Status.PAYLOAD.pack_into(self.status, self._base + Status.PAYLOAD_OFFSET, *record[1:])
+        Status.SEQ.pack_into(self.status, self._base + Status.SEQ_OFFSET, seq + 2)
+        if self.registry_mode:
+            self._registry.stamp(self._slot)
+
+    def _init_record(self, host):
+        now = time.time()
+        self._write(
+            state=Status.STARTING,
+            host_hash=Status.host_hash(host),
+            owner_pid=os.getpid(),
+            started=now,
+            changed=now,
+        )
+
     def _set_status(self, status, pid, sudo):
         """Set status if status file exists
 
@@ -106,10 +428,7 @@ class Status:
             if sudo == None:
                 sudo = self.is_sudo()
 
-            new_status = self._to_bytes(status, 2) + self._to_bytes(pid, 8)
-            new_status += self._to_bytes(1 if sudo else 0, 2)
-            self.status[:12] = new_status
-            self.status.flush()
+            self._write(state=status, pid=pid, sudo=1 if sudo else 0, changed=time.time())
             self._logger.debug(
                 "Status for remote pid {pid}: {status}".format(
                     status=Status.MESSAGES[status], pid=pid
@@ -123,7 +442,7 @@ class Status:
             int -- Status.<value>
         """
         if self.status_available:
-            return self._from_bytes(self.status[:2])
+            return self.read().state
         else:
             return Status.UNKNOWN
 
@@ -134,7 +453,7 @@ class Status:
             int -- pid
         """
         if self.status_available:
-            return self._from_bytes(self.status[2:10])
+            return self.read().pid
         else:
             return -1
 
@@ -145,10 +464,138 @@ class Status:
             bool -- True if sudo is used, else False
         """
         if self.status_available:
-            return self._from_bytes(self.status[10:12]) == 1
+            return self.read().sudo == 1
         else:
             return False
 
+    def set_heartbeat_rtt(self, rtt):
+        """Store the last measured heartbeat round trip time
+
+        Arguments:
+            rtt {float} -- Round trip time in seconds
+        """
+        self._write(heartbeat_rtt=rtt)
+
+    def set_activity(self, last_activity, busy):
+        """Store the time of the last kernel activity and whether the kernel is busy
+
+        Arguments:
+            last_activity {float} -- Wall clock time of the last activity
+            busy {bool} -- True if the kernel executes a request
+        """
+        self._write(last_activity=last_activity, busy=1 if busy else 0)
+
+    def get_idle_time(self):
+        """Get the seconds since the last kernel activity
+
+        Returns:
+            float -- Idle time, 0 if the kernel is busy or no activity was recorded
+        """
+        record = self.read()
+        if record is None or record.busy or record.last_activity == 0:
+            return 0.0
+        return max(0.0, time.time() - record.last_activity)
+
+    def add_interrupt(self, latency, mode):
+        """Count a measured interrupt and store its interrupt-to-idle latency
+
+        Arguments:
+            latency {float} -- Seconds from the interrupt until the kernel was idle
+            mode {str} -- "signal" or "message"
+        """
+        codes = {name: code for code, name in Status.INTERRUPT_MODES.items()}
+        record = self.read()
+        if record is not None:
+            self._write(
+                interrupts=record.interrupts + 1,
+                interrupt_latency=latency,
+                interrupt_mode=codes.get(mode, 0),
+            )
+
+    def add_telemetry(self, sample):
+        """Append a resource sample of the remote kernel to the history (seqlock, single writer)
+
+        Arguments:
+            sample {TelemetrySample} -- The sample
+        """
+        if not self.status_available or self.legacy or (self.registry_mode and self._slot is None):
+            return
+
+        base = self._base + Status.TELEMETRY_OFFSET
+        count = Status.TELEMETRY_HEADER.unpack_from(self.status, base)[0]
+        index = count % Status.TELEMETRY_HISTORY
+        offset = base + Status.TELEMETRY_HEADER.size + index * Status.TELEMETRY_SAMPLE.size
+
+        seq = self._read_seq()
+        # odd if the previous launcher of the record died in the middle of a write
+        seq += seq % 2
+        Status.SEQ.pack_into(self.status, self._base + Status.SEQ_OFFSET, seq + 1)
+        Status.TELEMETRY_SAMPLE.pack_into(self.status, offset, *sample)
+        Status.TELEMETRY_HEADER.pack_into(self.status, base, count + 1, 0)
+        Status.SEQ.pack_into(self.status, self._base + Status.SEQ_OFFSET, seq + 2)
+        if self.registry_mode:
+            self._registry.stamp(self._slot)
+
+    def get_telemetry(self):
+        """Get the resource samples of the remote kernel (seqlock read)
+
+        Returns:
+            list -- TelemetrySample objects, oldest first (empty if none was taken)
+        """
+        if self.read() is None or self.legacy or self.status is None:
+            return []
+        if self.registry_mode and self._slot is None:
+            return []
+
+        base = self._base + Status.TELEMETRY_OFFSET
+        size = Status.TELEMETRY_HEADER.size
+        size += Status.TELEMETRY_HISTORY * Status.TELEMETRY_SAMPLE.size
+        data = self._snapshot(lambda: self.status[base : base + size])
+        if data is None:
+            return []
+
+        count = Status.TELEMETRY_HEADER.unpack_from(data, 0)[0]
+        samples = []
+        for n in range(max(0, count - Status.TELEMETRY_HISTORY), count):
+            offset = Status.TELEMETRY_HEADER.size
+            offset += (n % Status.TELEMETRY_HISTORY) * Status.TELEMETRY_SAMPLE.size
+            samples.append(TelemetrySample(*Status.TELEMETRY_SAMPLE.unpack_from(data, offset)))
+        return samples
+
+    def increment_restarts(self):
+        """Count a restart (e.g. reconnect) of the kernel
+        """
+        if self.status_available:
+            self._write(restarts=self.read().restarts + 1)
+
+    def set_timings(self, timings):
+        """Persist startup phase timings next to the status file
+
+        Arguments:
+            timings {dict} -- Timings as provided by PhaseTimer.as_dict()
+        """
+        if self.status_available:
+            try:
+                tmp_file = "%s.%d" % (self.timings_file, os.getpid())
+                with open(tmp_file, "w") as fd:
+                    json.dump(timings, fd)
+                os.replace(tmp_file, self.timings_file)
+            except Exception as ex:
+                self._logger.error("Cannot write %s" % self.timings_file)
+                self._logger.error(str(ex))
+
+    def get_timings(self):
+        """Get startup phase timings of the kernel
+
+        Returns:
+            dict -- Timings as provided by PhaseTimer.as_dict(), empty if not available
+        """
+        try:
+            with open(self.timings_file, "r") as fd:
+                return json.load(fd)
+        except Exception:
+            return {}
+
     def set_unreachable(self, pid=None, sudo=None):
         """Set current status to Status.UNREACHABLE
         """
@@ -240,12 +687,29 @@ class Status:
         """
         return self._get_status() == Status.CONNECT_FAILED
 
+    def detach(self):
+        """Unmap and close the status file without removing it
+        """
+        if self.registry_mode:
+            # the registry mmap is shared by all Status objects of the process
+            self.status = None
+        else:
+            self._unmap()
+        self.status_available = False
+
     def close(self):
         """Close status file if exists
         """
         try:
             if self.status_available:
-                os.remove(self.status_file)
+                if self.registry_mode:
+                    if self._slot is not None:
+                        self._registry.free(self._slot)
+                else:
+                    os.remove(self.status_file)
+                if os.path.exists(self.timings_file):
+                    os.remove(self.timings_file)
+                self.detach()
             # else:
             #     self._logger.info("no need to delete status file")
         except Exception as ex:
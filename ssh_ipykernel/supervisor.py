@@ -0,0 +1,297 @@
+import asyncio
+import codecs
+import os
+import signal
+import time
+
+
+class OutputPump:
+    """Split remote output into lines and log them coalesced and rate limited
+
+    Lines are collected per source and emitted as one log record per flush. At most max_lines
+    lines per interval are kept, the rest is dropped and counted, so a kernel flooding its
+    stdout cannot keep the launcher busy with logging.
+
+    Arguments:
+        logger {logging.Logger} -- Logger to use
+
+    Keyword Arguments:
+        max_lines {int} -- Lines to log per interval (default: {200})
+        interval {float} -- Length of the rate limit window in seconds (default: {1.0})
+        max_line_length {int} -- Longer lines are truncated (default: {4096})
+    """
+
+    def __init__(self, logger, max_lines=200, interval=1.0, max_line_length=4096):
+        self._logger = logger
+        self.max_lines = max_lines
+        self.interval = interval
+        self.max_line_length = max_line_length
+        self._partial = {}
+        self._pending = []
+        self._window = time.monotonic()
+        self._window_lines = 0
+        self._dropped = 0
+        self.lines = 0
+        self.dropped = 0
+
+    def feed(self, source, text, final=False):
+        """Add decoded output of a source
+
+        Arguments:
+            source {object} -- Key of the output source (e.g. the file descriptor)
+            text {str} -- Decoded output
+
+        Keyword Arguments:
+            final {bool} -- Whether the source is exhausted (default: {False})
+        """
+        lines = (self._partial.get(source, "") + text).split("\n")
+        partial = "" if final else lines.pop()
+        if len(partial) > self.max_line_length:
+            # e.g. progress bars redrawing with \r only
+            lines.append(partial)
+            partial = ""
+        self._partial[source] = partial
+
+        now = time.monotonic()
+        if now - self._window >= self.interval:
+            self._window = now
+            self._window_lines = 0
+
+        for line in lines:
+            # keep what a terminal would show for lines redrawn with \r
+            line = line.rstrip("\r").rsplit("\r", 1)[-1]
+            if not line:
+                continue
+            if self._window_lines >= self.max_lines:
+                self._dropped += 1
+                continue
+            self._window_lines += 1
+            self._pending.append(line[: self.max_line_length])
+
+    def flush(self):
+        """Log the pending lines as one record and report dropped lines
+        """
+        if self._pending:
+            self.lines += len(self._pending)
+            self._logger.info("\n".join(self._pending))
+            self._pending = []
+        if self._dropped:
+            self.dropped += self._dropped
+            self._logger.warning(
+                "Dropped %d lines of remote output (%d in total)" % (self._dropped, self.dropped)
+            )
+            self._dropped = 0
+
+
+class Supervisor:
+    """Event driven supervision of the SSH child processes of a SshKernel
+
+    The pty of the SSH session (and of a separate tunnel session, if any) is read with
+    non-blocking readers registered at the asyncio loop, so remote output is logged and EOF
+    is detected as soon as it happens. Liveness checks run as an independent periodic task,
+    further periodic tasks can be registered with add_task.
+
+    Arguments:
+        kernel {SshKernel} -- The kernel to supervise
+
+    Keyword Arguments:
+        interval {float} -- Seconds between liveness checks (default: {kernel.timeout})
+    """
+
+    CHUNK_SIZE = 65536
+    FLUSH_DELAY = 0.1
+    RECONNECT_DELAY = 0.5
+    MAX_RECONNECT_DELAY = 30
+
+    def __init__(self, kernel, interval=None):
+        self.kernel = kernel
+        self.interval = kernel.timeout if interval is None else interval
+        self._logger = kernel._logger
+        self._loop = None
+        self._done = None
+        self._tasks = []
+        self._factories = []
+        self._decoders = {}
+        self._flush_handle = None
+        self._alive = True
+        self._reconnecting = False
+        self._interrupt = None
+        self.pump = OutputPump(self._logger)
+
+    def add_task(self, factory):
+        """Register a coroutine function to run as an independent task while supervising
+
+        Arguments:
+            factory {callable} -- Coroutine function without arguments
+        """
+        self._factories.append(factory)
+
+    def run(self):
+        """Supervise until the SSH session of the kernel ended
+        """
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            loop.run_until_complete(self._main())
+        finally:
+            loop.close()
+
+    def stop(self):
+        """Stop supervising
+        """
+        if self._done is not None:
+            self._done.set()
+
+    async def _main(self):
+        self._loop = asyncio.get_event_loop()
+        self._done = asyncio.Event()
+
+        connection = self.kernel._connection
+        self._watch(connection, self._on_session_eof)
+        if self.kernel._tunnel is not None:
+            self._watch(self.kernel._tunnel, self._on_tunnel_eof)
+
+        self._loop.add_signal_handler(signal.SIGINT, self._on_interrupt)
+        if self.kernel.detach:
+            # the detached remote kernel would survive the launcher
+            self._loop.add_signal_handler(signal.SIGTERM, self._on_terminate)
+
+        self._tasks = [asyncio.ensure_future(self._liveness())]
+        if self.kernel.heartbeat is not None:
+            heartbeat = self.kernel.heartbeat.run(
+                self.kernel.status.set_heartbeat_rtt, self._on_heartbeat
+            )
+            self._tasks.append(asyncio.ensure_future(heartbeat))
+        self._tasks += [asyncio.ensure_future(factory()) for factory in self._factories]
+
+        await self._done.wait()
+
+        self._loop.remove_signal_handler(signal.SIGINT)
+        if self.kernel.detach:
+            self._loop.remove_signal_handler(signal.SIGTERM)
+        for child in (self.kernel._connection, self.kernel._tunnel):
+            if child is not None and child.child_fd in self._decoders:
+                self._loop.remove_reader(child.child_fd)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._flush()
+
+    def _watch(self, child, on_eof):
+        fd = child.child_fd
+        self._decoders[fd] = codecs.getincrementaldecoder("utf-8")("replace")
+        # output pexpect already consumed while waiting for the bootstrap line
+        if child.buffer:
+            self._log_output(fd, child.buffer, final=False)
+        self._loop.add_reader(fd, self._on_readable, fd, on_eof)
+
+    def _on_readable(self, fd, on_eof):
+        # the pty is read directly, so pexpect's logfile_read does not see this output
+        try:
+            data = os.read(fd, Supervisor.CHUNK_SIZE)
+        except OSError:
+            # Linux signals EOF on a pty master with EIO
+            data = b""
+
+        if data:
+            self.kernel.console.write(data)
+            self._log_output(fd, self._decoders[fd].decode(data), final=False)
+        else:
+            self._loop.remove_reader(fd)
+            self._log_output(fd, self._decoders[fd].decode(b"", final=True), final=True)
+            del self._decoders[fd]
+            on_eof()
+
+    def _log_output(self, fd, text, final):
+        self.pump.feed(fd, text, final)
+        if final:
+            self._flush()
+        elif self._flush_handle is None:
+            # coalesce everything read until then into one log record
+            self._flush_handle = self._loop.call_later(Supervisor.FLUSH_DELAY, self._flush)
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        self.pump.flush()
+
+    def _on_session_eof(self):
+        if self.kernel.detach and self.kernel.session_lost():
+            self._logger.warning("The ssh session was lost, reconnecting to the detached kernel")
+            self.kernel.status.set_unreachable(self.kernel.kernel_pid, self.kernel.sudo)
+            self._reconnecting = True
+            self._tasks.append(asyncio.ensure_future(self._reconnect()))
+            return
+        # The program has exited
+        self._logger.info("The program has exited.")
+        self.kernel.status.set_down(self.kernel.kernel_pid, self.kernel.sudo)
+        self.stop()
+
+    def _on_tunnel_eof(self):
+        self._logger.warning("The ssh tunnel session has exited.")
+        self.kernel.status.set_unreachable(self.kernel.kernel_pid, self.kernel.sudo)
+
+    def _on_interrupt(self):
+        # waiting for the interrupt_reply or the kill command must not stall the output
+        if self._interrupt is None or self._interrupt.done():
+            self._interrupt = self._loop.run_in_executor(None, self.kernel.interrupt_kernel)
+
+    def _on_terminate(self):
+        self._logger.warning("Terminating, shutting down the detached remote kernel")
+        self.kernel.signal_remote_kernel(signal.SIGTERM)
+        self.kernel.status.set_down(self.kernel.kernel_pid, self.kernel.sudo)
+        self.stop()
+
+    async def _reconnect(self):
+        """Re-establish session and tunnels of a detached kernel with exponential backoff
+        """
+        start = time.monotonic()
+        delay = Supervisor.RECONNECT_DELAY
+        while time.monotonic() - start < self.kernel.reconnect_timeout:
+            try:
+                attached = await self._loop.run_in_executor(None, self.kernel.reattach)
+            except Exception as ex:
+                self._logger.warning("Reconnect failed (%s), retrying in %.1fs" % (ex, delay))
+                await asyncio.sleep(delay)
+                delay = min(2 * delay, Supervisor.MAX_RECONNECT_DELAY)
+                continue
+
+            self._reconnecting = False
+            if attached:
+                self._logger.info("Reconnected after %.1fs" % (time.monotonic() - start))
+                self._watch(self.kernel._connection, self._on_session_eof)
+                self.kernel.status.increment_restarts()
+                self.kernel.status.set_running(self.kernel.kernel_pid, self.kernel.sudo)
+                self._alive = True
+            else:
+                self._logger.info("The detached remote kernel has exited.")
+                self.kernel.status.set_down(self.kernel.kernel_pid, self.kernel.sudo)
+                self.stop()
+            return
+
+        self._logger.error("Giving up reconnecting after %ds" % self.kernel.reconnect_timeout)
+        self.kernel.status.set_down(self.kernel.kernel_pid, self.kernel.sudo)
+        self.stop()
+
+    def _set_alive(self, alive):
+        if alive != self._alive:
+            if alive:
+                self.kernel.status.set_running(self.kernel.kernel_pid, self.kernel.sudo)
+            else:
+                self.kernel.status.set_unreachable(self.kernel.kernel_pid, self.kernel.sudo)
+            self._alive = alive
+
+    def _on_heartbeat(self, responsive):
+        # record the transition right away instead of at the next liveness check
+        if not self._reconnecting and self.kernel.culled is None:
+            self._set_alive(self.kernel.check_alive())
+
+    async def _liveness(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            if self._reconnecting:
+                continue
+            alive = self.kernel.check_alive()
+            self.kernel.check_idle()
+            self._set_alive(alive)
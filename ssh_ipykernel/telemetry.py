@@ -0,0 +1,117 @@
+import asyncio
+import time
+
+from ssh_ipykernel.status import TelemetrySample
+from ssh_ipykernel.utils import ssh_async
+
+# Shell only (no remote python start): /proc/<pid>/stat of the kernel and all its descendants,
+# then page size and clock ticks per second. No tabs, no multiline, quote { and } !
+TELEMETRY_SCRIPT = (
+    "all={pid}; c={pid}; "
+    'while [ -n "$c" ]; do c=$(pgrep -d, -P "$c"); [ -n "$c" ] && all="$all,$c"; done; '
+    'for p in $(echo "$all" | tr , " "); do '
+    'sed "s/^/SSH_IPYKERNEL_STAT /" /proc/$p/stat 2>/dev/null; echo; done; '
+    'echo "SSH_IPYKERNEL_CONF $(getconf PAGESIZE) $(getconf CLK_TCK)"'
+)
+
+
+def parse_telemetry(output):
+    """Parse the output of TELEMETRY_SCRIPT
+
+    Arguments:
+        output {str} -- output of TELEMETRY_SCRIPT
+
+    Returns:
+        tuple -- (rss bytes, cpu seconds, threads, processes), None if the kernel process is gone
+    """
+    stats = []
+    page_size, ticks = 4096, 100
+    for line in output.splitlines():
+        if line.startswith("SSH_IPYKERNEL_STAT "):
+            # the command name in parentheses may contain spaces
+            try:
+                fields = line[line.rindex(")") + 2 :].split()
+                stats.append((int(fields[21]), int(fields[11]) + int(fields[12]), int(fields[17])))
+            except (IndexError, ValueError):
+                continue
+        elif line.startswith("SSH_IPYKERNEL_CONF "):
+            try:
+                page_size, ticks = [int(v) for v in line.split()[1:3]]
+            except ValueError:
+                pass
+    if not stats:
+        return None
+    rss = sum(s[0] for s in stats) * page_size
+    cpu = sum(s[1] for s in stats) / ticks
+    return rss, cpu, sum(s[2] for s in stats), len(stats)
+
+
+class TelemetrySampler:
+    """Sample memory, cpu and threads of a remote kernel and its child processes
+
+    One ssh command per sample, a full ssh handshake each time unless the kernel uses a master
+    connection (multiplexing). cpu is the utilization in percent of one core since the previous
+    sample.
+
+    Arguments:
+        host {str} -- remote host
+        logger {logging.Logger} -- Logger to use
+
+    Keyword Arguments:
+        interval {int} -- Seconds between samples (default: {60})
+        timeout {int} -- Timeout of the ssh command in seconds (default: {10})
+        execute {callable} -- Coroutine function (command, timeout) running a remote command,
+                              e.g. with the ssh options of the session (default: {ssh_async})
+    """
+
+    def __init__(self, host, logger, interval=60, timeout=10, execute=None):
+        self.host = host
+        self._execute = execute
+        self.interval = interval
+        self.timeout = timeout
+        self._logger = logger
+        self._previous = None
+
+    async def sample(self, pid):
+        """Take one sample
+
+        Arguments:
+            pid {int} -- remote kernel pid
+
+        Returns:
+            TelemetrySample -- sample, None if the kernel could not be sampled
+        """
+        command = TELEMETRY_SCRIPT.format(pid=pid)
+        if self._execute is None:
+            result = await ssh_async(self.host, command, self.timeout)
+        else:
+            result = await self._execute(command, self.timeout)
+        now = time.time()
+        parsed = None if result["code"] != 0 else parse_telemetry(result["data"])
+        if parsed is None:
+            self._logger.debug("Cannot sample remote kernel %d: %s" % (pid, result["data"]))
+            return None
+
+        rss, cpu_seconds, threads, processes = parsed
+        cpu = 0.0
+        if self._previous is not None and self._previous[0] == pid and now > self._previous[1]:
+            # children that exited take their cpu time with them
+            used = max(0.0, cpu_seconds - self._previous[2])
+            cpu = 100.0 * used / (now - self._previous[1])
+        self._previous = (pid, now, cpu_seconds)
+        return TelemetrySample(now, rss, cpu, threads, processes)
+
+    async def run(self, get_pid, store):
+        """Sample every interval seconds until cancelled
+
+        Arguments:
+            get_pid {callable} -- returns the remote kernel pid, 0 to skip a sample
+            store {callable} -- called with each TelemetrySample
+        """
+        while True:
+            pid = get_pid()
+            if pid > 0:
+                sample = await self.sample(pid)
+                if sample is not None:
+                    store(sample)
+            await asyncio.sleep(self.interval)
@@ -0,0 +1,81 @@
+import json
+import time
+
+
+class PhaseTimer:
+    """Monotonic timestamps of the startup phases of a remote kernel
+
+    Offsets are measured in seconds relative to the creation of the timer, the wall clock
+    time of the creation is kept to relate the offsets to log files.
+
+    connect ends with the first completed ssh round trip (the master connection with
+    multiplexing, else the first remote command or session output, handshake included),
+    tunnel_up with the first heartbeat or reply that went through the forwarded ports.
+    """
+
+    CONNECT = "connect"
+    CONNECTION_INFO = "connection_info"
+    TUNNEL_UP = "tunnel_up"
+    FIRST_HEARTBEAT = "first_heartbeat"
+    PID_KNOWN = "pid_known"
+    CUSTOMIZED = "customized"
+
+    PHASES = [CONNECT, CONNECTION_INFO, TUNNEL_UP, FIRST_HEARTBEAT, PID_KNOWN, CUSTOMIZED]
+
+    def __init__(self):
+        self.started = time.time()
+        self._start = time.monotonic()
+        self.marks = {}
+
+    def mark(self, phase):
+        """Record the end of a phase
+
+        Arguments:
+            phase {str} -- One of PhaseTimer.PHASES
+
+        Returns:
+            float -- Offset in seconds since the timer was created
+        """
+        self.marks[phase] = time.monotonic() - self._start
+        return self.marks[phase]
+
+    def durations(self):
+        """Get the duration of each recorded phase
+
+        Returns:
+            dict -- phase => seconds since the end of the previous recorded phase, in the order
+                    the phases ended (e.g. with ipc the connection info needs no connection)
+        """
+        result = {}
+        last = 0.0
+        recorded = [phase for phase in PhaseTimer.PHASES if phase in self.marks]
+        for phase in sorted(recorded, key=lambda phase: self.marks[phase]):
+            result[phase] = self.marks[phase] - last
+            last = self.marks[phase]
+        return result
+
+    def as_dict(self):
+        """Get all timings as a json serializable dict
+
+        Returns:
+            dict -- started (wall clock), offsets, durations and total
+        """
+        return {
+            "started": self.started,
+            "offsets": {p: self.marks[p] for p in PhaseTimer.PHASES if p in self.marks},
+            "durations": self.durations(),
+            "total": max(self.marks.values()) if self.marks else 0.0,
+        }
+
+    def format(self):
+        """Format all durations as one structured (logfmt) line
+
+        Returns:
+            str -- e.g. "total=1.234 connect=0.512 connection_info=0.722"
+        """
+        items = ["total=%.3f" % self.as_dict()["total"]]
+        items += ["%s=%.3f" % (phase, d) for phase, d in self.durations().items()]
+        return " ".join(items)
+
+    def to_json(self):
+        return json.dumps(self.as_dict())
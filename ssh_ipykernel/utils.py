@@ -1,8 +1,11 @@
+import asyncio
+import getpass
+import hashlib
 import logging
 import os
 import platform
 import subprocess
-from tornado.log import LogFormatter
+import time
 
 
 if platform.system() == "Windows":
@@ -12,10 +15,15 @@ else:
     is_windows = False
     SSH = "ssh"
 
+# Allows to substitute the ssh binary, e.g. with benchmarks/fake_ssh.py
+SSH = os.environ.get("SSH_IPYKERNEL_SSH", SSH)
+
 
 def setup_logging(name):
     """Setup Logging
     """
+    from tornado.log import LogFormatter
+
     _log_fmt = (
         "%(color)s[%(levelname)1.1s %(asctime)s.%(msecs).03d " "%(name)s]%(end_color)s %(message)s"
     )
@@ -32,23 +40,116 @@ def setup_logging(name):
     return logger
 
 
-logger = setup_logging("ssh_ipykernel:utils")
+_logger = None
+
+
+def _get_logger():
+    # created on first use, importing the launcher must not import tornado
+    global _logger
+    if _logger is None:
+        _logger = setup_logging("ssh_ipykernel:utils")
+    return _logger
+
+
+def control_path(host, status_folder="~/.ssh_ipykernel"):
+    """Get the path of the SSH ControlMaster socket for host and the local user
+
+    The socket name is a short hash to stay below the unix socket path limit.
+
+    Arguments:
+        host {str} -- remote host
+
+    Keyword Arguments:
+        status_folder {str} -- Folder where to create the socket (default: {"~/.ssh_ipykernel"})
+
+    Returns:
+        str -- path of the control socket
+    """
+    h = hashlib.sha256()
+    h.update(("%s@%s" % (getpass.getuser(), host)).encode())
+    return os.path.join(os.path.expanduser(status_folder), "cm-%s" % h.hexdigest()[:16])
+
+
+def multiplex_args(host):
+    """Get SSH options to reuse a running master connection to host
+
+    Arguments:
+        host {str} -- remote host
+
+    Returns:
+        list -- SSH options, empty if no master socket exists (or on Windows)
+    """
+    if is_windows:
+        return []
+    path = control_path(host)
+    if not os.path.exists(path):
+        return []
+    # With ControlMaster=no ssh falls back to a direct connection if the master is gone
+    return ["-o", "ControlMaster=no", "-o", "ControlPath=%s" % path]
 
 
 def execute(cmd):
+    start = time.monotonic()
     try:
-        logger.debug("interrupt cmd = %s" % cmd)
+        _get_logger().debug("interrupt cmd = %s" % cmd)
         result = subprocess.check_output(cmd)
         result = {"code": 0, "data": result.decode("utf-8")}
     except subprocess.CalledProcessError as e:
         result = {"code": e.returncode, "data": e.args}
 
-    logger.debug("result=%s", str(result))
+    _get_logger().debug("result=%s (%.3fs)", str(result), time.monotonic() - start)
     return result
 
 
 def ssh(host, cmd):
-    return execute([SSH, host, cmd])
+    return execute([SSH] + multiplex_args(host) + [host, cmd])
+
+
+async def execute_async(cmd, timeout=10):
+    """Execute a command without blocking the event loop
+
+    Arguments:
+        cmd {list} -- command and arguments
+
+    Keyword Arguments:
+        timeout {int} -- seconds after which the command gets killed (default: {10})
+
+    Returns:
+        dict -- {"code": return code, "data": stdout or error}
+    """
+    start = time.monotonic()
+    _get_logger().debug("async cmd = %s" % cmd)
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+        )
+    except OSError as ex:
+        # e.g. no ssh executable at SSH_IPYKERNEL_SSH
+        result = {"code": -1, "data": str(ex)}
+        _get_logger().debug("result=%s (%.3fs)", str(result), time.monotonic() - start)
+        return result
+
+    try:
+        stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout)
+        if proc.returncode == 0:
+            result = {"code": 0, "data": stdout.decode("utf-8")}
+        else:
+            result = {"code": proc.returncode, "data": stderr.decode("utf-8", "replace")}
+    except asyncio.TimeoutError:
+        try:
+            proc.kill()
+        except ProcessLookupError:
+            # exited right after the timeout
+            pass
+        await proc.wait()
+        result = {"code": -1, "data": "Timeout after %ds" % timeout}
+
+    _get_logger().debug("result=%s (%.3fs)", str(result), time.monotonic() - start)
+    return result
+
+
+async def ssh_async(host, cmd, timeout=10):
+    return await execute_async([SSH] + multiplex_args(host) + [host, cmd], timeout)
 
 
 def decode_utf8(s):
@@ -0,0 +1,100 @@
+import logging
+import time
+
+import pytest
+
+from ssh_ipykernel.console import Console
+
+logger = logging.getLogger("test_console")
+CAPACITY = 16
+
+
+@pytest.fixture
+def folder(tmp_path):
+    return str(tmp_path)
+
+
+def launcher(folder, capacity=CAPACITY):
+    return Console("abc", logger, status_folder=folder, capacity=capacity, owner=True)
+
+
+def reader(folder):
+    return Console("abc", logger, status_folder=folder)
+
+
+def test_no_console_file(folder):
+    assert reader(folder).read() is None
+
+
+def test_read_everything(folder):
+    owner = launcher(folder)
+    owner.write(b"hello ")
+    owner.write("wörld")
+    assert reader(folder).read() == ("hello wörld".encode("utf-8"), 12, 0)
+
+
+def test_incremental_reads(folder):
+    owner = launcher(folder)
+    console = reader(folder)
+    owner.write(b"abc")
+    data, offset, lost = console.read()
+    assert (data, offset, lost) == (b"abc", 3, 0)
+    assert console.read(offset) == (b"", 3, 0)
+    owner.write(b"def")
+    assert console.read(offset) == (b"def", 6, 0)
+    assert console.read(1, limit=2) == (b"bc", 3, 0)
+
+
+def test_wraparound(folder):
+    owner = launcher(folder)
+    console = reader(folder)
+    owner.write(b"0123456789")
+    owner.write(b"abcdefghij")
+    # 20 bytes written, the first 4 were overwritten
+    assert console.read() == (b"456789abcdefghij", 20, 4)
+    assert console.read(12) == (b"cdefghij", 20, 0)
+    assert console.read(6, limit=6) == (b"6789ab", 12, 0)
+
+
+def test_write_larger_than_capacity(folder):
+    owner = launcher(folder)
+    owner.write(b"x" * 10)
+    owner.write(bytes(range(65, 65 + 20)))
+    assert reader(folder).read(8) == (bytes(range(69, 85)), 30, 6)
+
+
+def test_offset_beyond_end_starts_over(folder):
+    owner = launcher(folder)
+    owner.write(b"abc")
+    assert reader(folder).read(100) == (b"abc", 3, 0)
+
+
+def test_restart_keeps_output(folder):
+    launcher(folder).write(b"before")
+    launcher(folder).write(b"after")
+    data, offset, _ = reader(folder).read()
+    assert data.endswith(b"after")
+    assert offset > len(b"beforeafter")
+
+
+def test_locked_buffer_of_dead_launcher(folder):
+    owner = launcher(folder)
+    owner.write(b"abc")
+    # killed between the two counter increments of a write
+    seq = Console.SEQ.unpack_from(owner.buffer, Console.SEQ_OFFSET)[0]
+    Console.SEQ.pack_into(owner.buffer, Console.SEQ_OFFSET, seq + 1)
+
+    console = reader(folder)
+    start = time.monotonic()
+    assert console.read(1) == (b"", 1, 0)
+    assert time.monotonic() - start < 1
+
+    owner.write(b"def")
+    assert console.read(1) == (b"bcdef", 6, 0)
+
+
+def test_remove(folder):
+    owner = launcher(folder)
+    owner.write(b"abc")
+    owner.remove()
+    assert reader(folder).read() is None
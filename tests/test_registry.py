@@ -0,0 +1,143 @@
+import os
+import struct
+import subprocess
+import sys
+
+import pytest
+
+from ssh_ipykernel.registry import Registry, pid_alive
+
+pytestmark = pytest.mark.skipif(sys.platform == "win32", reason="the registry needs flock")
+
+SLOTS = 8
+TEMPLATE = b"\x00" * 16
+
+
+def key(home, n=0):
+    """A 32 byte key whose probe sequence starts at slot home"""
+    return struct.pack("<Q", home + n * SLOTS) + bytes([n]) * 24
+
+
+def dead_pid():
+    proc = subprocess.Popen([sys.executable, "-c", "pass"])
+    proc.wait()
+    return proc.pid
+
+
+def states(registry):
+    return [registry._slot(index)[0] for index in range(registry.slots)]
+
+
+@pytest.fixture
+def registry(tmp_path):
+    return Registry(TEMPLATE, status_folder=str(tmp_path), slots=SLOTS)
+
+
+def test_allocate_and_lookup(registry):
+    index = registry.allocate(key(3))
+    assert index == 3
+    assert registry.lookup(key(3)) == 3
+    assert registry.holds(3, key(3))
+    assert registry.allocate(key(3)) == 3
+    assert registry.lookup(key(4)) is None
+
+
+def test_collisions_probe_linearly(registry):
+    assert [registry.allocate(key(6, n)) for n in range(4)] == [6, 7, 0, 1]
+    assert [registry.lookup(key(6, n)) for n in range(4)] == [6, 7, 0, 1]
+    assert registry.lookup(key(6, 4)) is None
+
+
+def test_free_keeps_later_keys_reachable(registry):
+    for n in range(3):
+        registry.allocate(key(0, n))
+    registry.free(1)
+    assert states(registry)[:3] == [Registry.USED, Registry.FREED, Registry.USED]
+    assert registry.lookup(key(0, 1)) is None
+    assert registry.lookup(key(0, 2)) == 2
+    assert not registry.holds(1, key(0, 1))
+
+
+def test_allocate_reuses_tombstone(registry):
+    for n in range(3):
+        registry.allocate(key(0, n))
+    registry.free(1)
+    assert registry.allocate(key(0, 3)) == 1
+    assert registry.lookup(key(0, 2)) == 2
+    # an existing key is found past the tombstone instead of being allocated twice
+    registry.free(1)
+    assert registry.allocate(key(0, 2)) == 2
+
+
+def test_free_clears_unneeded_tombstones(registry):
+    for n in range(3):
+        registry.allocate(key(0, n))
+    registry.free(1)
+    registry.free(2)
+    assert states(registry)[:3] == [Registry.USED, Registry.EMPTY, Registry.EMPTY]
+    registry.free(0)
+    assert states(registry) == [Registry.EMPTY] * SLOTS
+
+
+def test_churn_does_not_fill_the_table_with_tombstones(registry):
+    live = {}
+    for n in range(200):
+        k = key(n % SLOTS, n % 5)
+        if k in live:
+            registry.free(live.pop(k))
+        elif len(live) < SLOTS - 1:
+            live[k] = registry.allocate(k)
+        for k, index in live.items():
+            assert registry.lookup(k) == index
+    for index in live.values():
+        registry.free(index)
+    assert states(registry) == [Registry.EMPTY] * SLOTS
+
+
+def test_full_table(registry):
+    for n in range(SLOTS):
+        assert registry.allocate(key(n)) is not None
+    assert registry.allocate(key(0, 1)) is None
+    assert registry.lookup(key(0, 1)) is None
+    registry.free(registry.lookup(key(5)))
+    assert registry.allocate(key(0, 1)) == 5
+
+
+def test_reap_dead_owners(registry):
+    pid = dead_pid()
+    assert not pid_alive(pid)
+    assert pid_alive(os.getpid())
+    registry.allocate(key(1), owner_pid=pid)
+    registry.allocate(key(1, 1), owner_pid=os.getpid())
+    registry.allocate(key(1, 2), owner_pid=pid)
+    assert registry.reap() == 2
+    assert [index for index, _, _, _ in registry.used()] == [2]
+    assert registry.lookup(key(1, 1)) == 2
+    assert registry.lookup(key(1, 2)) is None
+
+
+def test_full_table_reaps_dead_owners(registry):
+    pid = dead_pid()
+    for n in range(SLOTS):
+        registry.allocate(key(n), owner_pid=pid)
+    assert registry.allocate(key(0, 1)) == 0
+    assert len(registry.used()) == 1
+
+
+def test_allocate_resets_record(registry):
+    index = registry.allocate(key(2))
+    offset = registry.record_offset(index)
+    registry.mmap[offset : offset + 4] = b"\xff" * 4
+    registry.free(index)
+    index = registry.allocate(key(2, 1))
+    offset = registry.record_offset(index)
+    assert registry.mmap[offset : offset + len(TEMPLATE)] == TEMPLATE
+
+
+def test_reopen_existing_file(registry, tmp_path):
+    registry.allocate(key(4))
+    other = Registry(TEMPLATE, status_folder=str(tmp_path), slots=2 * SLOTS)
+    assert other.slots == SLOTS
+    assert other.lookup(key(4)) == 4
+    with pytest.raises(ValueError):
+        Registry(b"\x00" * 32, status_folder=str(tmp_path))
@@ -0,0 +1,133 @@
+import logging
+import os
+import time
+
+import pytest
+
+from ssh_ipykernel.status import Status, TelemetrySample
+
+CONNECTION_INFO = {
+    "shell_port": 1,
+    "iopub_port": 2,
+    "stdin_port": 3,
+    "control_port": 4,
+    "hb_port": 5,
+}
+logger = logging.getLogger("test_status")
+
+
+@pytest.fixture
+def folder(tmp_path):
+    return str(tmp_path)
+
+
+def launcher(folder):
+    return Status(CONNECTION_INFO, logger, status_folder=folder, host="remote", registry=False)
+
+
+def reader(folder):
+    return Status(CONNECTION_INFO, logger, status_folder=folder, registry=False)
+
+
+def test_round_trip(folder):
+    owner = launcher(folder)
+    owner.set_running(4711, True)
+    owner.set_heartbeat_rtt(0.25)
+    owner.increment_restarts()
+
+    record = reader(folder).read()
+    assert record.version == Status.VERSION
+    assert record.state == Status.RUNNING
+    assert record.pid == 4711
+    assert record.sudo == 1
+    assert record.restarts == 1
+    assert record.host_hash == Status.host_hash("remote")
+    assert record.owner_pid == os.getpid()
+    assert record.heartbeat_rtt == 0.25
+    assert record.changed >= record.started > 0
+
+
+def test_writes_keep_the_counter_even(folder):
+    owner = launcher(folder)
+    before = owner._read_seq()
+    owner.set_down()
+    assert owner._read_seq() == before + 2
+    assert owner._read_seq() % 2 == 0
+
+
+def test_state_helpers(folder):
+    owner = launcher(folder)
+    other = reader(folder)
+    assert other.is_starting()
+    owner.set_running(1, False)
+    assert other.is_running() and not other.is_starting()
+    assert other.get_pid() == 1 and not other.is_sudo()
+    owner.set_kernel_killed()
+    assert other.is_kernel_killed() and other.get_pid() == 1
+
+
+def test_telemetry_history_wraps(folder):
+    owner = launcher(folder)
+    count = Status.TELEMETRY_HISTORY + 3
+    for n in range(count):
+        owner.add_telemetry(TelemetrySample(float(n), n, 1.0, 2, 3))
+    samples = reader(folder).get_telemetry()
+    assert len(samples) == Status.TELEMETRY_HISTORY
+    assert [s.rss for s in samples] == list(range(3, count))
+
+
+def test_locked_record_of_dead_launcher(folder):
+    owner = launcher(folder)
+    owner.set_running(42, False)
+    owner.add_telemetry(TelemetrySample(1.0, 2, 3.0, 4, 5))
+    # killed between the two counter increments of a write
+    Status.SEQ.pack_into(owner.status, Status.SEQ_OFFSET, owner._read_seq() + 1)
+
+    other = reader(folder)
+    start = time.monotonic()
+    assert other.read() == Status._unknown_record()
+    assert other.get_telemetry() == []
+    assert time.monotonic() - start < 1
+
+    owner.set_running(43, False)
+    assert owner._read_seq() % 2 == 0
+    assert other.read().pid == 43
+
+
+def test_legacy_layout(folder):
+    status = reader(folder)
+    status.close()
+    with open(status.status_file, "wb") as fd:
+        fd.write(
+            Status.RUNNING.to_bytes(2, "little")
+            + (1234).to_bytes(8, "little")
+            + (1).to_bytes(2, "little")
+        )
+
+    legacy = reader(folder)
+    assert legacy.legacy
+    record = legacy.read()
+    assert record.version == 1
+    assert (record.state, record.pid, record.sudo) == (Status.RUNNING, 1234, 1)
+    assert record.owner_pid == 0 and record.heartbeat_rtt == 0.0
+    assert legacy.get_telemetry() == []
+
+    legacy.set_down(pid=99, sudo=False)
+    with open(legacy.status_file, "rb") as fd:
+        data = fd.read()
+    assert len(data) == Status.LEGACY_SIZE
+    assert int.from_bytes(data[:2], "little") == Status.DOWN
+    assert int.from_bytes(data[2:10], "little") == 99
+
+
+def test_reader_follows_restarted_launcher(folder, monkeypatch):
+    first = launcher(folder)
+    first.set_running(1, False)
+    other = reader(folder)
+    assert other.read().pid == 1
+
+    first.close()
+    second = launcher(folder)
+    second.set_running(2, False)
+    monkeypatch.setattr(Status, "REATTACH_INTERVAL", 0)
+    assert other.read().pid == 2